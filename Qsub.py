@@ -21,35 +21,90 @@
 import os
 import pwd
 import psutil
+import multiprocessing
 import resource
 import sys
+import traceback
 from time import strftime, localtime, time, gmtime
 
 sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)
 
+def job_range(job):
+	return str((100 * ((int(job)-1) / 100) + 1)) + "-" + str((100 * ((int(job)-1) / 100) + 100))
+
 def main(argv):
 
 	start_time = (localtime(), time())
 	env_vars = os.environ.copy()
-	local=False
 	user_name=pwd.getpwuid(os.getuid()).pw_name
 
 	if argv[1].split('(')[0] in ["RunSnv","RunSnvgroup","RunMeta","RunMerge","RunTools"] and 'SGE_TASK_ID' in env_vars:
+		db = None
+		job = None
 		if env_vars['SGE_TASK_ID'] != 'None':
-			with open(argv[2]) as f:
-				joblist = [line.rstrip() for line in f]
-			job = joblist[int(env_vars['SGE_TASK_ID'])-1]
+			from uga import Db
+			db = argv[2]
+			job = Db.get_run(db, env_vars['SGE_TASK_ID'])
+			# packed tasks are listed as task id and a comma separated list of jobs to run one after another
+			#   each job runs in its own process, so that the memory use recorded for it is its own rather than
+			#   the peak of all jobs run before it in the task
+			if '\t' in job:
+				task = job.split('\t')[0]
+				for j in job.split('\t')[1].split(','):
+					argv_j = [x.replace("UGA_TASK_ID",task).replace("UGA_TASK_RANGE",job_range(task)).replace("UGA_JOB_ID",j) for x in argv]
+					p = multiprocessing.Process(target=run_packed, args=(argv_j, env_vars, user_name, db, task, j))
+					p.start()
+					p.join()
+					if p.exitcode != 0:
+						Db.set_status(db, [j], 'failed')
+				return
 			argv[1] = argv[1].replace("UGA_JOB_ID",job)
 			argv[3] = argv[3].replace("UGA_JOB_ID",job)
-			argv[1] = argv[1].replace("UGA_JOB_RANGE",str((100 * ((int(job)-1) / 100) + 1)) + "-" + str((100 * ((int(job)-1) / 100) + 100)))
-			argv[3] = argv[3].replace("UGA_JOB_RANGE",str((100 * ((int(job)-1) / 100) + 1)) + "-" + str((100 * ((int(job)-1) / 100) + 100)))
+			argv[1] = argv[1].replace("UGA_JOB_RANGE",job_range(job))
+			argv[3] = argv[3].replace("UGA_JOB_RANGE",job_range(job))
 		try:
 			lf = open(argv[3],'w')
 		except(IOError, OSError):
+			if db is not None:
+				Db.set_status(db, [job], 'failed')
 			return
 		sys.stdout = lf
 		sys.stderr = lf
+		run(argv, env_vars, user_name, start_time, db, job)
+		return
+
+	# interactive runs are given the job database as well, so that job status is recorded as for qsub runs
+	if len(argv) > 2:
+		from uga import Db
+		job = Db.get_run(argv[2], 1)
+		if job is not None:
+			run(argv, env_vars, user_name, start_time, argv[2], job.split('\t')[-1].split(',')[0])
+			return
 
+	run(argv, env_vars, user_name, start_time)
+
+def run_packed(argv, env_vars, user_name, db, task, job):
+	# a failed job is left for resubmit without stopping the remaining jobs in the task
+	from uga import Db
+	try:
+		lf = open(argv[3],'w')
+	except(IOError, OSError):
+		Db.set_status(db, [job], 'failed')
+		return
+	sys.stdout = lf
+	sys.stderr = lf
+	print "packed task " + task + ", job " + job
+	try:
+		run(argv, env_vars, user_name, (localtime(), time()), db, job)
+	except Exception:
+		traceback.print_exc()
+		Db.set_status(db, [job], 'failed')
+	lf.close()
+
+def run(argv, env_vars, user_name, start_time, db = None, job = None):
+
+	local=False
+	env_vars = env_vars.copy()
 	if not 'REQNAME' in env_vars.keys():
 		local=True
 		env_vars['REQNAME'] = env_vars['HOSTNAME'] + '_' + strftime('%Y_%m_%d_%H_%M_%S', start_time[0]) if 'HOSTNAME' in env_vars.keys() else strftime('%Y_%m_%d_%H_%M_%S', start_time[0])
@@ -101,12 +156,17 @@ def main(argv):
 
 	print ""
 	print "command entered: " + argv[1]
+	if db is not None:
+		from uga import Db
+		Db.start(db, job, env_vars['HOSTNAME'] if 'HOSTNAME' in env_vars.keys() else None, start_time[1])
 	exec('r=' + argv[1])
+	end_time = (localtime(), time())
+	process = psutil.Process(os.getpid())
+	mem=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1000.0
+	mem_children=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1000.0
+	if db is not None:
+		Db.finish(db, job, 'complete' if r == 0 else 'failed', end_time[1], end_time[1] - start_time[1], mem, mem_children)
 	if r == 0:
-		end_time = (localtime(), time())
-		process = psutil.Process(os.getpid())
-		mem=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1000.0
-		mem_children=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1000.0
 		print 'finish time: ' + strftime("%Y-%m-%d %H:%M:%S", end_time[0])
 		print 'time elapsed: ' + strftime('%H:%M:%S', gmtime(end_time[1] - start_time[1]))
 		print 'max memory used by main process: ' + str('%.2f' % mem) + ' MB'
@@ -68,6 +68,19 @@ def snv_args(snv_parser):
 						action=AddString, 
 						type=int, 
 						help='number of cpus')
+	snv_parser.add_argument('--dynamic', 
+						nargs=0, 
+						action=AddTrue, 
+						help='distribute regions to cpus from a shared queue as each cpu becomes free instead of a fixed assignment (use with --cpus)')
+	snv_parser.add_argument('--bgzip-threads', 
+						action=AddString, 
+						type=int, 
+						help='number of threads used to compress each bgzip format out file (default: 1)')
+	snv_parser.add_argument('--bgzip-level', 
+						action=AddString, 
+						type=int, 
+						choices=range(0,10), 
+						help='compression level for bgzip format out files, from 0 (none) to 9 (best) (default: 6)')
 	snv_parser.add_argument('--fid', 
 						action=AddString, 
 						help='column name with family ID')
@@ -126,6 +139,10 @@ def snv_args(snv_parser):
 						action=AddString, 
 						type=int, 
 						help='value for number of markers calculated at a time (WARNING: this argument will affect RAM memory usage; default: 100)')
+	snv_parser.add_argument('--buffer-mem', 
+						action=AddString, 
+						type=int, 
+						help='target memory in MB for each buffer of markers, enabling automatic buffer sizing based on the number of samples and the time taken per buffer (--buffer sets the initial size)')
 	snv_parser.add_argument('--miss', 
 						action=AddString, 
 						type=float, 
@@ -161,6 +178,14 @@ def snv_args(snv_parser):
 	snv_parser.add_argument('--mb', 
 						action=AddString, 
 						help='region size in megabases to use for split analyses (default: 1)')
+	snv_parser.add_argument('--snvs', 
+						action=AddString, 
+						type=int, 
+						help='approximate number of variants per region to use for split analyses, regions are cut using variant counts from the tabix index (overrides --mb)')
+	snv_parser.add_argument('--pack', 
+						action=AddString, 
+						type=int, 
+						help='number of jobs to run one after another in each array task, storing output and logs for each task in a single directory (use with --split or --split-n)')
 	snv_parser.add_argument('--qsub', 
 						action=AddString, 
 						help='string indicating all qsub options to be added to the qsub command (triggers submission of all jobs to the cluster)')
@@ -221,6 +246,10 @@ def snv_args(snv_parser):
 	snv_parser.add_argument('--glm', 
 						action=AddString, 
 						help='glm test dependent variable')
+	snv_parser.add_argument('--glm-screen', 
+						action=AddString, 
+						type=float, 
+						help='p-value threshold for a two stage glm test, fitting the full glm only for variants with a score test p-value below the threshold (ie. 0.001)')
 	snv_parser.add_argument('--lm', 
 						action=AddString, 
 						help='lm test dependent variable')
@@ -249,6 +278,19 @@ def snvgroup_args(snvgroup_parser):
 						action=AddString, 
 						type=int, 
 						help='number of cpus')
+	snvgroup_parser.add_argument('--dynamic', 
+						nargs=0, 
+						action=AddTrue, 
+						help='distribute regions to cpus from a shared queue as each cpu becomes free instead of a fixed assignment (use with --cpus)')
+	snvgroup_parser.add_argument('--bgzip-threads', 
+						action=AddString, 
+						type=int, 
+						help='number of threads used to compress each bgzip format out file (default: 1)')
+	snvgroup_parser.add_argument('--bgzip-level', 
+						action=AddString, 
+						type=int, 
+						choices=range(0,10), 
+						help='compression level for bgzip format out files, from 0 (none) to 9 (best) (default: 6)')
 	snvgroup_parser.add_argument('--fid', 
 						action=AddString, 
 						help='column name with family ID')
@@ -336,6 +378,10 @@ def snvgroup_args(snvgroup_parser):
 						nargs=0, 
 						action=AddTrue, 
 						help='replace any existing output files')
+	snvgroup_parser.add_argument('--pack', 
+						action=AddString, 
+						type=int, 
+						help='number of jobs to run one after another in each array task, storing output and logs for each task in a single directory (use with --split or --split-n)')
 	snvgroup_parser.add_argument('--qsub', 
 						action=AddString, 
 						help='string indicating all qsub options to be added to the qsub command (triggers submission of all jobs to the cluster)')
@@ -444,13 +490,34 @@ def meta_args(meta_parser):
 						action=AddString, 
 						type=int, 
 						help='number of cpus')
+	meta_parser.add_argument('--dynamic', 
+						nargs=0, 
+						action=AddTrue, 
+						help='distribute regions to cpus from a shared queue as each cpu becomes free instead of a fixed assignment (use with --cpus)')
+	meta_parser.add_argument('--bgzip-threads', 
+						action=AddString, 
+						type=int, 
+						help='number of threads used to compress each bgzip format out file (default: 1)')
+	meta_parser.add_argument('--bgzip-level', 
+						action=AddString, 
+						type=int, 
+						choices=range(0,10), 
+						help='compression level for bgzip format out files, from 0 (none) to 9 (best) (default: 6)')
 	meta_parser.add_argument('--mb', 
 						action=AddString, 
 						help='region size in megabases to use for split analyses (default: 1)')
+	meta_parser.add_argument('--snvs', 
+						action=AddString, 
+						type=int, 
+						help='approximate number of variants per region to use for split analyses, regions are cut using variant counts from the tabix index (overrides --mb)')
 	meta_parser.add_argument('--buffer', 
 						action=AddString, 
 						type=int, 
 						help='value for number of markers calculated at a time (WARNING: this argument will affect RAM memory usage; default: 100)')
+	meta_parser.add_argument('--pack', 
+						action=AddString, 
+						type=int, 
+						help='number of jobs to run one after another in each array task, storing output and logs for each task in a single directory (use with --split or --split-n)')
 	meta_parser.add_argument('--qsub', 
 						action=AddString, 
 						help='string indicating all qsub options to be added to the qsub command (triggers submission of all jobs to the cluster)')
@@ -505,6 +572,15 @@ def compile_args(compile_parser):
 						nargs=0, 
 						action=AddTrue, 
 						help='replace any existing output files')
+	compile_parser.add_argument('--bgzip-threads', 
+						action=AddString, 
+						type=int, 
+						help='number of threads used to compress each bgzip format out file (default: 1)')
+	compile_parser.add_argument('--bgzip-level', 
+						action=AddString, 
+						type=int, 
+						choices=range(0,10), 
+						help='compression level for bgzip format out files, from 0 (none) to 9 (best) (default: 6)')
 	return compile_parser
 
 def resubmit_args(resubmit_parser):
@@ -656,6 +732,15 @@ def filter_args(filter_parser):
 						nargs=0, 
 						action=AddTrue, 
 						help='replace any existing output files')
+	filter_parser.add_argument('--bgzip-threads', 
+						action=AddString, 
+						type=int, 
+						help='number of threads used to compress each bgzip format out file (default: 1)')
+	filter_parser.add_argument('--bgzip-level', 
+						action=AddString, 
+						type=int, 
+						choices=range(0,10), 
+						help='compression level for bgzip format out files, from 0 (none) to 9 (best) (default: 6)')
 	filter_parser.add_argument('--qsub', 
 						action=AddString, 
 						help='string indicating all qsub options to be added to the qsub command (triggers submission of all jobs to the cluster)')
@@ -751,9 +836,26 @@ def merge_args(merge_parser):
 						action=AddString, 
 						type=int, 
 						help='number of cpus')
+	merge_parser.add_argument('--dynamic', 
+						nargs=0, 
+						action=AddTrue, 
+						help='distribute regions to cpus from a shared queue as each cpu becomes free instead of a fixed assignment (use with --cpus)')
+	merge_parser.add_argument('--bgzip-threads', 
+						action=AddString, 
+						type=int, 
+						help='number of threads used to compress each bgzip format out file (default: 1)')
+	merge_parser.add_argument('--bgzip-level', 
+						action=AddString, 
+						type=int, 
+						choices=range(0,10), 
+						help='compression level for bgzip format out files, from 0 (none) to 9 (best) (default: 6)')
 	merge_parser.add_argument('--mb', 
 						action=AddString, 
 						help='region size in megabases to use for split analyses (default: 1)')
+	merge_parser.add_argument('--snvs', 
+						action=AddString, 
+						type=int, 
+						help='approximate number of variants per region to use for split analyses, regions are cut using variant counts from the tabix index (overrides --mb)')
 	merge_parser.add_argument('--buffer', 
 						action=AddString, 
 						type=int, 
@@ -762,6 +864,10 @@ def merge_args(merge_parser):
 						nargs=0, 
 						action=AddTrue, 
 						help='replace any existing output files')
+	merge_parser.add_argument('--pack', 
+						action=AddString, 
+						type=int, 
+						help='number of jobs to run one after another in each array task, storing output and logs for each task in a single directory (use with --split or --split-n)')
 	merge_parser.add_argument('--qsub', 
 						action=AddString, 
 						help='string indicating all qsub options to be added to the qsub command (triggers submission of all jobs to the cluster)')
@@ -821,6 +927,19 @@ def tools_args(tools_parser):
 						action=AddString, 
 						type=int, 
 						help='number of cpus')
+	tools_parser.add_argument('--dynamic', 
+						nargs=0, 
+						action=AddTrue, 
+						help='distribute regions to cpus from a shared queue as each cpu becomes free instead of a fixed assignment (use with --cpus)')
+	tools_parser.add_argument('--bgzip-threads', 
+						action=AddString, 
+						type=int, 
+						help='number of threads used to compress each bgzip format out file (default: 1)')
+	tools_parser.add_argument('--bgzip-level', 
+						action=AddString, 
+						type=int, 
+						choices=range(0,10), 
+						help='compression level for bgzip format out files, from 0 (none) to 9 (best) (default: 6)')
 	tools_parser.add_argument('--buffer', 
 						action=AddString, 
 						type=int, 
@@ -832,6 +951,14 @@ def tools_args(tools_parser):
 	tools_parser.add_argument('--mb', 
 						action=AddString, 
 						help='region size in megabases to use for split analyses (default: 1)')
+	tools_parser.add_argument('--snvs', 
+						action=AddString, 
+						type=int, 
+						help='approximate number of variants per region to use for split analyses, regions are cut using variant counts from the tabix index (overrides --mb)')
+	tools_parser.add_argument('--pack', 
+						action=AddString, 
+						type=int, 
+						help='number of jobs to run one after another in each array task, storing output and logs for each task in a single directory (use with --split or --split-n)')
 	tools_parser.add_argument('--qsub', 
 						action=AddString, 
 						help='string indicating all qsub options to be added to the qsub command (triggers submission of all jobs to the cluster)')
@@ -0,0 +1,147 @@
+## Copyright (c) 2015 Ryan Koesterer GNU General Public License v3
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import zlib
+import struct
+import bisect
+import numpy as np
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+# bgzf blocks hold at most 65280 bytes of uncompressed data (as in htslib), which guarantees
+# that the compressed block fits in the 16 bit block size field at any compression level
+BLOCK_SIZE = 65280
+HEADER = '\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+EOF = HEADER + '\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+def compress_block(data, level = 6):
+	c = zlib.compressobj(level, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL, 0)
+	compressed = c.compress(data) + c.flush()
+	return HEADER + struct.pack('<H', len(compressed) + 25) + compressed + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+
+class BgzfWriter(object):
+	# drop in replacement for Bio.bgzf.BgzfWriter compressing blocks on a pool of threads
+	#   zlib releases the GIL while compressing, so blocks are compressed in parallel and written in order
+	#   the compressed start of every block is recorded so that uncompressed offsets can be translated
+	#   to virtual offsets (see virtual_offset) for indexing
+	def __init__(self, filename = None, mode = 'wb', fileobj = None, threads = 1, level = 6):
+		self.handle = fileobj if fileobj is not None else open(filename, mode)
+		self.threads = max(int(threads), 1)
+		self.level = int(level)
+		self.pool = ThreadPool(self.threads) if self.threads > 1 else None
+		self.pending = deque()
+		self.buffer = []
+		self.buffer_size = 0
+		self.uoffset = 0
+		self.coffset = self.handle.tell()
+		self.uwritten = 0
+		self.ustarts = []
+		self.cstarts = []
+
+	def submit(self, block):
+		ustart = self.uoffset - self.buffer_size
+		if self.pool is None:
+			self.write_block(ustart, len(block), compress_block(block, self.level))
+		else:
+			self.pending.append((ustart, len(block), self.pool.apply_async(compress_block, (block, self.level))))
+			while len(self.pending) > 4 * self.threads:
+				self.drain(1)
+
+	def drain(self, n = None):
+		while len(self.pending) > 0 and (n is None or n > 0):
+			ustart, usize, result = self.pending.popleft()
+			self.write_block(ustart, usize, result.get())
+			n = n - 1 if n is not None else None
+
+	def write_block(self, ustart, usize, compressed):
+		self.ustarts.append(ustart)
+		self.cstarts.append(self.coffset)
+		self.handle.write(compressed)
+		self.coffset += len(compressed)
+		self.uwritten = ustart + usize
+
+	def write(self, data):
+		if len(data) == 0:
+			return
+		self.buffer.append(data)
+		self.buffer_size += len(data)
+		self.uoffset += len(data)
+		if self.buffer_size >= BLOCK_SIZE:
+			data = ''.join(self.buffer)
+			i = 0
+			while len(data) - i >= BLOCK_SIZE:
+				self.buffer_size = len(data) - i
+				self.submit(data[i:i + BLOCK_SIZE])
+				i += BLOCK_SIZE
+			self.buffer = [data[i:]] if i < len(data) else []
+			self.buffer_size = len(data) - i
+
+	def flush(self):
+		# ends the current block, so that all data written so far is complete on disk
+		if self.buffer_size > 0:
+			data = ''.join(self.buffer)
+			self.submit(data)
+			self.buffer = []
+			self.buffer_size = 0
+		self.drain()
+		self.handle.flush()
+
+	def offset(self):
+		# uncompressed offset of the next byte to be written
+		return self.uoffset
+
+	def written(self):
+		# uncompressed offset up to which data has been compressed and written to file
+		return self.uwritten
+
+	def virtual_offset(self, u):
+		# virtual offset of uncompressed offset u, available once the block holding u has been written
+		#   offsets at the end of the data written so far point to the start of the next block
+		if u < self.uwritten:
+			i = bisect.bisect_right(self.ustarts, u) - 1
+			return (self.cstarts[i] << 16) | (u - self.ustarts[i])
+		if u == self.uwritten:
+			return self.coffset << 16
+		return None
+
+	def virtual_offsets(self, u):
+		# virtual_offset for an array of uncompressed offsets, all of which must have been written
+		u = np.asarray(u, dtype=np.int64)
+		if len(u) == 0:
+			return u
+		i0 = max(bisect.bisect_right(self.ustarts, int(u.min())) - 1, 0)
+		ustarts = np.array(self.ustarts[i0:] + [self.uwritten], dtype=np.int64)
+		cstarts = np.array(self.cstarts[i0:] + [self.coffset], dtype=np.int64)
+		i = np.searchsorted(ustarts, u, side='right') - 1
+		return (cstarts[i] << 16) | (u - ustarts[i])
+
+	def tell(self):
+		self.drain()
+		return (self.coffset << 16) | self.buffer_size
+
+	def close(self):
+		self.flush()
+		self.handle.write(EOF)
+		self.handle.flush()
+		self.handle.close()
+		if self.pool is not None:
+			self.pool.close()
+			self.pool.join()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.close()
@@ -0,0 +1,130 @@
+## Copyright (c) 2015 Ryan Koesterer GNU General Public License v3
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import pickle
+import os
+import pandas as pd
+import Process
+import Tabix
+
+# the job database <out>/<out>.db holds everything needed to run, verify, resubmit and compile a project
+#   args:    pickled parsed arguments and configuration
+#   regions: region list with job and cpu assignment, in processing order
+#   files:   expected output files for each job and the compiled file they belong to
+#   jobs:    status, timings, memory use and output row count for each job
+#   run:     job run list read by the qsub wrapper, one entry per array task
+
+# array tasks update the database concurrently, so writers wait on the lock rather than fail
+TIMEOUT = 600
+
+def connect(db):
+	try:
+		return sqlite3.connect(db, timeout=TIMEOUT)
+	except sqlite3.Error:
+		raise Process.Error("unable to open job database " + db)
+
+def create(db, args, cfg, jobs_df, files = []):
+	if os.path.exists(db):
+		os.remove(db)
+	con = connect(db)
+	with con:
+		con.execute("create table args (data blob)")
+		con.execute("insert into args values (?)", (sqlite3.Binary(pickle.dumps([args, cfg], protocol=2)),))
+		jobs_df.to_sql('regions', con, index=True, index_label='idx')
+		con.execute("create index regions_job on regions (job)")
+		con.execute("create table files (job integer, out text, file text)")
+		con.executemany("insert into files values (?,?,?)", files)
+		con.execute("create index files_job on files (job)")
+		con.execute("create table jobs (job integer primary key, task integer, status text, host text, started real, finished real, elapsed real, maxmem real, maxmem_sub real, rows integer)")
+		tasks = jobs_df[['job','task']].drop_duplicates() if 'task' in jobs_df.columns else jobs_df[['job','job']].drop_duplicates()
+		con.executemany("insert into jobs (job, task, status) values (?,?,'pending')", [(int(x[0]), int(x[1])) for x in tasks.values])
+		con.execute("create table run (line integer primary key, entry text)")
+	con.close()
+
+def get_args(db):
+	con = connect(db)
+	data = con.execute("select data from args").fetchone()[0]
+	con.close()
+	return pickle.loads(str(data))
+
+def regions(db, job = None):
+	con = connect(db)
+	if job is None:
+		df = pd.read_sql_query("select * from regions order by idx", con)
+	else:
+		df = pd.read_sql_query("select * from regions where job = ? order by idx", con, params=(int(job),))
+	con.close()
+	return df.drop('idx', axis=1)
+
+def files(db):
+	con = connect(db)
+	df = pd.read_sql_query("select job, out, file from files order by rowid", con)
+	con.close()
+	return df
+
+def jobs(db):
+	con = connect(db)
+	df = pd.read_sql_query("select * from jobs order by job", con)
+	con.close()
+	return df
+
+def set_run(db, entries):
+	con = connect(db)
+	with con:
+		con.execute("delete from run")
+		con.executemany("insert into run values (?,?)", [(i + 1, entries[i]) for i in xrange(len(entries))])
+	con.close()
+
+def get_run(db, line):
+	con = connect(db)
+	entry = con.execute("select entry from run where line = ?", (int(line),)).fetchone()
+	con.close()
+	return entry[0] if entry is not None else None
+
+def set_status(db, joblist, status):
+	con = connect(db)
+	with con:
+		con.executemany("update jobs set status = ? where job = ?", [(status, int(j)) for j in joblist])
+	con.close()
+
+def start(db, job, host, started):
+	con = connect(db)
+	with con:
+		con.execute("update jobs set status = 'running', host = ?, started = ?, finished = null, elapsed = null, maxmem = null, maxmem_sub = null, rows = null where job = ?", (host, started, int(job)))
+	con.close()
+
+def count_rows(db, job):
+	# output row counts are taken from the mapped record counts in each output file index, if available
+	con = connect(db)
+	outputs = [x[0] for x in con.execute("select file from files where job = ?", (int(job),))]
+	con.close()
+	rows = 0
+	for f in outputs:
+		try:
+			idx = Tabix.Index(f)
+		except Process.Error:
+			return None
+		if None in idx.mapped.values():
+			return None
+		rows = rows + sum(idx.mapped.values())
+	return rows
+
+def finish(db, job, status, finished, elapsed, maxmem, maxmem_sub):
+	rows = count_rows(db, job) if status == 'complete' else None
+	con = connect(db)
+	with con:
+		con.execute("update jobs set status = ?, finished = ?, elapsed = ?, maxmem = ?, maxmem_sub = ?, rows = ? where job = ?", (status, finished, elapsed, maxmem, maxmem_sub, rows, int(job)))
+	con.close()
@@ -20,9 +20,228 @@ import pandas as pd
 import numpy as np
 import glob
 import os
-from Bio import bgzf
 import pysam
 import gzip
+import Bgzf
+import Tabix
+import Process
+import pickle
+import threading
+import Queue
+import Db
+import Definitions
+from time import strftime, gmtime
+from collections import OrderedDict
+
+class Accumulator(object):
+	# collects result frames (ie. one per buffer of variants or per region) and concatenates them once when
+	# the full table is needed, instead of copying all previous results with each DataFrame.append or merge
+	#   columns are kept in the order first seen, as with successive outer merges
+	def __init__(self):
+		self.frames = []
+		self.columns = []
+
+	def append(self, df):
+		self.columns.extend([x for x in df.columns if x not in self.columns])
+		self.frames.append(df)
+
+	def frame(self):
+		if len(self.frames) == 0:
+			return pd.DataFrame({})
+		if len(self.frames) > 1:
+			self.frames = [pd.concat(self.frames, ignore_index=True)[self.columns]]
+		return self.frames[0]
+
+# approximate memory held per genotype in a decoded buffer (object array of text fields plus float copies)
+BUFFER_BYTES = 128
+
+# automatic buffers grow while a buffer is processed faster than BUFFER_MIN_SECONDS and shrink when slower than BUFFER_MAX_SECONDS
+BUFFER_MIN_SECONDS = 1.0
+BUFFER_MAX_SECONDS = 10.0
+
+class Buffer(object):
+	# number of variants read at a time, fixed (--buffer) or automatic (--buffer-mem)
+	#   in automatic mode the size starts at --buffer, limited so that a decoded buffer holds about mem MB for
+	#   the number of samples in the data file, and is doubled or halved according to the time taken to
+	#   decode and analyze each full buffer
+	def __init__(self, size = 100, mem = None):
+		self.size = max(int(size), 1)
+		self.mem = mem
+		self.max = self.size
+
+	def limit(self, samples):
+		if self.mem is not None:
+			self.max = max(int(self.mem * 1000000 / (BUFFER_BYTES * max(samples, 1))), 1)
+			self.size = min(self.size, self.max)
+
+	def update(self, n, seconds):
+		# partial buffers at the end of a region are not representative of the time per buffer
+		if self.mem is None or n < self.size:
+			return
+		if seconds < BUFFER_MIN_SECONDS:
+			self.size = min(self.size * 2, self.max)
+		elif seconds > BUFFER_MAX_SECONDS:
+			self.size = max(self.size / 2, 1)
+
+class ReadAhead(object):
+	# reads buffers of variants for a region from a Geno reader on a background thread, holding up to depth
+	# decoded buffers ahead of the analysis so that fetching and decoding overlap with model calculations
+	#   iterates over the info and data arrays of each buffer, with the size of each buffer taken from size()
+	#   the reader is used only by the background thread until the region is exhausted or close is called
+	def __init__(self, reader, region, size, depth = 2):
+		self.queue = Queue.Queue(max(int(depth), 1))
+		self.stopped = False
+		self.thread = threading.Thread(target=self.run, args=(reader, region, size))
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self, reader, region, size):
+		try:
+			reader.get_region(region)
+			while not self.stopped:
+				try:
+					reader.get_snvs(size())
+				except:
+					break
+				self.queue.put((reader.info, reader.data))
+		except:
+			pass
+		self.queue.put(None)
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		item = self.queue.get() if not self.stopped else None
+		if item is None:
+			self.stopped = True
+			raise StopIteration
+		return item
+
+	def close(self):
+		# stop reading early, discarding any buffers already read so that the background thread can finish
+		self.stopped = True
+		while self.thread.is_alive():
+			try:
+				self.queue.get(timeout=0.1)
+			except Queue.Empty:
+				pass
+
+def schema_dtype(column):
+	# dtype of a results column from Definitions.UGA_DTYPES, allowing for a model, file or meta tag prefix (tag.p)
+	names = column.split('.')
+	for i in xrange(len(names)):
+		if '.'.join(names[i:]) in Definitions.UGA_DTYPES:
+			return np.dtype(Definitions.UGA_DTYPES['.'.join(names[i:])])
+	return None
+
+def format_column(values, dtype = None, na = ['None']):
+	# text for each value in a results column
+	#   integer schema columns are written as integers even if stored as floats, other floats with 5 significant
+	#   digits, and missing values, including any string in na, as NA
+	values = np.asarray(values)
+	if values.dtype.kind in 'iub':
+		return np.array(map(str, values.tolist()), dtype=object)
+	if values.dtype.kind == 'f':
+		missing = np.isnan(values)
+		filled = np.where(missing, 0, values)
+		if dtype is not None and dtype.kind in 'iu' and np.all(filled == np.floor(filled)):
+			text = np.array(['%d' % x for x in filled.tolist()], dtype=object)
+		else:
+			text = np.array(['%.5g' % x for x in filled.tolist()], dtype=object)
+		text[missing] = 'NA'
+		return text
+	text = np.array([x if isinstance(x, basestring) else str(x) for x in values.tolist()], dtype=object)
+	text[np.asarray(pd.isnull(values)) | np.in1d(text, na)] = 'NA'
+	return text
+
+def format_rows(df, columns, na = ['None']):
+	# tab delimited text for the rows of df, formatted column by column (see format_column)
+	#   columns missing from df are written as NA
+	text = [format_column(df[c].values, schema_dtype(c), na).tolist() if c in df.columns else ['NA'] * df.shape[0] for c in columns]
+	return '\n'.join(['\t'.join(r) for r in zip(*text)]) + '\n' if df.shape[0] > 0 else ''
+
+class Part(object):
+	# bgzip compressed part of a results file, written by a single cpu as results become available
+	#   each write ends with a complete bgzf block, so the compressed bytes written for each region can be
+	#   copied as is into the final results file (see join_parts)
+	#   given the tabix start and end columns (tbx), the position and virtual offsets of each row are kept
+	#   so that the final results file can be indexed without being read back
+	def __init__(self, filename, threads = 1, level = 6):
+		self.filename = filename
+		self.handle = open(filename, 'wb')
+		self.bgzfile = Bgzf.BgzfWriter(fileobj=self.handle, threads=threads, level=level)
+		self.blocks = []
+
+	def write(self, df, columns, k = None, tbx = None, na = ['None']):
+		if df.shape[0] == 0:
+			return
+		start = self.handle.tell()
+		u = self.bgzfile.offset()
+		text = format_rows(df, columns, na)
+		self.bgzfile.write(text)
+		self.bgzfile.flush()
+		records = None
+		if tbx is not None:
+			try:
+				records = (np.asarray(df[columns[0]]).astype(str), np.asarray(df[columns[tbx[0]]], dtype=np.int64), np.asarray(df[columns[tbx[1]]], dtype=np.int64))
+			except (ValueError, TypeError, KeyError):
+				pass
+			else:
+				ustarts, uends = Tabix.line_offsets(text)
+				records = records + (self.bgzfile.virtual_offsets(ustarts + u) - (start << 16), self.bgzfile.virtual_offsets(uends + u) - (start << 16))
+		self.blocks.append((k, start, self.handle.tell(), records))
+
+	def discard(self):
+		self.bgzfile.close()
+		os.remove(self.filename)
+
+	def close(self, head, tbx_start, tbx_end):
+		self.bgzfile.close()
+		with open(self.filename + '.pkl', 'wb') as pkl:
+			pickle.dump([self.blocks, head, tbx_start, tbx_end], pkl, protocol=2)
+
+def join_parts(filename, parts, by_region = False, level = 6):
+	# join part files written by each cpu into a single bgzip compressed results file by copying compressed blocks
+	#   parts are joined in the order given or, for regions pulled from a shared queue, in region order
+	#   the tabix index is built from the row offsets kept by each part, shifted to the position each block
+	#   is copied to, if available for every block and in sorted order
+	#   returns the tabix start and end columns and whether the index was written, or None if no parts were written
+	info = OrderedDict()
+	for p in parts:
+		if os.path.exists(p + '.pkl'):
+			with open(p + '.pkl', 'rb') as pkl:
+				info[p] = pickle.load(pkl)
+	if len(info) == 0:
+		return None
+	tbx_start, tbx_end = info.values()[0][2], info.values()[0][3]
+	blocks = [(b[0], p, b[1], b[2], b[3]) for p in info for b in info[p][0]]
+	if by_region:
+		blocks = sorted(blocks, key=lambda x: x[0])
+	if os.path.exists(filename + '.tbi'):
+		os.remove(filename + '.tbi')
+	indexer = Tabix.Indexer(seq_col=0, start_col=tbx_start, end_col=tbx_end) if None not in [b[4] for b in blocks] else None
+	handle = open(filename, 'wb')
+	bgzfile = Bgzf.BgzfWriter(fileobj=handle, level=level)
+	bgzfile.write(info.values()[0][1])
+	bgzfile.flush()
+	handles = dict([(p, open(p, 'rb')) for p in info])
+	for k, p, start, end, records in blocks:
+		if indexer is not None:
+			try:
+				indexer.add(records[0], records[1], records[2], records[3] + (handle.tell() << 16), records[4] + (handle.tell() << 16))
+			except Process.Error:
+				indexer = None
+		handles[p].seek(start)
+		handle.write(handles[p].read(end - start))
+	for p in info:
+		handles[p].close()
+		os.remove(p)
+		os.remove(p + '.pkl')
+	bgzfile.close()
+	if indexer is not None:
+		indexer.save(filename + '.tbi', level)
+	return tbx_start, tbx_end, indexer is not None
 
 def get_delimiter(d):
 	if d == 'tab':
@@ -33,42 +252,74 @@ def get_delimiter(d):
 		d = ','
 	return d
 
-def verify_results(directory, files):
+def job_dirs(out, jobs_df):
+	# output directory for each job, grouped in blocks of 100 jobs or, with --pack, 100 tasks
+	dirs = {}
+	for j in jobs_df['job'].unique():
+		if 'task' in jobs_df.columns:
+			t = int(jobs_df['task'][jobs_df['job'] == j].iloc[0])
+			dirs[j] = out + '/tasks' + str(100 * ((t-1) / 100) + 1) + '-' + str(100 * ((t-1) / 100) + 100) + '/task' + str(t)
+		else:
+			dirs[j] = out + '/jobs' + str(100 * ((j-1) / 100) + 1) + '-' + str(100 * ((j-1) / 100) + 100) + '/job' + str(j)
+	return dirs
+
+def job_list(jobs_df, rerun = None):
+	# lines of the job run list read by the qsub wrapper, one per array task
+	#   packed tasks are written as the task id and a comma separated list of jobs
+	jobs = [j for j in jobs_df['job'].unique() if rerun is None or j in rerun]
+	if not 'task' in jobs_df.columns:
+		return [str(j) for j in jobs]
+	tasks = OrderedDict()
+	for j in jobs:
+		t = int(jobs_df['task'][jobs_df['job'] == j].iloc[0])
+		tasks.setdefault(t, []).append(str(j))
+	return [str(t) + '\t' + ','.join(tasks[t]) for t in tasks]
+
+def job_log(f, j):
+	# jobs packed into a task share a directory, so the log is matched on the job id
+	d = '/'.join(f.split('/')[0:len(f.split('/'))-1])
+	return glob.glob(d + "/*.job" + str(j) + ".log") or glob.glob(d + "/*.log")
+
+def verify_results(directory, db):
+	# job status is recorded in the job database by the qsub wrapper as each job finishes
+	#   complete jobs with any expected output file missing are rerun
 	print "verifying results"
-	reg_complete = []
-	reg_rerun = []
-	pbar = ProgressBar(maxval=files.shape[0], widgets = ['   processed ', Counter(), ' of ' + str(files.shape[0]) + ' files (', Timer(), ')'])
-	pbar.start()
-	for i, row in files.iterrows():
-		f = directory + '/' + '/'.join(row['file'].split('/')[1:])
-		j = row['job']
-		logfile = glob.glob('/'.join(f.split('/')[0:len(f.split('/'))-1]) + "/*.log")
-		if os.path.exists(f):
-			if len(logfile) > 0:
-				p = subprocess.Popen(['grep','-cw','process complete',logfile[0]], stdout=subprocess.PIPE)	
-				complete = p.communicate()[0]
-				complete = int(complete.strip())
-				if complete == 0:
-					reg_rerun.append(j)
-				else:
-					reg_complete.append(j)
-			else:
-				reg_rerun.append(j)
+	jobs = Db.jobs(db)
+	files = Db.files(db)
+	missing = set([int(row['job']) for i, row in files.iterrows() if not os.path.exists(directory + '/' + '/'.join(row['file'].split('/')[1:]))])
+	complete = [int(x) for x in jobs['job'][jobs['status'] == 'complete'] if not int(x) in missing]
+	return complete, [int(x) for x in jobs['job'] if not int(x) in complete]
+
+def index_source(f):
+	# tabix configuration for results written by uga or epacts, or None if the file source is not recognized
+	h=pysam.TabixFile(filename=f,parser=pysam.asTuple())
+	header = [x for x in h.header]
+	cols = header[-1].split()
+	source = header[0]
+	if '## source: uga' in source or "#chr" in source:
+		if cols[1] == 'pos':
+			return {'seq_col': 0, 'start_col': 1, 'end_col': 1}
 		else:
-			reg_rerun.append(j)
-		pbar.update(i)
-	pbar.finish()
-	return list(set(reg_complete)), list(set(reg_rerun))
+			return {'seq_col': 0, 'start_col': 1, 'end_col': 2}
+	elif '##fileformat=VCF' in source or "#CHROM\tBEGIN\tEND\tMARKER_ID" in source or "#CHROM\tBEG\tEND\tMARKER_ID" in source: # if labeled as VCF or EPACTS results
+		return {'preset': 'vcf'}
+	return None
 
-def compile_results(directory, files):
+def compile_results(directory, files, jobs, threads = 1, level = 6):
 	out = np.unique(files['out'])
 	bgzfile = {}
+	indexed = {}
 	for o in out:
 		print "compiling results to file " + o
 		files_o = files[files['out'] == o].reset_index(drop=True)
 		pbar = ProgressBar(maxval=files_o.shape[0], widgets = ['   processed ', Counter(), ' of ' + str(files_o.shape[0]) + ' files (', Timer(), ')'])
 		pbar.start()
-		bgzfile[o] = bgzf.BgzfWriter(directory + '/' + o, 'wb')
+		# compiled files are indexed as they are written, using the configuration of the first results file
+		conf = index_source(directory + '/' + '/'.join(files_o.iloc[0]['file'].split('/')[1:]))
+		if conf is None:
+			print "compiled file source not recognized"
+			return False
+		bgzfile[o] = Tabix.Writer(directory + '/' + o, threads=threads, level=level, **conf)
 		for j, row in files_o.iterrows():
 			f = directory + '/' + '/'.join(row['file'].split('/')[1:])
 			sed = ['awk','{print $0}'] if j+1 == 1 else ['grep','-v','^#']
@@ -79,7 +330,7 @@ def compile_results(directory, files):
 			p2.wait()
 			pbar.update(j)
 		pbar.finish()
-		bgzfile[o].close()
+		indexed[o] = bgzfile[o].close()
 
 	print "compiling log files"
 	summary = file(directory + '/' + os.path.basename(directory) + '.summary', 'w')
@@ -89,7 +340,7 @@ def compile_results(directory, files):
 	pbar.start()
 	for j, row in files_o.iterrows():
 		f = directory + '/' + '/'.join(row['file'].split('/')[1:])
-		lf = glob.glob('/'.join(f.split('/')[0:len(f.split('/'))-1]) + "/*.log")
+		lf = job_log(f, row['job'])
 		if j+1 == 1:
 			p1 = subprocess.Popen(['cat',lf[0]], stdout=subprocess.PIPE)
 			p2 = subprocess.Popen(['awk','{print \"      \"$0}'], stdin=p1.stdout, stdout=subprocess.PIPE)
@@ -98,16 +349,12 @@ def compile_results(directory, files):
 			p1.wait()
 			p2.wait()
 			summary.write('\nElapsed time and max memory used for each job in list\n\n')
-		p = subprocess.Popen(['grep','time elapsed:',lf[0]], stdout=subprocess.PIPE)
-		elap = p.communicate()[0].strip()
-		p.wait()
-		p = subprocess.Popen(['grep','max memory used by main process:',lf[0]], stdout=subprocess.PIPE)
-		maxmem = p.communicate()[0].strip()
-		p.wait()
-		p = subprocess.Popen(['grep','max memory used by any subprocess:',lf[0]], stdout=subprocess.PIPE)
-		maxmemsub = p.communicate()[0].strip()
-		p.wait()
-		summary.write('job ' + str(j+1) + ' - ' + elap + ' - ' + maxmem + ' - ' + maxmemsub + '\n')
+		job = jobs[jobs['job'] == row['job']].iloc[0]
+		elap = 'time elapsed: ' + strftime('%H:%M:%S', gmtime(job['elapsed']))
+		maxmem = 'max memory used by main process: ' + str('%.2f' % job['maxmem']) + ' MB'
+		maxmemsub = 'max memory used by any subprocess: ' + str('%.2f' % job['maxmem_sub']) + ' MB'
+		rows = ' - ' + str(int(job['rows'])) + ' rows' if not pd.isnull(job['rows']) else ''
+		summary.write('job ' + str(row['job']) + ' - ' + elap + ' - ' + maxmem + ' - ' + maxmemsub + rows + '\n')
 		p = subprocess.Popen(['cat',lf[0]], stdout=subprocess.PIPE)
 		logs.write(p.communicate()[0] + '\n\n')
 		p.wait()
@@ -116,24 +363,10 @@ def compile_results(directory, files):
 	summary.close()
 	logs.close()
 	for o in out:
+		if indexed[o]:
+			continue
 		print "mapping compiled file " + o
 		files_o = files[files['out'] == o].reset_index(drop=True)
-		h=pysam.TabixFile(filename=directory + '/' + '/'.join(files.iloc[0]['file'].split('/')[1:]),parser=pysam.asTuple())
-		header = [x for x in h.header]
-		cols = header[-1].split()
-		source = header[0]
-		if '## source: uga' in source or "#chr" in source:
-			if cols[1] == 'pos':
-				b = 1
-				e = 1
-			else:
-				b = 1
-				e = 2
-			pysam.tabix_index(directory + '/' + o,seq_col=0,start_col=b,end_col=e,force=True)
-		elif '##fileformat=VCF' in source or "#CHROM\tBEGIN\tEND\tMARKER_ID" in source or "#CHROM\tBEG\tEND\tMARKER_ID" in source: # if labeled as VCF or EPACTS results
-			pysam.tabix_index(directory + '/' + o,preset='vcf',force=True)
-		else:
-			print "compiled file source not recognized"
-			return False
+		pysam.tabix_index(directory + '/' + o,force=True,**index_source(directory + '/' + '/'.join(files_o.iloc[0]['file'].split('/')[1:])))
 	print "file compilation complete"
 	return True
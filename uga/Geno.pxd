@@ -24,6 +24,6 @@ import math
 cdef class Variants:
 	cdef public bytes filename, sample_filename, region, group_id, method
 	cdef public object handle, region_iter, snvgroup_map, results, header, cols, dtypes, snv_results_tagged
-	cdef public unsigned int chr, start, end
-	cdef public np.ndarray genos, data, info, snv_chunk, snvgroup_chunk, snv_results, samples
+	cdef public unsigned int chr, start, end, cache_chr, cache_start, cache_end
+	cdef public np.ndarray genos, data, info, snv_chunk, snvgroup_chunk, snv_results, samples, cache_chunk
 	cpdef align(self, Variant.Ref ref)
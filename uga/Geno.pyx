@@ -71,6 +71,7 @@ cdef class Variants(object):
 		self.filename = filename
 		self.sample_filename = sample_filename
 		self.snvgroup_map = None
+		self.cache_chunk = None
 
 	@cython.boundscheck(False)
 	@cython.wraparound(False)
@@ -104,6 +105,46 @@ cdef class Variants(object):
 				self.info['id_unique'][i-1] = ref.db[row['uid']]['id_unique']
 				self.data[:,i] = 2.0 - self.data[:,i].astype(float)
 
+	def load_snvgroup(self, int buffer, group_id, unsigned int width):
+		# decoded records are cached between calls so that overlapping snvgroups processed in order
+		# (ie. a gene and its sliding windows) fetch and decode each record only once
+		#   the cache holds records from the start of the current group to the end of the furthest group loaded
+		logger = logging.getLogger("Geno.Variants.load_snvgroup")
+		logger.debug("load_snvgroup " + group_id)
+		cdef unsigned int start = self.start
+		cdef unsigned int end = self.end
+		if self.cache_chunk is not None and self.cache_chr == self.chr and start >= self.cache_start and start <= self.cache_end + 1:
+			self.cache_chunk = self.cache_chunk[self.cache_chunk[:,1].astype(int) >= start]
+			if end > self.cache_end:
+				self.start = self.cache_end + 1
+				try:
+					self.region_iter = self.handle.fetch(region=str(self.chr) + ':' + str(self.start) + '-' + str(end), parser=pysam.asTuple())
+				except:
+					self.region_iter = iter([])
+		else:
+			self.cache_chunk = np.empty((0,width), dtype='object')
+			self.cache_end = start - 1 if start > 0 else 0
+		chunks = [self.cache_chunk]
+		if end > self.cache_end:
+			while True:
+				try:
+					self.get_chunk(buffer)
+				except:
+					break
+				chunks.append(self.snv_chunk)
+			self.cache_end = end
+		self.start = start
+		self.cache_chr = self.chr
+		self.cache_start = start
+		self.cache_chunk = np.vstack(chunks)
+		self.snvgroup_chunk = self.cache_chunk[self.cache_chunk[:,1].astype(int) <= end]
+		if self.snvgroup_chunk.shape[0] == 0:
+			raise Process.Error("no variants found for snvgroup " + group_id)
+		self.snvgroup_chunk[:,5] = group_id
+		if self.snvgroup_map is not None:
+			snvgroup_snvs = list(self.snvgroup_map['id'][self.snvgroup_map['group_id'] == group_id])
+			self.snvgroup_chunk = self.snvgroup_chunk[np.where(np.in1d(self.snvgroup_chunk[:,2],snvgroup_snvs))]
+
 	def load_snvgroup_map(self, snvgroup_map):
 		logger = logging.getLogger("Geno.Variants.load_snvgroup_map")
 		logger.debug("load_snvgroup_map")
@@ -229,25 +270,10 @@ cdef class Vcf(Variants):
 	cpdef get_snvgroup(self, int buffer, group_id):
 		logger = logging.getLogger("Geno.Vcf.get_snvgroup")
 		logger.debug("get_snvgroup " + group_id)
-		cdef unsigned int i = 0
-		self.snvgroup_chunk = np.empty((0,11 + len(self.samples)), dtype='object')
-		if self.snvgroup_map is not None:
-			snvgroup_snvs = list(self.snvgroup_map['id'][self.snvgroup_map['group_id'] == group_id])
-		while True:
-			try:
-				self.get_chunk(buffer)
-			except:
-				break
-			i = i + 1
-			if self.snvgroup_map is not None:
-				self.snv_chunk = self.snv_chunk[np.where(np.in1d(self.snv_chunk[:,2],snvgroup_snvs))]
-			self.snvgroup_chunk = np.vstack((self.snvgroup_chunk,self.snv_chunk))
-		if i == 0:
-			raise
-		else:
-			self.info = np.array([tuple(row) for row in self.snvgroup_chunk[:,[0,1,2,3,4,5,9,10]]], dtype=zip(np.array(['chr','pos','id','a1','a2','group_id','id_unique','uid']),np.array(['uint8','uint32','|S60','|S1000','|S1000','|S1000','|S1000','|S1000'])))
-			self.data = np.column_stack((self.samples, self.snvgroup_chunk[:,11:].transpose()))
-			np.place(self.data, self.data == 'NA',np.nan)
+		self.load_snvgroup(buffer, group_id, 11 + len(self.samples))
+		self.info = np.array([tuple(row) for row in self.snvgroup_chunk[:,[0,1,2,3,4,5,9,10]]], dtype=zip(np.array(['chr','pos','id','a1','a2','group_id','id_unique','uid']),np.array(['uint8','uint32','|S60','|S1000','|S1000','|S1000','|S1000','|S1000'])))
+		self.data = np.column_stack((self.samples, self.snvgroup_chunk[:,11:].transpose()))
+		np.place(self.data, self.data == 'NA',np.nan)
 
 cdef class Dos(Variants):
 	def __cinit__(self, filename, sample_filename):
@@ -326,25 +352,10 @@ cdef class Dos(Variants):
 	cpdef get_snvgroup(self, int buffer, group_id):
 		logger = logging.getLogger("Geno.Dos.get_snvgroup")
 		logger.debug("get_snvgroup " + group_id)
-		cdef unsigned int i = 0
-		self.snvgroup_chunk = np.empty((0,8 + len(self.samples)), dtype='object')
-		if self.snvgroup_map is not None:
-			snvgroup_snvs = list(self.snvgroup_map['id'][self.snvgroup_map['group_id'] == group_id])
-		while True:
-			try:
-				self.get_chunk(buffer)
-			except:
-				break
-			i = i + 1
-			if self.snvgroup_map is not None:
-				self.snv_chunk = self.snv_chunk[np.where(np.in1d(self.snv_chunk[:,2],snvgroup_snvs))]
-			self.snvgroup_chunk = np.vstack((self.snvgroup_chunk,self.snv_chunk))
-		if i == 0:
-			raise
-		else:
-			self.info = np.array([tuple(row) for row in self.snvgroup_chunk[:,[0,1,2,3,4,5,6,7]]], dtype=zip(np.array(['chr','pos','id','a1','a2','group_id','id_unique','uid']),np.array(['uint8','uint32','|S60','|S1000','|S1000','|S1000','|S1000','|S1000'])))
-			self.data = np.column_stack((self.samples, self.snvgroup_chunk[:,8:].transpose()))
-			np.place(self.data, self.data == 'NA',np.nan)
+		self.load_snvgroup(buffer, group_id, 8 + len(self.samples))
+		self.info = np.array([tuple(row) for row in self.snvgroup_chunk[:,[0,1,2,3,4,5,6,7]]], dtype=zip(np.array(['chr','pos','id','a1','a2','group_id','id_unique','uid']),np.array(['uint8','uint32','|S60','|S1000','|S1000','|S1000','|S1000','|S1000'])))
+		self.data = np.column_stack((self.samples, self.snvgroup_chunk[:,8:].transpose()))
+		np.place(self.data, self.data == 'NA',np.nan)
 
 cdef class Results(Variants):
 	def __cinit__(self, filename):
@@ -14,90 +14,239 @@
 ##    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __main__ import *
-from multiprocessing import Process, Manager, cpu_count
+from multiprocessing import Process, Manager, Pool, cpu_count
 from itertools import islice,groupby
 from operator import attrgetter
 import pysam
 import glob
 import os
+import pickle
+import numpy as np
+import pandas as pd
+import Tabix
 from progressbar import ProgressBar, Counter, Timer
 
-def map(file, 
-		region = None, 
-		mb = '1', 
-		shift_mb = None):
+def count(v, chr, snvs, start = 1, end = None):
+	# cut regions holding about snvs records each by reading through the records
+	# (used when the index does not store a mapped record count)
+	out = []
+	try:
+		records = v.fetch(region=chr + ':' + str(start) + '-' + str(end) if end is not None else chr, parser=pysam.asTuple())
+	except:
+		return out
+	s = start
+	n = 0
+	last = None
+	for record in records:
+		pos = int(record[1])
+		if pos < start or (end is not None and pos > end):
+			continue
+		if n >= snvs and pos != last:
+			out.append((s, last, n))
+			s = last + 1
+			n = 0
+		n += 1
+		last = pos
+	if n > 0:
+		out.append((s, end if end is not None else last, n))
+	return out
 
-	s = int(float(mb) * 1000000) if mb else s
-	shift = int(shift_mb) * 1000000 if shift_mb else 0
+def map_file(f, 
+		region = None, 
+		s = 1000000, 
+		shift = 0,
+		snvs = None):
 
 	regions_out = []
+	v = pysam.TabixFile(filename=f, parser=pysam.asTuple())
+	idx = Tabix.Index(f)
 
-	files_glob = glob.glob(file.replace('[CHR]','*'))
-	for f in files_glob:
-		print "mapping file " + os.path.basename(f)
-		v = pysam.TabixFile(filename=f, parser=pysam.asTuple())
-		regions = []
+	# regions holding about snvs variants each, estimated from the index or counted if unavailable
+	if snvs is not None:
 		start = 1
-		end = 1000000000
+		end = None
 		if not region is None:
+			chrs = [region.split(':')[0]]
 			if len(region.split(':')) > 1:
-				start = region.split(':')[1].split('-')[0]
-				end = region.split(':')[1].split('-')[1]
-			if start != end:
-				starts = range(int(start),int(end),s-shift)
-			else:
-				starts = [int(start)]
-			for rp in starts:
-				regions.append(region.split(':')[0] + ":" + str(rp) + "-" + str(min(rp+s-1,int(end))))
+				start = int(region.split(':')[1].split('-')[0])
+				end = int(region.split(':')[1].split('-')[1])
 		else:
-			starts = range(start,end,s-shift)
-			for chr in v.contigs:
-				for rp in starts:
-					regions.append(chr + ":" + str(rp) + "-" + str(rp+s-1))
+			chrs = v.contigs
+		for chr in chrs:
+			print 'mapping chromosome ' + chr
+			parts = idx.partition(chr, snvs, start, end)
+			if parts is None:
+				parts = count(v, chr, snvs, start, end)
+			regions_out.extend([(chr + ':' + str(p[0]) + '-' + str(p[1]), p[2]) for p in parts])
+		return regions_out
 
-		prev_chr=''
-		for reg in regions:
-			chr = reg.split(':')[0]
-			if chr != prev_chr:
-				print 'mapping chromosome ' + chr
-			prev_chr = chr
-			start = reg.split(':')[1].split('-')[0]
-			end = reg.split(':')[1].split('-')[1]
-			if not s is None:
-				try:
-					records = v.fetch(region=reg, parser=pysam.asTuple())
-				except:
-					pass
-				else:
-					for record in records:
-						if int(record[1]) >= int(start) and int(record[1]) <= int(end):
-							regions_out.append(reg)
-							break
+	windows = []
+	start = 1
+	end = 1000000000
+	if not region is None:
+		if len(region.split(':')) > 1:
+			start = region.split(':')[1].split('-')[0]
+			end = region.split(':')[1].split('-')[1]
+		if start != end:
+			starts = range(int(start),int(end),s-shift)
+		else:
+			starts = [int(start)]
+		windows.extend([(region.split(':')[0], w) for w in idx.windows(region.split(':')[0], starts, s, int(end))])
+	else:
+		starts = range(start,end,s-shift)
+		for chr in v.contigs:
+			windows.extend([(chr, w) for w in idx.windows(chr, starts, s)])
+
+	# windows holding a complete leaf bin are known to contain records, only windows
+	# overlapping partial or higher level bins need to be confirmed by fetching
+	prev_chr=''
+	for chr, w in windows:
+		if chr != prev_chr:
+			print 'mapping chromosome ' + chr
+		prev_chr = chr
+		reg = chr + ":" + str(w[0]) + "-" + str(w[1])
+		n = w[3] if w[3] is not None else float('nan')
+		if w[2]:
+			regions_out.append((reg, n))
+		else:
+			try:
+				records = v.fetch(region=reg, parser=pysam.asTuple())
+			except:
+				pass
 			else:
-				try:
-					records = v.fetch(region=reg, parser=pysam.asTuple())
-				except:
-					pass
-				else:
-					last=0
-					j=0
-					while True:
-						j += 1
-						if j == 1:
-							for record in islice(records, 0,n):
-								pass
-							regions_out.append(chr + ':' + start + '-' + record[1])
-							last = int(record[1])
-						else:
-							chunk=tuple(islice(records, n - 1,n))
-							if not chunk:
-								break
-							regions_out.append(chr + ':' + str(last+1) + '-' + chunk[0][1])
-							last = int(chunk[0][1])
-					if last+1 < end:
-						records = v.fetch(region=chr + ':' + str(last+1) + '-' + end, parser=pysam.asTuple())
-						for record in records:
-							regions_out.append(chr + ':' + start + '-' + record[1])
-							break
+				for record in records:
+					if int(record[1]) >= w[0] and int(record[1]) <= w[1]:
+						regions_out.append((reg, n))
+						break
+	return regions_out
+
+def fingerprint(f):
+	# size and modification times of a data file and its index, used to invalidate cached maps
+	st = os.stat(f)
+	idx = f + '.csi' if os.path.exists(f + '.csi') else f + '.tbi'
+	return (os.path.abspath(f), st.st_size, st.st_mtime, os.path.getmtime(idx) if os.path.exists(idx) else None)
+
+def load_cache(f):
+	# cached region maps are stored in a sidecar file next to the data file,
+	# as a dict of region lists keyed on the file fingerprint and mapping options
+	try:
+		with open(f + '.ugamap', 'rb') as c:
+			cache = pickle.load(c)
+	except:
+		return {}
+	return cache if isinstance(cache, dict) else {}
+
+def save_cache(f, cache):
+	# the data directory may not be writable, in which case maps are simply not cached
+	try:
+		with open(f + '.ugamap', 'wb') as c:
+			pickle.dump(cache, c, protocol=2)
+	except:
+		pass
+
+def map_cached(args):
+	f, region, s, shift, snvs = args
+	fp = fingerprint(f)
+	key = fp + (s, shift, snvs, region)
+	cache = load_cache(f)
+	if key in cache:
+		print "loading cached map for file " + os.path.basename(f)
+		return cache[key]
+	print "mapping file " + os.path.basename(f)
+	regions = map_file(f, region, s, shift, snvs)
+	cache = dict([(k, cache[k]) for k in cache if k[:len(fp)] == fp])
+	cache[key] = regions
+	save_cache(f, cache)
+	return regions
+
+def map(file, 
+		region = None, 
+		mb = '1', 
+		shift_mb = None,
+		snvs = None,
+		cpus = 1):
+
+	s = int(float(mb) * 1000000) if mb else s
+	shift = int(shift_mb) * 1000000 if shift_mb else 0
+
+	regions_out = []
+
+	# files split by chromosome are mapped independently, distributed over cpus
+	files_glob = sorted(glob.glob(file.replace('[CHR]','*')))
+	args = [(f, region, s, shift, snvs) for f in files_glob]
+	if cpus is not None and cpus > 1 and len(files_glob) > 1:
+		pool = Pool(min(cpus, len(files_glob)))
+		maps = pool.map(map_cached, args)
+		pool.close()
+		pool.join()
+	else:
+		maps = [map_cached(x) for x in args]
+	for m in maps:
+		regions_out.extend(m)
 
 	return regions_out
+
+def merge(maps):
+	# combine --snvs region lists mapped from several files into a single non-overlapping list
+	#   the partition of the file holding the most variants on each chromosome is used,
+	#   extended to cover the full range mapped in any file
+	chrs = {}
+	for i in xrange(len(maps)):
+		for reg, n in maps[i]:
+			chr = reg.split(':')[0]
+			start = int(reg.split(':')[1].split('-')[0])
+			end = int(reg.split(':')[1].split('-')[1])
+			if not chr in chrs:
+				chrs[chr] = {}
+			if not i in chrs[chr]:
+				chrs[chr][i] = []
+			chrs[chr][i].append((start, end, n))
+	regions_out = []
+	for chr in chrs:
+		best = max(chrs[chr].keys(), key=lambda i: sum([x[2] for x in chrs[chr][i]]))
+		parts = sorted(chrs[chr][best])
+		start = min([x[0] for i in chrs[chr] for x in chrs[chr][i]])
+		end = max([x[1] for i in chrs[chr] for x in chrs[chr][i]])
+		parts[0] = (start, parts[0][1], parts[0][2])
+		parts[-1] = (parts[-1][0], end, parts[-1][2])
+		regions_out.extend([(chr + ':' + str(p[0]) + '-' + str(p[1]), p[2]) for p in parts])
+	return regions_out
+
+def snvgroup_intervals(file, chunksize = 1000000):
+	# genomic interval and variant count for each group in an --snvgroup-map file
+	#   the map is read in chunks, holding only the running min and max position and count for each group,
+	#   and the marker column is never loaded
+	#   groups are numbered in order of appearance, so that each chunk updates only the groups it holds
+	codes = {}
+	chrs = {}
+	chr_codes = []
+	group_ids = []
+	mins = np.zeros(0, dtype=np.uint32)
+	maxs = np.zeros(0, dtype=np.uint32)
+	counts = np.zeros(0, dtype=np.int64)
+	for chunk in pd.read_table(file, header=None, names=['chr','pos','marker','group_id'], usecols=['chr','pos','group_id'], dtype={'chr': str, 'pos': np.uint32, 'group_id': str}, chunksize=chunksize, compression='gzip' if file.split('.')[-1] == 'gz' else None):
+		chunk = chunk.groupby(['chr','group_id'], sort=False)['pos'].agg(['min','max','count'])
+		idx = np.zeros(chunk.shape[0], dtype=np.int64)
+		for i, k in enumerate(chunk.index):
+			c = codes.get(k)
+			if c is None:
+				c = len(group_ids)
+				codes[k] = c
+				chr_codes.append(chrs.setdefault(k[0], len(chrs)))
+				group_ids.append(k[1])
+			idx[i] = c
+		if len(group_ids) > len(mins):
+			grow = max(len(group_ids), 2 * len(mins)) - len(mins)
+			mins = np.append(mins, np.full(grow, np.iinfo(np.uint32).max, dtype=np.uint32))
+			maxs = np.append(maxs, np.zeros(grow, dtype=np.uint32))
+			counts = np.append(counts, np.zeros(grow, dtype=np.int64))
+		mins[idx] = np.minimum(mins[idx], chunk['min'].values)
+		maxs[idx] = np.maximum(maxs[idx], chunk['max'].values)
+		counts[idx] += chunk['count'].values
+	if len(group_ids) == 0:
+		return pd.DataFrame(columns=['chr','group_id','start','end','n'])
+	n = len(group_ids)
+	del codes
+	intervals = pd.DataFrame({'chr': np.array(sorted(chrs, key=chrs.get), dtype=object)[np.array(chr_codes)], 'group_id': group_ids, 'start': mins[:n].astype(np.int64), 'end': maxs[:n].astype(np.int64), 'n': counts[:n]})
+	intervals['chr'] = pd.to_numeric(intervals['chr'], errors='ignore')
+	return intervals[['chr','group_id','start','end','n']]
@@ -24,6 +24,7 @@ import Geno
 import Variant
 cimport Variant
 import Fxns
+import Stats
 import rpy2.robjects as ro
 from rpy2.robjects import pandas2ri
 from rpy2.rinterface import RRuntimeError
@@ -33,6 +34,9 @@ import math
 import scipy.stats as scipy
 import numpy.lib.recfunctions as recfxns
 import logging
+import hashlib
+import fcntl
+import os
 pandas2ri.activate()
 ro.r('options(warn=-1)')
 ro.r('options(stringsAsFactors=FALSE)')
@@ -41,6 +45,43 @@ ro.r('suppressMessages(library(R.utils))')
 
 module_logger = logging.getLogger("Model")
 
+def model_columns(dep_var, covars = None, interact = None):
+	model_cols = np.array([dep_var])
+	model_cols = np.append(model_cols,np.array([x.replace('factor(','').replace(')','') for x in covars.split('+')])) if covars else model_cols
+	model_cols = np.append(model_cols,np.array(interact.replace('factor(','').replace(')',''))) if interact else model_cols
+	return np.unique(model_cols)
+
+def pheno_fields(model_cols, fid, iid, matid = None, patid = None, sex = None):
+	p_names = (fid,iid) + tuple(x for x in [matid, patid] if x is not None)
+	p_names = p_names + tuple(x for x in model_cols if x not in [fid,iid,matid,patid])
+	p_names = p_names + (sex,) if sex is not None and sex not in model_cols else p_names
+	p_dtypes = ('|S100', '|S100') + tuple('|S100' for x in [matid, patid] if x is not None)
+	p_dtypes = p_dtypes + tuple('f8' for x in model_cols if x not in [fid,iid,matid,patid])
+	p_dtypes = p_dtypes + ('f8',) if sex is not None and sex not in model_cols else p_dtypes
+	return p_names, p_dtypes
+
+def load_pheno(pheno, p_names, p_dtypes, sep, cache = None):
+	# phenotype columns are parsed from the text file unless a cache written by cache_pheno is available,
+	# which is mapped read only so that all cpus share a single copy of the parsed data
+	if cache is not None:
+		try:
+			p = np.load(cache, mmap_mode='r')
+		except:
+			pass
+		else:
+			if set(p.dtype.names) == set(p_names):
+				return p
+	try:
+		return np.genfromtxt(fname=pheno, delimiter=Fxns.get_delimiter(sep), dtype=p_dtypes, names=True, usecols=p_names)
+	except:
+		raise Process.Error("unable to load phenotype file " + pheno + " with columns " + ', '.join(p_names))
+
+def cache_pheno(filename, pheno, p_names, p_dtypes, sep):
+	try:
+		np.save(filename, load_pheno(pheno, p_names, p_dtypes, sep))
+	except IOError:
+		raise Process.Error("unable to write phenotype cache file " + filename)
+
 cdef class Model(object):
 	cdef public unsigned int case_code, ctrl_code, tbx_start, tbx_end, \
 								male, female, nobs, nunique, nfounders, nlongitudinal, \
@@ -51,15 +92,16 @@ cdef class Model(object):
 	cdef public bytes fxn, format, pheno, variants_file, type, samples_file, drop_file, keep_file, \
 						iid, fid, matid, patid, sex, sep, a1, a2
 	cdef public str metadata, metadata_cc, family, formula, focus, dep_var, interact, covars
-	cdef public object pheno_df, variants, out, results_dtypes, pedigree, drop, keep
+	cdef public object pheno_df, variants, out, results_dtypes, pedigree, kins, drop, keep
 	cdef public bint all_founders, reverse
 	def __cinit__(self, fxn, format, variants_file, pheno, type, iid, fid, 
 					case_code = None, ctrl_code = None, all_founders = False, dep_var = None, covars = None, interact = None, reverse = False, samples_file = None, 
-					drop_file = None, keep_file = None, matid = None, patid = None, sex = None, male = 1, female = 2, sep = 'tab', **kwargs):
+					drop_file = None, keep_file = None, matid = None, patid = None, sex = None, male = 1, female = 2, sep = 'tab', pheno_cache = None, **kwargs):
 		super(Model, self).__init__(**kwargs)
 		logger = logging.getLogger("Model.Model.__cinit__")
 		logger.debug("initialize model")
 		self.out = None
+		self.kins = None
 		self.fxn = fxn
 		self.dep_var = dep_var
 		self.covars = covars
@@ -95,10 +137,7 @@ cdef class Model(object):
 		# factor			factor(x)			specify x as a categorical variable (factor)
 		# snv				snv					placeholder for snv (will be replaced with each snv during iteration and can be used in an interaction)
 
-		self.model_cols = np.array([self.dep_var])
-		self.model_cols = np.append(self.model_cols,np.array([x.replace('factor(','').replace(')','') for x in self.covars.split('+')])) if self.covars else self.model_cols
-		self.model_cols = np.append(self.model_cols,np.array(self.interact.replace('factor(','').replace(')',''))) if self.interact else self.model_cols
-		self.model_cols = np.unique(self.model_cols)
+		self.model_cols = model_columns(self.dep_var, self.covars, self.interact)
 
 		self.male_idx = np.array([])
 		self.female_idx = np.array([])
@@ -116,17 +155,9 @@ cdef class Model(object):
 			raise Process.Error(err.msg)
 		else:
 			print "extracting model fields from pheno file and reducing to complete observations ..."
-			p_names = (self.fid,self.iid) + tuple(x for x in [self.matid, self.patid] if x is not None)
-			p_names = p_names + tuple(x for x in self.model_cols if x not in [self.fid,self.iid,self.matid,self.patid])
-			p_names = p_names + (self.sex,) if self.sex is not None and self.sex not in self.model_cols else p_names
-			p_dtypes = ('|S100', '|S100') + tuple('|S100' for x in [self.matid, self.patid] if x is not None)
-			p_dtypes = p_dtypes + tuple('f8' for x in self.model_cols if x not in [self.fid,self.iid,self.matid,self.patid])
-			p_dtypes = p_dtypes + ('f8',) if self.sex is not None and self.sex not in self.model_cols else p_dtypes
+			p_names, p_dtypes = pheno_fields(self.model_cols, self.fid, self.iid, self.matid, self.patid, self.sex)
 			dtypes = dict(zip(p_names, p_dtypes))
-			try:
-				self.pheno_df = np.genfromtxt(fname=self.pheno, delimiter=Fxns.get_delimiter(self.sep), dtype=p_dtypes, names=True, usecols=p_names)
-			except:
-				raise Process.Error("unable to load phenotype file " + self.pheno + " with columns " + ', '.join(p_names))
+			self.pheno_df = load_pheno(self.pheno, p_names, p_dtypes, self.sep, pheno_cache)
 			for x in self.model_cols:
 				if x in self.pheno_df.dtype.names:
 					print "   model column %s found" % (x)
@@ -166,6 +197,8 @@ cdef class Model(object):
 				self.pheno_df = self.pheno_df[~np.isnan(self.pheno_df[x])]
 			for x in [y for y in dtypes if dtypes[y] == '|S100']:
 				self.pheno_df = self.pheno_df[~(self.pheno_df[x] == 'NA')]
+			if not self.pheno_df.flags.writeable:
+				self.pheno_df = self.pheno_df.copy()
 			self.pheno_df = self.pheno_df[np.in1d(self.pheno_df[self.iid],np.intersect1d(self.pheno_df[self.iid],self.variants.samples))]
 			print "phenotype file and data file contain " + str(self.pheno_df.shape[0]) + " common samples"
 			if self.drop_file is not None:
@@ -257,6 +290,60 @@ cdef class Model(object):
 		self.metadata_cc = '## cases: ' + str(self.ncases) + '\n' + \
 							'## controls: ' + str(self.nctrls)
 
+	def update_variants(self, variants_file):
+		# swap the variant source (ie. the next chromosome in a [CHR] file set) keeping all phenotype and sample state
+		#   state derived from the samples common to the pheno and data file remains valid only if the new
+		#   file has exactly the same samples, otherwise the model must be reloaded to pick up any added samples
+		logger = logging.getLogger("Model.Model.update_variants")
+		logger.debug("update_variants " + variants_file)
+		try:
+			variants = getattr(Geno,self.format.capitalize())(variants_file, self.samples_file)
+		except Process.Error as err:
+			raise Process.Error(err.msg)
+		if not np.array_equal(variants.samples, self.variants.samples):
+			raise Process.Error("data file " + variants_file + " samples differ from data file " + self.variants_file)
+		variants.snvgroup_map = self.variants.snvgroup_map
+		self.variants = variants
+		self.variants_file = variants_file
+
+	def load_kinship(self):
+		# kinship matrix of the pedigree for seqMeta, built by kinship2 once for any pedigree and saved next to the phenotype
+		# file under a hash of the pedigree, so that all cpus and jobs sharing a pedigree load it rather than rebuild it
+		#   the first process to need it builds it under a file lock while the others wait, and the matrix is
+		#   built in memory only if the cache directory is not writable
+		if self.kins is None:
+			ro.globalenv['ped'] = self.pedigree
+			cache = self.pheno + '.ugakin'
+			key = hashlib.sha1(self.pedigree[[self.fid,self.iid,self.patid,self.matid,self.sex]].to_csv(index=False)).hexdigest()
+			try:
+				os.makedirs(cache)
+			except OSError:
+				pass
+			try:
+				lock = open(cache + '/' + key + '.lock', 'w')
+			except (IOError, OSError):
+				lock = None
+			else:
+				fcntl.flock(lock, fcntl.LOCK_EX)
+			try:
+				if lock is not None and os.path.exists(cache + '/' + key + '.rds'):
+					try:
+						self.kins = ro.r['readRDS'](cache + '/' + key + '.rds')
+					except RRuntimeError:
+						self.kins = None
+				if self.kins is None:
+					self.kins = ro.r("kinship(pedigree(famid=ped$" + self.fid + ",id=ped$" + self.iid + ",dadid=ped$" + self.patid + ",momid=ped$" + self.matid + ",sex=ped$" + self.sex + ",missid='NA'))")
+					if lock is not None:
+						try:
+							ro.r['saveRDS'](self.kins, file=cache + '/' + key + '.rds.' + str(os.getpid()))
+							os.rename(cache + '/' + key + '.rds.' + str(os.getpid()), cache + '/' + key + '.rds')
+						except (RRuntimeError, OSError):
+							pass
+			finally:
+				if lock is not None:
+					lock.close()
+		ro.globalenv['kins'] = self.kins
+
 	def get_region(self, region, group_id = None):
 		logger = logging.getLogger("Model.Model.get_region")
 		logger.debug("get_region " + region)
@@ -335,10 +422,12 @@ cdef class Model(object):
 
 cdef class SnvModel(Model):
 	cdef public str metadata_snv, metadata_snv_cc
+	cdef public object null
 	def __cinit__(self, **kwargs):
 		logger = logging.getLogger("Model.SnvModel.__cinit__")
 		logger.debug("initialize SnvModel")
 		super(SnvModel, self).__init__(**kwargs)
+		self.null = None
 		self.tbx_start = 1
 		self.tbx_end = 1
 		self.results_header = np.array(['chr','pos','id','a1','a2','filter','callrate','rsq','hwe','n','mac','freq','freq.case','freq.ctrl'])
@@ -361,11 +450,17 @@ cdef class SnvModel(Model):
 
 	@cython.boundscheck(False)
 	@cython.wraparound(False)
-	cpdef get_snvs(self, int buffer):
+	cpdef get_snvs(self, int buffer, shared = None):
+		# shared holds the info and data arrays of a buffer already decoded by another model reading the same
+		# variant source, which are used in place of reading the next buffer (data is subset below, not modified)
 		logger = logging.getLogger("Model.SnvModel.get_snvs")
 		logger.debug("get_snvs")
 		try:
-			self.variants.get_snvs(buffer)
+			if shared is None:
+				self.variants.get_snvs(buffer)
+			else:
+				self.variants.info = shared[0].copy()
+				self.variants.data = shared[1]
 		except:
 			raise
 		else:
@@ -376,6 +471,18 @@ cdef class SnvModel(Model):
 			else:
 				self.calc_variant_stats()
 
+	def genotypes(self, passed):
+		# genotypes of the passed variants as a float matrix with a row for each row of pheno_df (missing as nan)
+		rows = dict(zip(self.variants.data[:,0], xrange(self.variants.data.shape[0])))
+		idx = np.array([rows[x] for x in self.pheno_df[self.iid]])
+		return self.variants.data[idx][:,np.array(passed) + 1].astype('float64')
+
+	def null_model(self, family = None):
+		# null model (phenotype on covariates) for the numpy model engines, fit once as the samples are fixed once loaded
+		if self.null is None:
+			self.null = Stats.Null(self.pheno_df[self.dep_var], Stats.design(self.pheno_df, self.covars), family if family is not None else self.family)
+		return self.null
+
 cdef class SnvgroupModel(Model):
 	cdef public str snvgroup_map, metadata_gene
 	cdef public unsigned int cmac
@@ -462,7 +569,24 @@ cdef class Score(SnvModel):
 		passed = list(np.where(self.variant_stats['filter'] == 0)[0])
 		passed_data = list(np.where(self.variant_stats['filter'] == 0)[0]+1)
 		self.results = np.full((self.variants.info.shape[0],1), fill_value=np.nan, dtype=self.results_dtypes)
-		if len(passed) > 0:
+		if len(passed) > 0 and not self.adjust_kinship:
+			# without kinship adjustment the score statistics for the whole buffer are calculated in numpy,
+			# projecting all genotypes onto the residual space of the null model at once (see Stats.score)
+			try:
+				effect, stderr, p, nmiss = Stats.score(self.null_model(), self.genotypes(passed))
+			except (np.linalg.LinAlgError, ValueError) as err:
+				self.results['err'][passed] = 2
+				raise Process.Error(str(err))
+			err = Stats.errors(effect, stderr, p)
+			ok = err == 0
+			self.results['err'][passed] = err[:,None]
+			self.results['nmiss'][passed] = np.where(ok, nmiss, np.nan)[:,None]
+			self.results['ntotal'][passed] = np.where(ok, self.null.n, np.nan)[:,None]
+			self.results['effect'][passed] = np.where(ok, effect, np.nan)[:,None]
+			self.results['stderr'][passed] = np.where(ok, stderr, np.nan)[:,None]
+			self.results['or'][passed] = np.where(ok, np.exp(effect), np.nan)[:,None]
+			self.results['p'][passed] = np.where(ok, p, np.nan)[:,None]
+		elif len(passed) > 0:
 			variants_df = pd.DataFrame(self.variants.data[:,[0] + passed_data],dtype='object')
 			variants_df.columns = [self.iid] + list(self.variants.info['id_unique'][passed])
 			ro.globalenv['model_df'] = pheno_df.merge(variants_df, on=self.iid, how='left')
@@ -476,8 +600,7 @@ cdef class Score(SnvModel):
 			if len(passed) == 1:
 				ro.r('colnames(z)<-"' + self.variants.info['id_unique'][passed][0] + '"')
 			if self.adjust_kinship:
-				ro.globalenv['ped'] = self.pedigree
-				ro.globalenv['kins'] = ro.r("kinship(pedigree(famid=ped$" + self.fid + ",id=ped$" + self.iid + ",dadid=ped$" + self.patid + ",momid=ped$" + self.matid + ",sex=ped$" + self.sex + ",missid='NA'))")
+				self.load_kinship()
 				cmd = "prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "',kins=kins,sparse=FALSE)"
 			else:
 				cmd = "prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "')"
@@ -511,11 +634,14 @@ cdef class Score(SnvModel):
 
 cdef class Gee(SnvModel):
 	cdef public str corstr
+	cdef public object clusters, design
 	def __cinit__(self, corstr = None, **kwargs):
 		logger = logging.getLogger("Model.Gee.__cinit__")
 		logger.debug("initialize Gee model")
 		self.corstr = corstr if corstr is not None else 'exchangeable'
 		super(Gee, self).__init__(**kwargs)
+		self.clusters = None
+		self.design = None
 		print "setting gee test family option to " + self.family
 
 		if self.reverse:
@@ -566,7 +692,26 @@ cdef class Gee(SnvModel):
 		passed = list(np.where(self.variant_stats['filter'] == 0)[0])
 		passed_data = list(np.where(self.variant_stats['filter'] == 0)[0]+1)
 		self.results = np.full((self.variants.info.shape[0],1), fill_value=np.nan, dtype=self.results_dtypes)
-		if len(passed) > 0:
+		if len(passed) > 0 and not self.reverse and self.interact is None and self.corstr in ['independence','exchangeable']:
+			# the cluster structure (samples ordered and grouped by fid) and the covariate design are built once
+			# and reused by the numpy gee fits of every variant in every region (see Stats.gee)
+			if self.clusters is None:
+				self.clusters = Stats.Clusters(self.pheno_df[self.fid])
+				self.design = (np.asarray(self.pheno_df[self.dep_var], dtype='float64')[self.clusters.order], Stats.design(self.pheno_df, self.covars)[self.clusters.order])
+			try:
+				effect, stderr, wald, p, failed = Stats.gee(self.clusters, self.design[0], self.design[1], self.genotypes(passed)[self.clusters.order], self.family, self.corstr)
+			except (np.linalg.LinAlgError, ValueError) as err:
+				self.results['err'][passed] = 3
+				raise Process.Error(str(err))
+			err = Stats.errors(effect, stderr, wald, p) * 2
+			err[failed] = 3
+			self.results['err'][passed] = err[:,None]
+			self.results['effect'][passed] = effect[:,None]
+			self.results['stderr'][passed] = stderr[:,None]
+			self.results['or'][passed] = np.exp(effect)[:,None]
+			self.results['wald'][passed] = wald[:,None]
+			self.results['p'][passed] = p[:,None]
+		elif len(passed) > 0:
 			variants_df = pd.DataFrame(self.variants.data[:,[0] + passed_data],dtype='object')
 			variants_df.columns = [self.iid] + list(self.variants.info['id_unique'][passed])
 			ro.globalenv['model_df'] = pheno_df.merge(variants_df, on=self.iid, how='left')
@@ -600,11 +745,13 @@ cdef class Gee(SnvModel):
 		self.out = pd.to_numeric(pd.DataFrame(recfxns.merge_arrays((recfxns.merge_arrays((self.variants.info,self.variant_stats),flatten=True),self.results),flatten=True), dtype='object'),errors='coerce')
 
 cdef class Glm(SnvModel):
-	def __cinit__(self, **kwargs):
+	cdef public object glm_screen
+	def __cinit__(self, glm_screen = None, **kwargs):
 		logger = logging.getLogger("Model.Glm.__cinit__")
 		logger.debug("initialize Glm model")
 		super(Glm, self).__init__(**kwargs)
 		print "setting glm test family option to " + self.family
+		self.glm_screen = glm_screen
 
 		if self.reverse:
 			if self.interact is not None:
@@ -635,7 +782,8 @@ cdef class Glm(SnvModel):
 		self.metadata_snv = self.metadata_snv + '\n' + self.metadata_snv_cc if self.family == 'binomial' else self.metadata_snv
 		self.metadata = self.metadata + '\n' + \
 						self.metadata_snv + '\n' + \
-						'## err: error code (0: no error, 1: missing values returned by glm, 2: infinite value or zero p-value detected, 3: glm failed)' + '\n' + \
+						'## err: error code (0: no error, 1: missing values returned by glm, 2: infinite value or zero p-value detected, 3: glm failed' + \
+						(', 4: not fit, score test p-value >= ' + str(self.glm_screen) + ' (effect, stderr and z are score test estimates)' if self.glm_screen is not None else '') + ')' + '\n' + \
 						'## effect: effect size' + '\n' + \
 						'## stderr: standard error'
 		self.metadata = self.metadata + '\n' + '## or: odds ratio (included only if binomial family)' if self.family == 'binomial' else self.metadata
@@ -643,6 +791,10 @@ cdef class Glm(SnvModel):
 						'## z: z-statistic' + '\n' + \
 						'## p: p-value' + '\n#'
 
+		if self.glm_screen is not None and (self.reverse or self.interact is not None):
+			print "two stage glm test not available for reverse or interaction models, fitting all variants"
+			self.glm_screen = None
+
 	@cython.boundscheck(False)
 	@cython.wraparound(False)
 	cpdef calc_model(self):
@@ -650,6 +802,24 @@ cdef class Glm(SnvModel):
 		passed = list(np.where(self.variant_stats['filter'] == 0)[0])
 		passed_data = list(np.where(self.variant_stats['filter'] == 0)[0]+1)
 		self.results = np.full((self.variants.info.shape[0],1), fill_value=np.nan, dtype=self.results_dtypes)
+		if len(passed) > 0 and self.glm_screen is not None:
+			# two stage test: a score test against the null model screens the whole buffer at once in numpy and the
+			# full glm is fit only for variants with a score test p-value below the threshold (or no p-value)
+			try:
+				effect, stderr, p, nmiss = Stats.score(self.null_model(), self.genotypes(passed))
+			except (np.linalg.LinAlgError, ValueError) as err:
+				self.results['err'][passed] = 3
+				raise Process.Error(str(err))
+			screened = np.isfinite(p) & (p >= self.glm_screen)
+			s = list(np.array(passed)[screened])
+			self.results['err'][s] = 4
+			self.results['effect'][s] = effect[screened][:,None]
+			self.results['stderr'][s] = stderr[screened][:,None]
+			self.results['or'][s] = np.exp(effect[screened])[:,None]
+			self.results['z'][s] = (effect[screened] / stderr[screened])[:,None]
+			self.results['p'][s] = p[screened][:,None]
+			passed = list(np.array(passed)[~screened])
+			passed_data = [v + 1 for v in passed]
 		if len(passed) > 0:
 			variants_df = pd.DataFrame(self.variants.data[:,[0] + passed_data],dtype='object')
 			variants_df.columns = [self.iid] + list(self.variants.info['id_unique'][passed])
@@ -722,7 +892,22 @@ cdef class Lm(SnvModel):
 		passed = list(np.where(self.variant_stats['filter'] == 0)[0])
 		passed_data = list(np.where(self.variant_stats['filter'] == 0)[0]+1)
 		self.results = np.full((self.variants.info.shape[0],1), fill_value=np.nan, dtype=self.results_dtypes)
-		if len(passed) > 0:
+		if len(passed) > 0 and not self.reverse and self.interact is None:
+			# the snv effect in the standard model is calculated in numpy for the whole buffer, using the covariate
+			# projection of the null model and exact corrections for variants with missing genotypes (see Stats.lm)
+			try:
+				effect, stderr, t, p, aliased = Stats.lm(self.null_model('gaussian'), self.genotypes(passed))
+			except (np.linalg.LinAlgError, ValueError) as err:
+				self.results['err'][passed] = 3
+				raise Process.Error(str(err))
+			err = Stats.errors(effect, stderr, t, p) * 2
+			err[aliased] = 1
+			self.results['err'][passed] = err[:,None]
+			self.results['effect'][passed] = np.where(~aliased, effect, np.nan)[:,None]
+			self.results['stderr'][passed] = np.where(~aliased, stderr, np.nan)[:,None]
+			self.results['t'][passed] = np.where(~aliased, t, np.nan)[:,None]
+			self.results['p'][passed] = np.where(~aliased, p, np.nan)[:,None]
+		elif len(passed) > 0:
 			variants_df = pd.DataFrame(self.variants.data[:,[0] + passed_data],dtype='object')
 			variants_df.columns = [self.iid] + list(self.variants.info['id_unique'][passed])
 			ro.globalenv['model_df'] = pheno_df.merge(variants_df, on=self.iid, how='left')
@@ -833,8 +1018,7 @@ cdef class Skat(SnvgroupModel):
 				if len(passed) == 1:
 					ro.r('colnames(z)<-"' + self.variants.info['id_unique'][passed][0] + '"')
 				if self.adjust_kinship:
-					ro.globalenv['ped'] = self.pedigree
-					ro.globalenv['kins'] = ro.r("kinship(pedigree(famid=ped$" + self.fid + ",id=ped$" + self.iid + ",dadid=ped$" + self.patid + ",momid=ped$" + self.matid + ",sex=ped$" + self.sex + ",missid='NA'))")
+					self.load_kinship()
 					cmd = "tryCatch(expr = { evalWithTimeout(prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "',kins=kins,sparse=FALSE), timeout=" + str(self.timeout) + ") }, error = function(e) return(1))"
 				else:
 					cmd = "tryCatch(expr = { evalWithTimeout(prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "'), timeout=" + str(self.timeout) + ") }, error = function(e) return(1))"
@@ -973,8 +1157,7 @@ cdef class Skato(SnvgroupModel):
 				if passed == 1:
 					ro.r('colnames(z)<-"' + self.variants.info['id_unique'][passed][0] + '"')
 				if self.adjust_kinship:
-					ro.globalenv['ped'] = self.pedigree
-					ro.globalenv['kins'] = ro.r("kinship(pedigree(famid=ped$" + self.fid + ",id=ped$" + self.iid + ",dadid=ped$" + self.patid + ",momid=ped$" + self.matid + ",sex=ped$" + self.sex + ",missid='NA'))")
+					self.load_kinship()
 					cmd = "tryCatch(expr = { evalWithTimeout(prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "',kins=kins,sparse=FALSE), timeout=" + str(self.timeout) + ") }, error = function(e) return(1))"
 				else:
 					cmd = "tryCatch(expr = { evalWithTimeout(prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "'), timeout=" + str(self.timeout) + ") }, error = function(e) return(1))"
@@ -1115,8 +1298,7 @@ cdef class Burden(SnvgroupModel):
 				if len(passed) == 1:
 					ro.r('colnames(z)<-"' + self.variants.info['id_unique'][passed][0] + '"')
 				if self.adjust_kinship:
-					ro.globalenv['ped'] = self.pedigree
-					ro.globalenv['kins'] = ro.r("kinship(pedigree(famid=ped$" + self.fid + ",id=ped$" + self.iid + ",dadid=ped$" + self.patid + ",momid=ped$" + self.matid + ",sex=ped$" + self.sex + ",missid='NA'))")
+					self.load_kinship()
 					cmd = "tryCatch(expr = { evalWithTimeout(prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "',kins=kins,sparse=FALSE), timeout=" + str(self.timeout) + ") }, error = function(e) return(1))"
 				else:
 					cmd = "tryCatch(expr = { evalWithTimeout(prepScores2(Z=z,formula=" + self.formula + ",SNPInfo=snp_info,data=model_df,family='" + self.family + "'), timeout=" + str(self.timeout) + ") }, error = function(e) return(1))"
@@ -67,13 +67,15 @@ def get_args(parser):
 	return args
 
 def generate_snv_cfg(args):
-	config = {'out': None, 'buffer': 100, 'region': None, 'region_file': None, 'cpus': 1, 'mb': 1, 'qsub': None, 'split': False, 'split_n': None, 'replace': False, 
+	config = {'out': None, 'buffer': 100, 'buffer_mem': None, 'region': None, 'region_file': None, 'cpus': 1, 'dynamic': False, 'bgzip_threads': 1, 'bgzip_level': 6, 'mb': 1, 'snvs': None, 'qsub': None, 'split': False, 'split_n': None, 'pack': None, 'replace': False, 
 					'job': 1, 'debug': False, 'models': {}, 'model_order': [], 'meta': {}, 'meta_order': [], 'meta_type': {}}
 	for arg in args:
 		if arg[0] == 'out':
 			config['out'] = arg[1]
 		if arg[0] == 'buffer' and arg[1] is not None:
 			config['buffer'] = arg[1]
+		if arg[0] == 'buffer_mem':
+			config['buffer_mem'] = arg[1]
 		if arg[0] == 'region':
 			config['region'] = arg[1]
 		if arg[0] == 'region_file':
@@ -88,14 +90,24 @@ def generate_snv_cfg(args):
 			config['meta_order'].append(arg[1][0])
 		if arg[0] == 'cpus' and arg[1] is not None:
 			config['cpus'] = arg[1]
+		if arg[0] == 'dynamic':
+			config['dynamic'] = arg[1]
+		if arg[0] == 'bgzip_threads' and arg[1] is not None:
+			config['bgzip_threads'] = arg[1]
+		if arg[0] == 'bgzip_level' and arg[1] is not None:
+			config['bgzip_level'] = arg[1]
 		if arg[0] == 'mb' and arg[1] is not None:
 			config['mb'] = arg[1]
+		if arg[0] == 'snvs' and arg[1] is not None:
+			config['snvs'] = arg[1]
 		if arg[0] == 'qsub':
 			config['qsub'] = arg[1]
 		if arg[0] == 'split' and arg[1] is True:
 			config['split'] = arg[1]
 		if arg[0] == 'split_n':
 			config['split_n'] = arg[1]
+		if arg[0] == 'pack':
+			config['pack'] = arg[1]
 		if arg[0] == 'replace':
 			config['replace'] = arg[1]
 		if arg[0] == 'debug':
@@ -111,7 +123,7 @@ def generate_snv_cfg(args):
 							'male': 1, 'female': 2, 'miss': None, 'maf': None, 'maxmaf': None, 'mac': None, 'rsq': None, 'hwe': None, 'hwe_maf': None,
 							'fxn': None, 'dep_var': None, 'format': None, 'file': None, 'sample': None, 'drop': None, 'keep': None, 'corstr': None, 
 							'pheno': None, 'covars': None, 'interact': None, 'reverse': False, 'case_code': 1, 'ctrl_code': 0, 
-							'adjust_kinship': False}
+							'adjust_kinship': False, 'glm_screen': None}
 	if len(tags_idx) > 1:
 		for i in xrange(len(tags_idx[:-1])):
 			config['models'][args[tags_idx[i]][1]] = config_default.copy()
@@ -177,7 +189,7 @@ def print_snv_options(cfg):
 				print "      {0:>{1}}".format(str('--meta-sample-size'), len(max(['--' + k for k in cfg['meta'].keys()],key=len))) + " " + m + ' ' + str(cfg['meta'][m])
 
 def generate_snvgroup_cfg(args):
-	config = {'out': None, 'buffer': 100, 'region': None, 'region_file': None, 'cpus': 1, 'qsub': None, 'split': False, 'split_n': None, 'replace': False, 'snvgroup_map': None, 
+	config = {'out': None, 'buffer': 100, 'region': None, 'region_file': None, 'cpus': 1, 'dynamic': False, 'bgzip_threads': 1, 'bgzip_level': 6, 'qsub': None, 'split': False, 'split_n': None, 'pack': None, 'replace': False, 'snvgroup_map': None, 
 					'job': 1, 'debug': False, 'timeout': 3600, 'models': {}, 'model_order': [], 'meta': {}, 'meta_order': []}
 	for arg in args:
 		if arg[0] == 'out':
@@ -189,12 +201,20 @@ def generate_snvgroup_cfg(args):
 			config['meta_order'].append(arg[1][0])
 		if arg[0] == 'cpus' and arg[1] is not None:
 			config['cpus'] = arg[1]
+		if arg[0] == 'dynamic':
+			config['dynamic'] = arg[1]
+		if arg[0] == 'bgzip_threads' and arg[1] is not None:
+			config['bgzip_threads'] = arg[1]
+		if arg[0] == 'bgzip_level' and arg[1] is not None:
+			config['bgzip_level'] = arg[1]
 		if arg[0] == 'qsub':
 			config['qsub'] = arg[1]
 		if arg[0] == 'split' and arg[1] is True:
 			config['split'] = arg[1]
 		if arg[0] == 'split_n':
 			config['split_n'] = arg[1]
+		if arg[0] == 'pack':
+			config['pack'] = arg[1]
 		if arg[0] == 'snvgroup_map':
 			config['snvgroup_map'] = arg[1]
 		if arg[0] == 'region':
@@ -281,7 +301,7 @@ def print_snvgroup_options(cfg):
 			print "      {0:>{1}}".format(str('--meta'), len(max(['--' + k for k in cfg['meta'].keys()],key=len))) + " " + m + ' ' + str(cfg['meta'][m])
 
 def generate_meta_cfg(args):
-	config = {'out': None, 'region': None, 'region_file': None, 'buffer': 100, 'cpus': 1, 'mb': 1, 'qsub': None, 'split': False, 'split_n': None, 'replace': False, 
+	config = {'out': None, 'region': None, 'region_file': None, 'buffer': 100, 'cpus': 1, 'dynamic': False, 'bgzip_threads': 1, 'bgzip_level': 6, 'mb': 1, 'snvs': None, 'qsub': None, 'split': False, 'split_n': None, 'pack': None, 'replace': False, 
 					'job': 1, 'debug': False, 'files': {}, 'file_order': [], 'meta': {}, 'meta_order': [], 'meta_type': {}}
 
 	for arg in args:
@@ -303,14 +323,24 @@ def generate_meta_cfg(args):
 			config['buffer'] = arg[1]
 		if arg[0] == 'cpus' and arg[1] is not None:
 			config['cpus'] = arg[1]
+		if arg[0] == 'dynamic':
+			config['dynamic'] = arg[1]
+		if arg[0] == 'bgzip_threads' and arg[1] is not None:
+			config['bgzip_threads'] = arg[1]
+		if arg[0] == 'bgzip_level' and arg[1] is not None:
+			config['bgzip_level'] = arg[1]
 		if arg[0] == 'mb' and arg[1] is not None:
 			config['mb'] = arg[1]
+		if arg[0] == 'snvs' and arg[1] is not None:
+			config['snvs'] = arg[1]
 		if arg[0] == 'qsub':
 			config['qsub'] = arg[1]
 		if arg[0] == 'split' and arg[1] is True:
 			config['split'] = arg[1]
 		if arg[0] == 'split_n':
 			config['split_n'] = arg[1]
+		if arg[0] == 'pack':
+			config['pack'] = arg[1]
 		if arg[0] == 'replace':
 			config['replace'] = arg[1]
 		if arg[0] == 'debug':
@@ -344,12 +374,16 @@ def print_meta_options(cfg):
 				print "      {0:>{1}}".format(str('--meta-sample-size'), len(max(['--' + k for k in cfg['meta'].keys()],key=len))) + " " + m + ' ' + str(cfg['meta'][m])
 
 def generate_compile_cfg(args):
-	config = {'dir': None, 'replace': False}
+	config = {'dir': None, 'replace': False, 'bgzip_threads': 1, 'bgzip_level': 6}
 	for arg in args:
 		if arg[0] == 'dir':
 			config['dir'] = arg[1]
 		if arg[0] == 'replace':
 			config['replace'] = arg[1]
+		if arg[0] == 'bgzip_threads' and arg[1] is not None:
+			config['bgzip_threads'] = arg[1]
+		if arg[0] == 'bgzip_level' and arg[1] is not None:
+			config['bgzip_level'] = arg[1]
 	return config
 
 def print_compile_options(cfg):
@@ -466,7 +500,7 @@ def print_snvgroupplot_options(cfg):
 				print "      {0:>{1}}".format(str('--' + k.replace('_','-')), len(max(['--' + key.replace('_','-') for key in cfg.keys()],key=len))) + " " + str(cfg[k])
 
 def generate_filter_cfg(args):
-	config = {'file': None, 'tag': 'filtered', 'replace': False, 'qsub': None, 'debug': False, 'gc': False, 
+	config = {'file': None, 'tag': 'filtered', 'replace': False, 'bgzip_threads': 1, 'bgzip_level': 6, 'qsub': None, 'debug': False, 'gc': False, 
 				'bpcol': 'pos', 'pcol': 'p', 'misscol': 'miss', 'freqcol': 'freq', 'maccol': 'mac', 'cmaccol': 'cmac', 'rsqcol': 'rsq', 'hwecol': 'hwe', 
 				'effectcol': 'effect', 'stderrcol': 'stderr', 'waldcol': 'wald', 'zcol': 'z', 'tcol': 't', 
 				'miss': None, 'maf': None, 'mac': None, 'cmac': None, 'rsq': None, 'hwe': None, 'hwe_maf': None}
@@ -477,6 +511,10 @@ def generate_filter_cfg(args):
 			config['tag'] = arg[1]
 		if arg[0] == 'replace':
 			config['replace'] = arg[1]
+		if arg[0] == 'bgzip_threads' and arg[1] is not None:
+			config['bgzip_threads'] = arg[1]
+		if arg[0] == 'bgzip_level' and arg[1] is not None:
+			config['bgzip_level'] = arg[1]
 		if arg[0] == 'qsub':
 			config['qsub'] = arg[1]
 		if arg[0] == 'debug':
@@ -536,7 +574,7 @@ def print_filter_options(cfg):
 				print "      {0:>{1}}".format(str('--' + k.replace('_','-')), len(max(['--' + key.replace('_','-') for key in cfg.keys()],key=len))) + " " + str(cfg[k])
 
 def generate_merge_cfg(args):
-	config = {'out': None, 'region': None, 'region_file': None, 'buffer': 100, 'cpus': 1, 'mb': 1, 'qsub': None, 'split': False, 'split_n': None, 'replace': False, 
+	config = {'out': None, 'region': None, 'region_file': None, 'buffer': 100, 'cpus': 1, 'dynamic': False, 'bgzip_threads': 1, 'bgzip_level': 6, 'mb': 1, 'snvs': None, 'qsub': None, 'split': False, 'split_n': None, 'pack': None, 'replace': False, 
 					'job': 1, 'debug': False, 'files': {}, 'file_order': [], 'snpeff': False}
 	for arg in args:
 		if arg[0] == 'file':
@@ -558,12 +596,22 @@ def generate_merge_cfg(args):
 			config['buffer'] = arg[1]
 		if arg[0] == 'cpus' and arg[1] is not None:
 			config['cpus'] = arg[1]
+		if arg[0] == 'dynamic':
+			config['dynamic'] = arg[1]
+		if arg[0] == 'bgzip_threads' and arg[1] is not None:
+			config['bgzip_threads'] = arg[1]
+		if arg[0] == 'bgzip_level' and arg[1] is not None:
+			config['bgzip_level'] = arg[1]
 		if arg[0] == 'mb' and arg[1] is not None:
 			config['mb'] = arg[1]
+		if arg[0] == 'snvs' and arg[1] is not None:
+			config['snvs'] = arg[1]
 		if arg[0] == 'split' and arg[1] is True:
 			config['split'] = arg[1]
 		if arg[0] == 'split_n':
 			config['split_n'] = arg[1]
+		if arg[0] == 'pack':
+			config['pack'] = arg[1]
 		if arg[0] == 'snpeff':
 			config['snpeff'] = arg[1]
 		if arg[0] == 'job':
@@ -581,8 +629,8 @@ def print_merge_options(cfg):
 				print "      {0:>{1}}".format(str('--' + k.replace('_','-')), len(max(['--' + key.replace('_','-') for key in cfg.keys()],key=len))) + " " + str(cfg[k])
 
 def generate_tools_cfg(args):
-	config = {'file': None, 'out': None, 'source': None, 'buffer': 100, 'region': None, 'region_file': None, 'cpus': 1, 'mb': 1, 'qsub': None, 
-				'job': 1, 'split': False, 'split_n': None, 'split_chr': None, 'job': None, 'jobs': None, 'replace': False, 'debug': False}
+	config = {'file': None, 'out': None, 'source': None, 'buffer': 100, 'region': None, 'region_file': None, 'cpus': 1, 'dynamic': False, 'bgzip_threads': 1, 'bgzip_level': 6, 'mb': 1, 'snvs': None, 'qsub': None, 
+				'job': 1, 'split': False, 'split_n': None, 'pack': None, 'split_chr': None, 'job': None, 'jobs': None, 'replace': False, 'debug': False}
 	for arg in args:
 		if arg[0] == 'file':
 			config['file'] = arg[1]
@@ -598,14 +646,24 @@ def generate_tools_cfg(args):
 			config['region_file'] = arg[1]
 		if arg[0] == 'cpus' and arg[1] is not None:
 			config['cpus'] = arg[1]
+		if arg[0] == 'dynamic':
+			config['dynamic'] = arg[1]
+		if arg[0] == 'bgzip_threads' and arg[1] is not None:
+			config['bgzip_threads'] = arg[1]
+		if arg[0] == 'bgzip_level' and arg[1] is not None:
+			config['bgzip_level'] = arg[1]
 		if arg[0] == 'mb' and arg[1] is not None:
 			config['mb'] = arg[1]
+		if arg[0] == 'snvs' and arg[1] is not None:
+			config['snvs'] = arg[1]
 		if arg[0] == 'qsub':
 			config['qsub'] = arg[1]
 		if arg[0] == 'split' and arg[1] is True:
 			config['split'] = arg[1]
 		if arg[0] == 'split_n':
 			config['split_n'] = arg[1]
+		if arg[0] == 'pack':
+			config['pack'] = arg[1]
 		if arg[0] == 'split_chr':
 			config['split_chr'] = arg[1]
 		if arg[0] == 'job':
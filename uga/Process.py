@@ -43,9 +43,9 @@ def qsub(qsub_pre,cmd, jobs_run_file = None, log_file = None):
 		print "   ... process terminated by user"
 		sys.exit(1)
 
-def interactive(submit, cmd, log_file = None):
+def interactive(submit, cmd, log_file = None, db = None):
 	try:
-		p = subprocess.Popen([submit,cmd], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1)
+		p = subprocess.Popen([submit,cmd] + ([db] if db is not None else []), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1)
 		if log_file:
 			log = open(log_file, 'w')
 		for line in iter(p.stdout.readline, ''):
@@ -17,7 +17,8 @@ import pandas as pd
 import numpy as np
 import Parse
 import pysam
-from Bio import bgzf
+import Tabix
+import Fxns
 import scipy.stats as scipy
 import math
 import Process
@@ -129,21 +130,22 @@ def RunFilter(args):
 
 	print "writing filtered results to file"
 	try:
-		bgzfile = bgzf.BgzfWriter(cfg['file'].replace('.gz','.' + cfg['tag'] + '.gz'), 'wb')
+		bgzfile = Tabix.Writer(cfg['file'].replace('.gz','.' + cfg['tag'] + '.gz'), threads=cfg['bgzip_threads'], level=cfg['bgzip_level'], seq_col=0, start_col=r.columns.get_loc(cfg['bpcol']), end_col=r.columns.get_loc(cfg['bpcol']))
 	except:
 		print Process.Error("unable to initialize out file " + cfg['file'].replace('.gz','.' + cfg['tag'] + '.gz')).out
 		return 1
 	bgzfile.write('\n'.join([x for x in handle.header]) + '\n')
-	r[cols].to_csv(bgzfile,header=False,index=False,sep="\t",na_rep='NA', float_format='%.5g')
-	bgzfile.close()
+	bgzfile.write(Fxns.format_rows(r, cols, na=[]), (r[cols[0]], r[cfg['bpcol']], r[cfg['bpcol']]))
+	indexed = bgzfile.close()
 	handle.close()
 
-	print "indexing out file"
-	try:
-		pysam.tabix_index(cfg['file'].replace('.gz','.' + cfg['tag'] + '.gz'),seq_col=0,start_col=r.columns.get_loc(cfg['bpcol']),end_col=r.columns.get_loc(cfg['bpcol']),force=True)
-	except:
-		print Process.Error('failed to generate index for file ' + cfg['file'].replace('.gz','.' + cfg['tag'] + '.gz')).out
-		return 1
+	if not indexed:
+		print "indexing out file"
+		try:
+			pysam.tabix_index(cfg['file'].replace('.gz','.' + cfg['tag'] + '.gz'),seq_col=0,start_col=r.columns.get_loc(cfg['bpcol']),end_col=r.columns.get_loc(cfg['bpcol']),force=True)
+		except:
+			print Process.Error('failed to generate index for file ' + cfg['file'].replace('.gz','.' + cfg['tag'] + '.gz')).out
+			return 1
 
 	print "process complete"
 	return 0
@@ -21,6 +21,8 @@ import Variant
 import pysam
 from Bio import bgzf
 import Process
+import Fxns
+import Db
 import multiprocessing as mp
 import sys
 import os
@@ -30,8 +32,9 @@ import pickle
 logging.basicConfig(format='%(asctime)s - %(processName)s - %(name)s - %(message)s',level=logging.DEBUG)
 logger = logging.getLogger("RunMerge")
 
-def process_regions(regions_df, cfg, cpu, log):
-	regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
+def process_regions(regions_df, cfg, cpu, log, queue = None):
+	if queue is None:
+		regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
 
 	if log:
 		try:
@@ -56,8 +59,14 @@ def process_regions(regions_df, cfg, cpu, log):
 
 	variants_found = False
 	variant_ref = Variant.Ref()
-	results_final = None
-	for k in xrange(len(regions_df.index)):
+	results_header = None
+	try:
+		part = Fxns.Part(cfg['out'] + '.cpu' + str(cpu), cfg['bgzip_threads'], cfg['bgzip_level'])
+	except:
+		print Process.Error("failed to initialize bgzip format part file " + cfg['out'] + '.cpu' + str(cpu)).out
+		return 1
+	# regions are taken in order from the cpu assignment or pulled from a queue shared by all cpus
+	for k in (iter(queue.get, None) if queue is not None else xrange(len(regions_df.index))):
 		region_written = False
 		print ''
 		print 'loading region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['region'][k] + ') ...'
@@ -92,18 +101,22 @@ def process_regions(regions_df, cfg, cpu, log):
 			print status
 			sys.stdout.flush()
 
-		if k == 0:
-			results_final = results_region.copy()
-		else:
-			results_final = results_final.merge(results_region, how='outer')
+		results_region = results_region[[a for a in results_region.columns if a not in ['id_unique','uid']]]
+		results_region = results_region.sort_values(by=['chr','pos'])
+		results_region['chr'] = results_region['chr'].astype(np.int64)
+		results_region['pos'] = results_region['pos'].astype(np.int64)
+		if results_header is None:
+			results_header = results_region.columns.values
+		part.write(results_region, results_header, k, (1, 1), na=['None', 'nan'])
+
+	if results_header is None:
+		part.discard()
+		if log:
+			sys.stdout = stdout_orig
+			log_file.close()
+		return -1
 
-	results_final = results_final[[a for a in results_final.columns if a not in ['id_unique','uid']]]
-	results_final = results_final.sort_values(by=['chr','pos'])
-	results_final['chr'] = results_final['chr'].astype(np.int64)
-	results_final['pos'] = results_final['pos'].astype(np.int64)
-	pkl = open('/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(cpu) + '.pkl', "wb")
-	pickle.dump([results_final,np.array(results_final.columns.values)],pkl,protocol=2)
-	pkl.close()
+	part.close('#' + '\t'.join(results_header) + '\n', 1, 1)
 
 	if log:
 		sys.stdout = stdout_orig
@@ -121,24 +134,26 @@ def RunMerge(args):
 	if not cfg['debug']:
 		logging.disable(logging.CRITICAL)
 
-	regions_df = pd.read_table(cfg['region_file'], compression='gzip' if cfg['region_file'].split('.')[-1] == 'gz' else None)
-	regions_df = regions_df[regions_df['job'] == int(cfg['job'])].reset_index(drop=True)
+	regions_df = Db.regions(cfg['region_file'], cfg['job'])
 	return_values = {}
 	print ''
-	try:
-		bgzfile = bgzf.BgzfWriter(cfg['out'] + '.gz', 'wb')
-	except:
-		print Process.Error("failed to initialize bgzip format out file " + cfg['out'] + '.gz').out
-		return 1
-
+	queue = None
 	if cfg['cpus'] > 1:
+		if cfg['dynamic']:
+			print "initializing shared region queue"
+			manager = mp.Manager()
+			queue = manager.Queue()
+			for k in xrange(len(regions_df.index)):
+				queue.put(k)
+			for i in xrange(cfg['cpus']):
+				queue.put(None)
 		pool = mp.Pool(cfg['cpus']-1)
 		for i in xrange(1,cfg['cpus']):
-			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,))
+			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,queue,))
 			print "submitting job on cpu " + str(i) + " of " + str(cfg['cpus'])
 		pool.close()
 		print "executing job for cpu " + str(cfg['cpus']) + " of " + str(cfg['cpus']) + " via main process"
-		main_return = process_regions(regions_df,cfg,cfg['cpus'],True)
+		main_return = process_regions(regions_df,cfg,cfg['cpus'],True,queue)
 		pool.join()
 
 		if 1 in [return_values[i].get() for i in return_values] or main_return == 1:
@@ -161,26 +176,24 @@ def RunMerge(args):
 		logfile.close()
 		os.remove(cfg['out'] + '.cpu' + str(i) + '.log')
 
-	written = False
-	for i in xrange(1,cfg['cpus']+1):
-		out = '/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(i) + '.pkl'
-		pkl = open(out,"rb")
-		results_final,results_header = pickle.load(pkl)
-		if not written:
-			bgzfile.write('#' + '\t'.join(results_header) + '\n')
-			written = True
-		if results_final.shape[0] > 0:
-			results_final.replace({'None': 'NA', 'nan': 'NA'}).to_csv(bgzfile, index=False, sep='\t', header=False, na_rep='NA', float_format='%.5g', columns = results_header, append=True)
-		pkl.close()
-		os.remove(out)
-
-	bgzfile.close()
-	print "indexing out file"
+	# part files are joined by copying their compressed blocks, in cpu order or, with a shared queue
+	# where any cpu may have processed any region, in the original region order
+	print "writing out file"
 	try:
-		pysam.tabix_index(cfg['out'] + '.gz',seq_col=0,start_col=1,end_col=1,force=True)
+		tbx = Fxns.join_parts(cfg['out'] + '.gz', [cfg['out'] + '.cpu' + str(i) for i in xrange(1,cfg['cpus']+1)], by_region = queue is not None, level = cfg['bgzip_level'])
 	except:
-		print Process.Error('failed to generate index for file ' + cfg['out'] + '.gz').out
+		print Process.Error("failed to write bgzip format out file " + cfg['out'] + '.gz').out
+		return 1
+	if tbx is None:
+		print Process.Error("no results found for out file " + cfg['out'] + '.gz').out
 		return 1
+	if not tbx[2]:
+		print "indexing out file"
+		try:
+			pysam.tabix_index(cfg['out'] + '.gz',seq_col=0,start_col=tbx[0],end_col=tbx[1],force=True)
+		except:
+			print Process.Error('failed to generate index for file ' + cfg['out'] + '.gz').out
+			return 1
 
 	if cfg['snpeff']:
 		from ConfigParser import SafeConfigParser
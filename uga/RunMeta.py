@@ -24,6 +24,7 @@ import pysam
 import Fxns
 from Bio import bgzf
 import Process
+import Db
 import multiprocessing as mp
 import sys
 import os
@@ -34,8 +35,9 @@ import pickle
 logging.basicConfig(format='%(asctime)s - %(processName)s - %(name)s - %(message)s',level=logging.DEBUG)
 logger = logging.getLogger("RunMeta")
 
-def process_regions(regions_df, cfg, cpu, log):
-	regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
+def process_regions(regions_df, cfg, cpu, log, queue = None):
+	if queue is None:
+		regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
 
 	if log:
 		try:
@@ -60,14 +62,20 @@ def process_regions(regions_df, cfg, cpu, log):
 
 	variants_found = False
 	meta_written = {}
-	results_final_meta = {}
+	meta_headers = {}
+	parts = {}
 	meta_objs = {}
 	variant_ref = Variant.Ref()
 	for meta in cfg['meta_order']:
 		meta_written[meta] = False
-		results_final_meta[meta] = pd.DataFrame({})
+		try:
+			parts[meta] = Fxns.Part(cfg['out'] + '.cpu' + str(cpu) + '.' + meta, cfg['bgzip_threads'], cfg['bgzip_level'])
+		except:
+			print Process.Error("failed to initialize bgzip format part file " + cfg['out'] + '.cpu' + str(cpu) + '.' + meta).out
+			return 1
 		meta_objs[meta] = Model.SnvMeta(tag = meta, meta = cfg['meta'][meta], type = cfg['meta_type'][meta])
-	for k in xrange(len(regions_df.index)):
+	# regions are taken in order from the cpu assignment or pulled from a queue shared by all cpus
+	for k in (iter(queue.get, None) if queue is not None else xrange(len(regions_df.index))):
 		region_written = False
 		print ''
 		print 'loading region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['region'][k] + ') ...'
@@ -106,19 +114,19 @@ def process_regions(regions_df, cfg, cpu, log):
 		for meta in cfg['meta_order']:
 			meta_objs[meta].calc_meta(results_region)
 			print '   processed meta analysis ' + meta + ' (' + cfg['meta'][meta] + ')'
+			out = meta_objs[meta].out.sort_values(by=['chr','pos'])
+			out['chr'] = out['chr'].astype(np.int64)
+			out['pos'] = out['pos'].astype(np.int64)
 			if not meta_written[meta]:
-				results_final_meta[meta] = meta_objs[meta].out.copy()
+				meta_headers[meta] = out.columns.values
 				meta_written[meta] = True
-			else:
-				results_final_meta[meta] = results_final_meta[meta].merge(meta_objs[meta].out, how='outer')
+			parts[meta].write(out, meta_headers[meta], k, (meta_objs[meta].tbx_start, meta_objs[meta].tbx_end))
 
 	for meta in cfg['meta_order']:
-		results_final_meta[meta] = results_final_meta[meta].sort_values(by=['chr','pos'])
-		results_final_meta[meta]['chr'] = results_final_meta[meta]['chr'].astype(np.int64)
-		results_final_meta[meta]['pos'] = results_final_meta[meta]['pos'].astype(np.int64)
-		pkl = open('/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(cpu) + '.' + meta + '.pkl', "wb")
-		pickle.dump([results_final_meta[meta],meta_objs[meta].metadata,np.array(results_final_meta[meta].columns.values),meta_objs[meta].tbx_start,meta_objs[meta].tbx_end],pkl,protocol=2)
-		pkl.close()
+		if not meta_written[meta]:
+			parts[meta].discard()
+			continue
+		parts[meta].close(meta_objs[meta].metadata + '\t'.join(meta_headers[meta]) + '\n', meta_objs[meta].tbx_start, meta_objs[meta].tbx_end)
 
 	if log:
 		sys.stdout = stdout_orig
@@ -136,29 +144,29 @@ def RunMeta(args):
 	if not cfg['debug']:
 		logging.disable(logging.CRITICAL)
 
-	regions_df = pd.read_table(cfg['region_file'], compression='gzip' if cfg['region_file'].split('.')[-1] == 'gz' else None)
-	regions_df = regions_df[regions_df['job'] == int(cfg['job'])].reset_index(drop=True)
+	regions_df = Db.regions(cfg['region_file'], cfg['job'])
 	return_values = {}
 	meta_out = {}
-	bgzfiles = {}
-	print ''
 	for m in cfg['meta_order']:
-		print "initializing out file for meta " + m
 		meta_out[m] = cfg['out'] + '.' + m
-		try:
-			bgzfiles[m] = bgzf.BgzfWriter(meta_out[m] + '.gz', 'wb')
-		except:
-			print Process.Error("failed to initialize bgzip format out file " + meta_out[m] + '.gz').out
-			return 1
 
+	queue = None
 	if cfg['cpus'] > 1:
+		if cfg['dynamic']:
+			print "initializing shared region queue"
+			manager = mp.Manager()
+			queue = manager.Queue()
+			for k in xrange(len(regions_df.index)):
+				queue.put(k)
+			for i in xrange(cfg['cpus']):
+				queue.put(None)
 		pool = mp.Pool(cfg['cpus']-1)
 		for i in xrange(1,cfg['cpus']):
-			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,))
+			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,queue,))
 			print "submitting job on cpu " + str(i) + " of " + str(cfg['cpus'])
 		pool.close()
 		print "executing job for cpu " + str(cfg['cpus']) + " of " + str(cfg['cpus']) + " via main process"
-		main_return = process_regions(regions_df,cfg,cfg['cpus'],True)
+		main_return = process_regions(regions_df,cfg,cfg['cpus'],True,queue)
 		pool.join()
 
 		if 1 in [return_values[i].get() for i in return_values] or main_return == 1:
@@ -181,28 +189,26 @@ def RunMeta(args):
 		logfile.close()
 		os.remove(cfg['out'] + '.cpu' + str(i) + '.log')
 
+	# part files are joined by copying their compressed blocks, in cpu order or, with a shared queue
+	# where any cpu may have processed any region, in the original region order
+	print ''
 	for m in cfg['meta_order']:
-		written = False
-		for i in xrange(1,cfg['cpus']+1):
-			out_model_meta = '/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(i) + '.' + m + '.pkl'
-			pkl = open(out_model_meta,"rb")
-			results_final_meta,metadata,results_header,tbx_start,tbx_end = pickle.load(pkl)
-			if not written:
-				bgzfiles[m].write(metadata)
-				bgzfiles[m].write('\t'.join(results_header) + '\n')
-				written = True
-			if results_final_meta.shape[0] > 0:
-				results_final_meta.replace({'None': 'NA'}).to_csv(bgzfiles[m], index=False, sep='\t', header=False, na_rep='NA', float_format='%.5g', columns = results_header, append=True)
-			pkl.close()
-			os.remove(out_model_meta)
-
-		bgzfiles[m].close()
-		print "indexing out file for meta " + m
+		print "writing out file for meta " + m
 		try:
-			pysam.tabix_index(meta_out[m] + '.gz',seq_col=0,start_col=tbx_start,end_col=tbx_end,force=True)
+			tbx = Fxns.join_parts(meta_out[m] + '.gz', [cfg['out'] + '.cpu' + str(i) + '.' + m for i in xrange(1,cfg['cpus']+1)], by_region = queue is not None, level = cfg['bgzip_level'])
 		except:
-			print Process.Error('failed to generate index for file ' + meta_out[m] + '.gz').out
+			print Process.Error("failed to write bgzip format out file " + meta_out[m] + '.gz').out
 			return 1
+		if tbx is None:
+			print Process.Error("no results found for out file " + meta_out[m] + '.gz').out
+			return 1
+		if not tbx[2]:
+			print "indexing out file for meta " + m
+			try:
+				pysam.tabix_index(meta_out[m] + '.gz',seq_col=0,start_col=tbx[0],end_col=tbx[1],force=True)
+			except:
+				print Process.Error('failed to generate index for file ' + meta_out[m] + '.gz').out
+				return 1
 
 	print "process complete"
 	return 0
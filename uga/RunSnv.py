@@ -17,12 +17,14 @@ import pandas as pd
 import numpy as np
 import numpy.lib.recfunctions as recfxns
 import Model
+import Geno
 import Parse
 import Variant
 import pysam
 import Fxns
 from Bio import bgzf
 import Process
+import Db
 import multiprocessing as mp
 import sys
 import os
@@ -30,12 +32,14 @@ import resource
 import logging
 import pickle
 import glob
+import time
 
 logging.basicConfig(format='%(asctime)s - %(processName)s - %(name)s - %(message)s',level=logging.DEBUG)
 logger = logging.getLogger("RunSnv")
 
-def process_regions(regions_df, cfg, cpu, log):
-	regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
+def process_regions(regions_df, cfg, cpu, log, queue = None):
+	if queue is None:
+		regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
 
 	if log:
 		try:
@@ -51,68 +55,121 @@ def process_regions(regions_df, cfg, cpu, log):
 
 	models_obj = {}
 	out_all = {}
+	parts = {}
+	written = {}
+	last_chr = {}
+	model_loaded = {}
+	variants_files = {}
 	variant_ref = Variant.Ref()
 	for n in cfg['model_order']:
-		written = False
-		last_chr = None
-		model_loaded = False
-		out_all[n] = pd.DataFrame({})
-		variants_files = glob.glob(cfg['models'][n]['file'].replace('[CHR]','*'))
+		written[n] = False
+		last_chr[n] = None
+		model_loaded[n] = False
+		out_all[n] = Fxns.Accumulator()
+		variants_files[n] = glob.glob(cfg['models'][n]['file'].replace('[CHR]','*'))
+		try:
+			parts[n] = Fxns.Part(cfg['out'] + '.cpu' + str(cpu) + '.' + n, cfg['bgzip_threads'], cfg['bgzip_level'])
+		except:
+			print Process.Error("failed to initialize bgzip format part file " + cfg['out'] + '.cpu' + str(cpu) + '.' + n).out
+			return 1
 
-		for k in xrange(len(regions_df.index)):
-			variants_found = False
-			i = 0
+	# models reading the same variant source are grouped, so that each buffer is read and decoded once
+	# by the first model in the group and every model in the group takes its samples from the same data
+	sources = []
+	groups = []
+	for n in cfg['model_order']:
+		source = (cfg['models'][n]['format'], cfg['models'][n]['file'], cfg['models'][n]['sample'])
+		if source in sources:
+			groups[sources.index(source)].append(n)
+		else:
+			sources.append(source)
+			groups.append([n])
+	buffers = [Fxns.Buffer(cfg['buffer'], cfg['buffer_mem']) for group in groups]
+	readers = [None for group in groups]
 
-			if not model_loaded or (last_chr != regions_df['chr'][k] and len(variants_files) > 1):
-				if not model_loaded:
-					print "\nloading model for " + n if n != '___no_tag___' else "\nloading model"
-				else:
+	# regions are taken in order from the cpu assignment or pulled from a queue shared by all cpus
+	variants_found = False
+	for k in (iter(queue.get, None) if queue is not None else xrange(len(regions_df.index))):
+		for g in xrange(len(groups)):
+			group = groups[g]
+			for n in group:
+				# only the variant source is reopened on a new chromosome, reloading the model if it cannot be reused
+				if model_loaded[n] and last_chr[n] != regions_df['chr'][k] and len(variants_files[n]) > 1:
 					print "\nupdating model for " + n if n != '___no_tag___' else "\nupdating model"
+					try:
+						models_obj[n].update_variants(cfg['models'][n]['file'].replace('[CHR]',str(regions_df['chr'][k])))
+					except Process.Error as err:
+						print err.out
+						model_loaded[n] = False
+				if not model_loaded[n]:
+					print "\nloading model for " + n if n != '___no_tag___' else "\nloading model"
+					try:
+						models_obj[n] = getattr(Model,cfg['models'][n]['fxn'].capitalize())(fxn=cfg['models'][n]['fxn'], 
+																							format=cfg['models'][n]['format'], 
+																							corstr=cfg['models'][n]['corstr'], 
+																							glm_screen=cfg['models'][n]['glm_screen'], 
+																							dep_var=cfg['models'][n]['dep_var'], 
+																							covars=cfg['models'][n]['covars'], 
+																							interact=cfg['models'][n]['interact'], 
+																							reverse=cfg['models'][n]['reverse'], 
+																							all_founders=cfg['models'][n]['all_founders'], 
+																							case_code=cfg['models'][n]['case_code'], 
+																							ctrl_code=cfg['models'][n]['ctrl_code'], 
+																							pheno=cfg['models'][n]['pheno'], 
+																							pheno_cache=cfg['models'][n]['pheno_cache'], 
+																							variants_file=cfg['models'][n]['file'].replace('[CHR]',str(regions_df['chr'][k])), #variants_file=variants_files[0], 
+																							samples_file=cfg['models'][n]['sample'], 
+																							drop_file=cfg['models'][n]['drop'], 
+																							keep_file=cfg['models'][n]['keep'], 
+																							type=cfg['models'][n]['fxn'], 
+																							fid=cfg['models'][n]['fid'], 
+																							iid=cfg['models'][n]['iid'], 
+																							matid=cfg['models'][n]['matid'], 
+																							patid=cfg['models'][n]['patid'], 
+																							adjust_kinship=cfg['models'][n]['adjust_kinship'], 
+																							sex=cfg['models'][n]['sex'], 
+																							male=cfg['models'][n]['male'], 
+																							female=cfg['models'][n]['female'], 
+																							sep=cfg['models'][n]['sep'])
+					except Process.Error as err:
+						print err.out
+						return 1
+					model_loaded[n] = True
+
+			region_found = True
+			for n in group:
+				try:
+					models_obj[n].get_region(regions_df['region'][k])
+				except Process.Error as err:
+					print err.out
+					region_found = False
+			if not region_found:
+				continue
+
+			# each group has its own reader, reopened for each data file (ie. on a new chromosome with a [CHR] file set),
+			# from which buffers are read ahead on a background thread while the models are calculated
+			reader_file = cfg['models'][group[0]]['file'].replace('[CHR]',str(regions_df['chr'][k]))
+			if readers[g] is None or readers[g].filename != reader_file:
 				try:
-					models_obj[n] = getattr(Model,cfg['models'][n]['fxn'].capitalize())(fxn=cfg['models'][n]['fxn'], 
-																						format=cfg['models'][n]['format'], 
-																						corstr=cfg['models'][n]['corstr'], 
-																						dep_var=cfg['models'][n]['dep_var'], 
-																						covars=cfg['models'][n]['covars'], 
-																						interact=cfg['models'][n]['interact'], 
-																						reverse=cfg['models'][n]['reverse'], 
-																						all_founders=cfg['models'][n]['all_founders'], 
-																						case_code=cfg['models'][n]['case_code'], 
-																						ctrl_code=cfg['models'][n]['ctrl_code'], 
-																						pheno=cfg['models'][n]['pheno'], 
-																						variants_file=cfg['models'][n]['file'].replace('[CHR]',str(regions_df['chr'][k])), #variants_file=variants_files[0], 
-																						samples_file=cfg['models'][n]['sample'], 
-																						drop_file=cfg['models'][n]['drop'], 
-																						keep_file=cfg['models'][n]['keep'], 
-																						type=cfg['models'][n]['fxn'], 
-																						fid=cfg['models'][n]['fid'], 
-																						iid=cfg['models'][n]['iid'], 
-																						matid=cfg['models'][n]['matid'], 
-																						patid=cfg['models'][n]['patid'], 
-																						adjust_kinship=cfg['models'][n]['adjust_kinship'], 
-																						sex=cfg['models'][n]['sex'], 
-																						male=cfg['models'][n]['male'], 
-																						female=cfg['models'][n]['female'], 
-																						sep=cfg['models'][n]['sep'])
+					readers[g] = getattr(Geno,cfg['models'][group[0]]['format'].capitalize())(reader_file, cfg['models'][group[0]]['sample'])
 				except Process.Error as err:
 					print err.out
 					return 1
-				model_loaded = True
 
-			try:
-				models_obj[n].get_region(regions_df['region'][k])
-			except Process.Error as err:
-				print err.out
-				pass
-			else:
-				while True:
-					i = i + 1
+			active = list(group)
+			found = dict([(n, False) for n in group])
+			processed = dict([(n, 0) for n in group])
+			buffers[g].limit(len(readers[g].samples))
+			reads = Fxns.ReadAhead(readers[g], regions_df['region'][k], lambda b=buffers[g]: b.size)
+			t = time.time()
+			for shared in reads:
+				for n in list(active):
 					try:
-						models_obj[n].get_snvs(cfg['buffer'])
+						models_obj[n].get_snvs(buffers[g].size, shared)
 					except:
-						if not variants_found:
-							print '   processed 0 variants in region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['region'][k] + ')'
-						break
+						active.remove(n)
+						continue
+					found[n] = True
 					variants_found = True
 
 					if len(cfg['meta_order']) > 0:
@@ -127,49 +184,73 @@ def process_regions(regions_df, cfg, cpu, log):
 										mac_thresh=cfg['models'][n]['mac'], rsq_thresh=cfg['models'][n]['rsq'], hwe_thresh=cfg['models'][n]['hwe'], 
 										hwe_maf_thresh=cfg['models'][n]['hwe_maf'])
 					except:
-						break
+						active.remove(n)
+						continue
 					try:
 						logger.debug("calc_model")
 						models_obj[n].calc_model()
 					except Process.Error as err:
 						print err.out
-						break
+						active.remove(n)
+						continue
 
-					if not written:
-						out_all[n] = models_obj[n].out.copy()
-						written = True
-					else:
-						out_all[n] = out_all[n].append(models_obj[n].out, ignore_index=True)
+					# results are written to the part file as each buffer completes and only held for meta analysis
+					parts[n].write(models_obj[n].out, models_obj[n].results_header, k, (models_obj[n].tbx_start, models_obj[n].tbx_end))
+					if len(cfg['meta_order']) > 0:
+						out = models_obj[n].out.copy()
+						if queue is not None:
+							out['region_idx'] = k
+						out_all[n].append(out)
+					written[n] = True
 					analyzed = len(models_obj[n].variant_stats['filter'][models_obj[n].variant_stats['filter'] == 0])
-					cur_variants = min(i*cfg['buffer'],(i-1)*cfg['buffer'] + models_obj[n].variants.info.shape[0])
-					status = '   processed ' + str(cur_variants) + ' variants in region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['region'][k] + '), ' + str(analyzed) + ' passed filters'
+					processed[n] = processed[n] + models_obj[n].variants.info.shape[0]
+					status = '   processed ' + str(processed[n]) + ' variants in region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['region'][k] + '), ' + str(analyzed) + ' passed filters' + (' (' + n + ')' if n != '___no_tag___' else '')
 					print status
 					sys.stdout.flush()
-			last_chr = regions_df['chr'][k]
+				buffers[g].update(shared[0].shape[0], time.time() - t)
+				t = time.time()
+				if len(active) == 0:
+					break
+			reads.close()
+			for n in group:
+				if not found[n]:
+					print '   processed 0 variants in region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['region'][k] + ')' + (' (' + n + ')' if n != '___no_tag___' else '')
+				last_chr[n] = regions_df['chr'][k]
 
-		pkl = open('/'.join(cfg['out'].split('/')[0:-1]) + '/' + (cfg['out'] + '.cpu' + str(cpu) + '.' + n).split('/')[-1] + '.pkl', "wb")
-		pickle.dump([out_all[n],models_obj[n].metadata,models_obj[n].results_header,models_obj[n].tbx_start,models_obj[n].tbx_end],pkl,protocol=2)
-		pkl.close()
+	for n in cfg['model_order']:
+		if not model_loaded[n]:
+			parts[n].discard()
+			continue
+		out_all[n] = out_all[n].frame()
+		parts[n].close(models_obj[n].metadata + "\t".join(models_obj[n].results_header) + '\n', models_obj[n].tbx_start, models_obj[n].tbx_end)
 
 	print ''
-	if len(cfg['meta_order']) > 0:
+	if len(cfg['meta_order']) > 0 and False not in model_loaded.values():
 		print "preparing data for meta analysis ..."
 		results_all = None
+		keys = ['chr','pos','id','a1','a2'] + (['region_idx'] if queue is not None else [])
 		for n in cfg['model_order']:
 			out_all[n] = out_all[n][[x for x in out_all[n].columns if x not in ['group_id','id_unique','uid']]]
-			out_all[n].columns = np.array([n + '.' + x if x not in ['chr','pos','id','a1','a2'] else x for x in out_all[n].columns])
+			out_all[n].columns = np.array([n + '.' + x if x not in keys else x for x in out_all[n].columns])
 			out_all[n][n + '.n'] = out_all[n].apply(lambda x: round(float(x[n + '.callrate']) * models_obj[n].nunique),axis=1)
 			if n == cfg['model_order'][0]:
 				results_all = out_all[n]
 			else:
-				results_all = results_all.merge(out_all[n],how='outer',on=['chr','pos','id','a1','a2'])
+				results_all = results_all.merge(out_all[n],how='outer',on=keys)
 		for meta in cfg['meta_order']:
 			meta_obj = Model.SnvMeta(tag = meta, meta = cfg['meta'][meta], type = cfg['meta_type'][meta])
 			meta_obj.calc_meta(results_all)
+			if queue is not None:
+				meta_obj.out['region_idx'] = results_all['region_idx'].values
 			print "   processed meta analysis (" + meta + ")"
-			pkl = open('/'.join(cfg['out'].split('/')[0:-1]) + '/' + (cfg['out'] + '.cpu' + str(cpu)).split('/')[-1] + '.' + meta + '.' + 'pkl', "wb")
-			pickle.dump([meta_obj.out,meta_obj.metadata,np.array(meta_obj.out.columns),meta_obj.tbx_start,meta_obj.tbx_end],pkl,protocol=2)
-			pkl.close()
+			header = [x for x in meta_obj.out.columns if x != 'region_idx']
+			part = Fxns.Part(cfg['out'] + '.cpu' + str(cpu) + '.' + meta, cfg['bgzip_threads'], cfg['bgzip_level'])
+			if queue is not None:
+				for k, out in meta_obj.out.groupby('region_idx', sort=True):
+					part.write(out, header, k, (meta_obj.tbx_start, meta_obj.tbx_end))
+			else:
+				part.write(meta_obj.out, header, tbx = (meta_obj.tbx_start, meta_obj.tbx_end))
+			part.close(meta_obj.metadata + '#' + '\t'.join(header) + '\n', meta_obj.tbx_start, meta_obj.tbx_end)
 
 	if log:
 		sys.stdout = stdout_orig
@@ -188,50 +269,66 @@ def RunSnv(args):
 	if not cfg['debug']:
 		logging.disable(logging.CRITICAL)
 
-	regions_df = pd.read_table(cfg['region_file'], compression='gzip' if cfg['region_file'].split('.')[-1] == 'gz' else None)
-	regions_df = regions_df[regions_df['job'] == int(cfg['job'])].reset_index(drop=True)
+	regions_df = Db.regions(cfg['region_file'], cfg['job'])
 	return_values = {}
 	models_out = {}
-	bgzfiles = {}
-	print ''
 	for m in cfg['model_order']:
-		print "initializing out file for model " + m if m != '___no_tag___' else "initializing out file"
 		models_out[m] = cfg['out'] if m == '___no_tag___' else cfg['out'] + '.' + m
-		try:
-			bgzfiles[m] = bgzf.BgzfWriter(models_out[m] + '.gz', 'wb')
-		except:
-			print Process.Error("failed to initialize bgzip format out file " + models_out[m] + '.gz').out
-			return 1
+	for m in cfg['meta_order']:
+		models_out[m] = cfg['out'] + '.' + m
 
-	if len(cfg['meta_order']) > 0:
-		for m in cfg['meta_order']:
-			print "initializing out file for meta " + m
-			models_out[m] = cfg['out'] + '.' + m
-			try:
-				bgzfiles[m] = bgzf.BgzfWriter(models_out[m] + '.gz', 'wb')
-			except:
-				print Process.Error("failed to initialize bgzip format out file " + models_out[m] + '.gz').out
-				return 1
+	# phenotype columns are parsed once and shared with all cpus through memory mapped cache files
+	pheno_caches = {}
+	try:
+		for n in cfg['model_order']:
+			cfg['models'][n]['pheno_cache'] = None
+			if cfg['cpus'] > 1:
+				p_names, p_dtypes = Model.pheno_fields(Model.model_columns(cfg['models'][n]['dep_var'], cfg['models'][n]['covars'], cfg['models'][n]['interact']), 
+														cfg['models'][n]['fid'], cfg['models'][n]['iid'], cfg['models'][n]['matid'], cfg['models'][n]['patid'], cfg['models'][n]['sex'])
+				key = (cfg['models'][n]['pheno'], cfg['models'][n]['sep'], p_names, p_dtypes)
+				if not key in pheno_caches:
+					pheno_caches[key] = cfg['out'] + '.pheno' + str(len(pheno_caches) + 1) + '.npy'
+					print "caching phenotype file " + os.path.basename(cfg['models'][n]['pheno'])
+					try:
+						Model.cache_pheno(pheno_caches[key], cfg['models'][n]['pheno'], p_names, p_dtypes, cfg['models'][n]['sep'])
+					except Process.Error as err:
+						print err.out
+						return 1
+				cfg['models'][n]['pheno_cache'] = pheno_caches[key]
 
-	if cfg['cpus'] > 1:
-		pool = mp.Pool(cfg['cpus']-1)
-		for i in xrange(1,cfg['cpus']):
-			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,))
-			print "submitting job on cpu " + str(i) + " of " + str(cfg['cpus'])
-		pool.close()
-		print "executing job for cpu " + str(cfg['cpus']) + " of " + str(cfg['cpus']) + " via main process"
-		main_return = process_regions(regions_df,cfg,cfg['cpus'],True)
-		pool.join()
+		queue = None
+		if cfg['cpus'] > 1:
+			if cfg['dynamic']:
+				print "initializing shared region queue"
+				manager = mp.Manager()
+				queue = manager.Queue()
+				for k in xrange(len(regions_df.index)):
+					queue.put(k)
+				for i in xrange(cfg['cpus']):
+					queue.put(None)
+			pool = mp.Pool(cfg['cpus']-1)
+			for i in xrange(1,cfg['cpus']):
+				return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,queue,))
+				print "submitting job on cpu " + str(i) + " of " + str(cfg['cpus'])
+			pool.close()
+			print "executing job for cpu " + str(cfg['cpus']) + " of " + str(cfg['cpus']) + " via main process"
+			main_return = process_regions(regions_df,cfg,cfg['cpus'],True,queue)
+			pool.join()
 
-		if 1 in [return_values[i].get() for i in return_values] or main_return == 1:
-			print Process.Error("error detected, see log files").out
-			return 1
+			if 1 in [return_values[i].get() for i in return_values] or main_return == 1:
+				print Process.Error("error detected, see log files").out
+				return 1
 
-	else:
-		main_return = process_regions(regions_df,cfg,1,True)
-		if main_return == 1:
-			print Process.Error("error detected, see log files").out
-			return 1
+		else:
+			main_return = process_regions(regions_df,cfg,1,True)
+			if main_return == 1:
+				print Process.Error("error detected, see log files").out
+				return 1
+	finally:
+		# caches are removed however the cpus finish, so that none are left in the output directory
+		for f in pheno_caches.values():
+			if os.path.exists(f):
+				os.remove(f)
 
 	for i in xrange(1,cfg['cpus']+1):
 		try:
@@ -243,50 +340,24 @@ def RunSnv(args):
 		logfile.close()
 		os.remove(cfg['out'] + '.cpu' + str(i) + '.log')
 
-	for m in cfg['model_order']:
-		written = False
-		for i in xrange(1,cfg['cpus']+1):
-			regions_cpu_df = regions_df[regions_df['cpu'] == i].reset_index(drop=True)
-			out_model_range = '/'.join(cfg['out'].split('/')[0:-1]) + '/' + (cfg['out'] + '.cpu' + str(i) + '.' + m).split('/')[-1] + '.pkl'
-			pkl = open(out_model_range,"rb")
-			results_final,metadata,results_header,tbx_start,tbx_end = pickle.load(pkl)
-			if not written:
-				bgzfiles[m].write(metadata)
-				bgzfiles[m].write("\t".join(results_header) + '\n')
-				written = True
-			if results_final.shape[0] > 0:
-				results_final.replace({'None': 'NA'}).to_csv(bgzfiles[m], index=False, sep='\t', header=False, na_rep='NA', float_format='%.5g', columns = results_header, append=True)
-			pkl.close()
-			os.remove(out_model_range)
-
-		bgzfiles[m].close()
-		print "indexing out file for model " + m if m != '___no_tag___' else "indexing out file"
+	# part files are joined by copying their compressed blocks, in cpu order or, with a shared queue
+	# where any cpu may have processed any region, in the original region order
+	print ''
+	for m in cfg['model_order'] + cfg['meta_order']:
+		label = ('model ' + m if m in cfg['model_order'] else 'meta ' + m) if m != '___no_tag___' else None
+		print "writing out file for " + label if label is not None else "writing out file"
 		try:
-			pysam.tabix_index(models_out[m] + '.gz',seq_col=0,start_col=tbx_start,end_col=tbx_end,force=True)
+			tbx = Fxns.join_parts(models_out[m] + '.gz', [cfg['out'] + '.cpu' + str(i) + '.' + m for i in xrange(1,cfg['cpus']+1)], by_region = queue is not None, level = cfg['bgzip_level'])
 		except:
-			print Process.Error('failed to generate index for file ' + models_out[m] + '.gz').out
+			print Process.Error("failed to write bgzip format out file " + models_out[m] + '.gz').out
 			return 1
-
-	if len(cfg['meta_order']) > 0:
-		for m in cfg['meta_order']:
-			written = False
-			for i in xrange(1,cfg['cpus']+1):
-				out_model_meta = '/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(i) + '.' + m + '.pkl'
-				pkl = open(out_model_meta,"rb")
-				results_final_meta,metadata,results_header,tbx_start,tbx_end = pickle.load(pkl)
-				if not written:
-					bgzfiles[m].write(metadata)
-					bgzfiles[m].write('#' + '\t'.join(results_header) + '\n')
-					written = True
-				if results_final_meta.shape[0] > 0:
-					results_final_meta.replace({'None': 'NA'}).to_csv(bgzfiles[m], index=False, sep='\t', header=False, na_rep='NA', float_format='%.5g', columns = results_header, append=True)
-				pkl.close()
-				os.remove(out_model_meta)
-
-			bgzfiles[m].close()
-			print "indexing out file for meta " + m
+		if tbx is None:
+			print Process.Error("no results found for out file " + models_out[m] + '.gz').out
+			return 1
+		if not tbx[2]:
+			print "indexing out file for " + label if label is not None else "indexing out file"
 			try:
-				pysam.tabix_index(models_out[m] + '.gz',seq_col=0,start_col=tbx_start,end_col=tbx_end,force=True)
+				pysam.tabix_index(models_out[m] + '.gz',seq_col=0,start_col=tbx[0],end_col=tbx[1],force=True)
 			except:
 				print Process.Error('failed to generate index for file ' + models_out[m] + '.gz').out
 				return 1
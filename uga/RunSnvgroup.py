@@ -22,6 +22,7 @@ import pysam
 import Fxns
 from Bio import bgzf
 import Process
+import Db
 import multiprocessing as mp
 import sys
 import os
@@ -33,8 +34,9 @@ import glob
 logging.basicConfig(format='%(asctime)s - %(processName)s - %(name)s - %(message)s',level=logging.DEBUG)
 logger = logging.getLogger("RunSnvgroup")
 
-def process_regions(regions_df, cfg, cpu, log):
-	regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
+def process_regions(regions_df, cfg, cpu, log, queue = None):
+	if queue is None:
+		regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
 
 	if log:
 		try:
@@ -49,35 +51,44 @@ def process_regions(regions_df, cfg, cpu, log):
 	variants_found = False
 	model_written = {}
 	meta_written = {}
-	results_final_models = {}
+	parts = {}
 	results_final_models_headers = {}
-	results_final_meta = {}
 	meta_objs = {}
 	variants_files = {}
 	variant_ref = Variant.Ref()
 	model_loaded = {}
 	for n in cfg['model_order']:
 		model_written[n] = False
-		results_final_models[n] = pd.DataFrame({})
 		variants_files[n] = glob.glob(cfg['models'][n]['file'].replace('[CHR]','*'))
 		model_loaded[n] = False
 	for meta in cfg['meta_order']:
 		meta_written[meta] = False
-		results_final_meta[meta] = pd.DataFrame({})
 		meta_objs[meta] = getattr(Model,cfg['models'][cfg['meta'][meta].split('+')[0]]['fxn'].capitalize() + 'Meta')(tag = meta, meta = cfg['meta'][meta])
+	for n in cfg['model_order'] + cfg['meta_order']:
+		try:
+			parts[n] = Fxns.Part(cfg['out'] + '.cpu' + str(cpu) + '.' + n, cfg['bgzip_threads'], cfg['bgzip_level'])
+		except:
+			print Process.Error("failed to initialize bgzip format part file " + cfg['out'] + '.cpu' + str(cpu) + '.' + n).out
+			return 1
 	last_chr = None
-	for k in xrange(len(regions_df.index)):
+	# regions are taken in order from the cpu assignment or pulled from a queue shared by all cpus
+	for k in (iter(queue.get, None) if queue is not None else xrange(len(regions_df.index))):
 		meta_incl = []
 		region_written = False
 		results_region = pd.DataFrame({})
 		print ''
 		print 'loading region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['group_id'][k] + ": " + regions_df['region'][k] + ') ...'
 		for n in cfg['model_order']:
-			if not model_loaded[n] or (last_chr != regions_df['chr'][k] and len(variants_files[n]) > 1):
-				if not model_loaded[n]:
-					print "\nloading model for " + n if n != '___no_tag___' else "\nloading model"
-				else:
-					print "\nupdating model for " + n if n != '___no_tag___' else "\nupdating model"
+			# only the variant source is reopened on a new chromosome, reloading the model if it cannot be reused
+			if model_loaded[n] and last_chr != regions_df['chr'][k] and len(variants_files[n]) > 1:
+				print "\nupdating model for " + n if n != '___no_tag___' else "\nupdating model"
+				try:
+					models_obj[n].update_variants(cfg['models'][n]['file'].replace('[CHR]',str(regions_df['chr'][k])))
+				except Process.Error as err:
+					print err.out
+					model_loaded[n] = False
+			if not model_loaded[n]:
+				print "\nloading model for " + n if n != '___no_tag___' else "\nloading model"
 				try:
 					models_obj[n] = getattr(Model,cfg['models'][n]['fxn'].capitalize())(fxn=cfg['models'][n]['fxn'], 
 																						snvgroup_map=cfg['snvgroup_map'], 
@@ -94,6 +105,7 @@ def process_regions(regions_df, cfg, cpu, log):
 																						case_code=cfg['models'][n]['case_code'], 
 																						ctrl_code=cfg['models'][n]['ctrl_code'], 
 																						pheno=cfg['models'][n]['pheno'], 
+																						pheno_cache=cfg['models'][n]['pheno_cache'], 
 																						variants_file=cfg['models'][n]['file'].replace('[CHR]',str(regions_df['chr'][k])), # variants_file=cfg['models'][n]['file']
 																						samples_file=cfg['models'][n]['sample'], 
 																						drop_file=cfg['models'][n]['drop'], 
@@ -151,11 +163,9 @@ def process_regions(regions_df, cfg, cpu, log):
 					meta_incl.append(n)
 
 			if not model_written[n]:
-				results_final_models[n] = models_obj[n].out
 				results_final_models_headers[n] = models_obj[n].out.columns.values
 				model_written[n] = True
-			else:
-				results_final_models[n] = results_final_models[n].append(models_obj[n].out, ignore_index=True)
+			parts[n].write(models_obj[n].out, results_final_models_headers[n], k, (models_obj[n].tbx_start, models_obj[n].tbx_end))
 
 			if len(cfg['meta_order']) > 0:
 				models_obj[n].tag_results(n)
@@ -176,27 +186,25 @@ def process_regions(regions_df, cfg, cpu, log):
 			for meta in cfg['meta_order']:
 				meta_objs[meta].calc_meta(regions_df['chr'][k], regions_df['start'][k], regions_df['end'][k], regions_df['group_id'][k], models_obj[cfg['meta'][meta].split('+')[0]],meta_incl)
 				print '   processed meta analysis ' + meta + ' (' + "+".join([x for x in cfg['meta'][meta].split('+') if x in meta_incl]) + ')'
-				if not meta_written[meta]:
-					results_final_meta[meta] = meta_objs[meta].out.copy()
-					meta_written[meta] = True
-				else:
-					results_final_meta[meta] = results_final_meta[meta].merge(meta_objs[meta].out, how='outer')
+				out = meta_objs[meta].out.copy()
+				out['chr'] = out['chr'].astype(np.int64)
+				out['start'] = out['start'].astype(np.int64)
+				out['end'] = out['end'].astype(np.int64)
+				parts[meta].write(out, out.columns.values, k, (meta_objs[meta].tbx_start, meta_objs[meta].tbx_end))
+				meta_written[meta] = True
 		last_chr = regions_df['chr'][k]
 
 	for n in cfg['model_order']:
-		pkl = open('/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(cpu) + '.' + n + '.pkl', "wb")
-		pickle.dump([results_final_models[n].sort_values(by=['chr','start']),models_obj[n].metadata,results_final_models_headers[n],models_obj[n].tbx_start,models_obj[n].tbx_end],pkl,protocol=2)
-		pkl.close()
+		if not model_loaded[n]:
+			parts[n].discard()
+			continue
+		parts[n].close(models_obj[n].metadata + "\t".join(results_final_models_headers[n]) + '\n', models_obj[n].tbx_start, models_obj[n].tbx_end)
 
-	if len(cfg['meta_order']) > 0:
-		for meta in cfg['meta_order']:
-			results_final_meta[meta] = results_final_meta[meta].sort_values(by=['chr','start'])
-			results_final_meta[meta]['chr'] = results_final_meta[meta]['chr'].astype(np.int64)
-			results_final_meta[meta]['start'] = results_final_meta[meta]['start'].astype(np.int64)
-			results_final_meta[meta]['end'] = results_final_meta[meta]['end'].astype(np.int64)
-			pkl = open('/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(cpu) + '.' + meta + '.pkl', "wb")
-			pickle.dump([results_final_meta[meta],meta_objs[meta].metadata,np.array(results_final_meta[meta].columns.values),meta_objs[meta].tbx_start,meta_objs[meta].tbx_end],pkl,protocol=2)
-			pkl.close()
+	for meta in cfg['meta_order']:
+		if False in model_loaded.values():
+			parts[meta].discard()
+			continue
+		parts[meta].close(meta_objs[meta].metadata + '\t'.join(meta_objs[meta].out.columns.values) + '\n', meta_objs[meta].tbx_start, meta_objs[meta].tbx_end)
 
 	if log:
 		sys.stdout = stdout_orig
@@ -214,49 +222,66 @@ def RunSnvgroup(args):
 	if not cfg['debug']:
 		logging.disable(logging.CRITICAL)
 
-	regions_df = pd.read_table(cfg['region_file'], compression='gzip' if cfg['region_file'].split('.')[-1] == 'gz' else None)
-	regions_df = regions_df[regions_df['job'] == int(cfg['job'])].reset_index(drop=True)
+	regions_df = Db.regions(cfg['region_file'], cfg['job'])
 	return_values = {}
 	models_out = {}
-	bgzfiles = {}
-	print ''
 	for m in cfg['model_order']:
-		print "initializing out file for model " + m
 		models_out[m] = cfg['out'] if m == '___no_tag___' else cfg['out'] + '.' + m
-		try:
-			bgzfiles[m] = bgzf.BgzfWriter(models_out[m] + '.gz', 'wb')
-		except:
-			print Process.Error("failed to initialize bgzip format out file " + models_out[m] + '.gz').out
-			return 1
-	if len(cfg['meta_order']) > 0:
-		for m in cfg['meta_order']:
-			print "initializing out file for meta " + m
-			models_out[m] = cfg['out'] + '.' + m
-			try:
-				bgzfiles[m] = bgzf.BgzfWriter(models_out[m] + '.gz', 'wb')
-			except:
-				print Process.Error("failed to initialize bgzip format out file " + models_out[m] + '.gz').out
-				return 1
-
-	if cfg['cpus'] > 1:
-		pool = mp.Pool(cfg['cpus']-1)
-		for i in xrange(1,cfg['cpus']):
-			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,))
-			print "submitting job on cpu " + str(i) + " of " + str(cfg['cpus'])
-		pool.close()
-		print "executing job for cpu " + str(cfg['cpus']) + " of " + str(cfg['cpus']) + " via main process"
-		main_return = process_regions(regions_df,cfg,cfg['cpus'],True)
-		pool.join()
+	for m in cfg['meta_order']:
+		models_out[m] = cfg['out'] + '.' + m
 
-		if 1 in [return_values[i].get() for i in return_values] or main_return == 1:
-			print Process.Error("error detected, see log files").out
-			return 1
+	# phenotype columns are parsed once and shared with all cpus through memory mapped cache files
+	pheno_caches = {}
+	try:
+		for n in cfg['model_order']:
+			cfg['models'][n]['pheno_cache'] = None
+			if cfg['cpus'] > 1:
+				p_names, p_dtypes = Model.pheno_fields(Model.model_columns(cfg['models'][n]['dep_var'], cfg['models'][n]['covars'], None), 
+														cfg['models'][n]['fid'], cfg['models'][n]['iid'], cfg['models'][n]['matid'], cfg['models'][n]['patid'], cfg['models'][n]['sex'])
+				key = (cfg['models'][n]['pheno'], cfg['models'][n]['sep'], p_names, p_dtypes)
+				if not key in pheno_caches:
+					pheno_caches[key] = cfg['out'] + '.pheno' + str(len(pheno_caches) + 1) + '.npy'
+					print "caching phenotype file " + os.path.basename(cfg['models'][n]['pheno'])
+					try:
+						Model.cache_pheno(pheno_caches[key], cfg['models'][n]['pheno'], p_names, p_dtypes, cfg['models'][n]['sep'])
+					except Process.Error as err:
+						print err.out
+						return 1
+				cfg['models'][n]['pheno_cache'] = pheno_caches[key]
+
+		queue = None
+		if cfg['cpus'] > 1:
+			if cfg['dynamic']:
+				print "initializing shared region queue"
+				manager = mp.Manager()
+				queue = manager.Queue()
+				for k in xrange(len(regions_df.index)):
+					queue.put(k)
+				for i in xrange(cfg['cpus']):
+					queue.put(None)
+			pool = mp.Pool(cfg['cpus']-1)
+			for i in xrange(1,cfg['cpus']):
+				return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,queue,))
+				print "submitting job on cpu " + str(i) + " of " + str(cfg['cpus'])
+			pool.close()
+			print "executing job for cpu " + str(cfg['cpus']) + " of " + str(cfg['cpus']) + " via main process"
+			main_return = process_regions(regions_df,cfg,cfg['cpus'],True,queue)
+			pool.join()
+
+			if 1 in [return_values[i].get() for i in return_values] or main_return == 1:
+				print Process.Error("error detected, see log files").out
+				return 1
 
-	else:
-		main_return = process_regions(regions_df,cfg,1,True)
-		if main_return == 1:
-			print Process.Error("error detected, see log files").out
-			return 1
+		else:
+			main_return = process_regions(regions_df,cfg,1,True)
+			if main_return == 1:
+				print Process.Error("error detected, see log files").out
+				return 1
+	finally:
+		# caches are removed however the cpus finish, so that none are left in the output directory
+		for f in pheno_caches.values():
+			if os.path.exists(f):
+				os.remove(f)
 
 	for i in xrange(1,cfg['cpus']+1):
 		try:
@@ -268,51 +293,24 @@ def RunSnvgroup(args):
 		logfile.close()
 		os.remove(cfg['out'] + '.cpu' + str(i) + '.log')
 
-	for m in cfg['model_order']:
-		written = False
-		for i in xrange(1,cfg['cpus']+1):
-			out_model_cpu = '/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(i) + '.' + m + '.pkl'
-			pkl = open(out_model_cpu,"rb")
-			results_final,metadata,results_header,tbx_start,tbx_end = pickle.load(pkl)
-			if not written:
-				bgzfiles[m].write(metadata)
-				bgzfiles[m].write("\t".join(results_header) + '\n')
-				written = True
-			if results_final.shape[0] > 0:
-				results_final.replace({'None': 'NA'}).to_csv(bgzfiles[m], index=False, sep='\t', header=False, na_rep='NA', float_format='%.5g', columns = results_header, append=True)
-			pkl.close()
-			os.remove(out_model_cpu)
-
-		bgzfiles[m].close()
-
-		print "indexing out file for model " + m if m != '___no_tag___' else "indexing out file"
+	# part files are joined by copying their compressed blocks, in cpu order or, with a shared queue
+	# where any cpu may have processed any region, in the original region order
+	print ''
+	for m in cfg['model_order'] + cfg['meta_order']:
+		label = ('model ' + m if m in cfg['model_order'] else 'meta ' + m) if m != '___no_tag___' else None
+		print "writing out file for " + label if label is not None else "writing out file"
 		try:
-			pysam.tabix_index(models_out[m] + '.gz',seq_col=0,start_col=tbx_start,end_col=tbx_end,force=True)
+			tbx = Fxns.join_parts(models_out[m] + '.gz', [cfg['out'] + '.cpu' + str(i) + '.' + m for i in xrange(1,cfg['cpus']+1)], by_region = queue is not None, level = cfg['bgzip_level'])
 		except:
-			print Process.Error('failed to generate index for file ' + models_out[m] + '.gz').out
+			print Process.Error("failed to write bgzip format out file " + models_out[m] + '.gz').out
 			return 1
-
-	if len(cfg['meta_order']) > 0:
-		for m in cfg['meta_order']:
-			written = False
-			for i in xrange(1,cfg['cpus']+1):
-				out_model_meta = '/'.join(cfg['out'].split('/')[0:-1]) + '/' + cfg['out'].split('/')[-1] + '.cpu' + str(i) + '.' + m + '.pkl'
-				pkl = open(out_model_meta,"rb")
-				results_final_meta,metadata,results_header,tbx_start,tbx_end = pickle.load(pkl)
-				if not written:
-					bgzfiles[m].write(metadata)
-					bgzfiles[m].write('\t'.join(results_header) + '\n')
-					written = True
-				if results_final_meta.shape[0] > 0:
-					results_final_meta.replace({'None': 'NA'}).to_csv(bgzfiles[m], index=False, sep='\t', header=False, na_rep='NA', float_format='%.5g', columns = results_header, append=True)
-				pkl.close()
-				os.remove(out_model_meta)
-
-			bgzfiles[m].close()
-
-			print "indexing out file for meta " + m
+		if tbx is None:
+			print Process.Error("no results found for out file " + models_out[m] + '.gz').out
+			return 1
+		if not tbx[2]:
+			print "indexing out file for " + label if label is not None else "indexing out file"
 			try:
-				pysam.tabix_index(models_out[m] + '.gz',seq_col=0,start_col=tbx_start,end_col=tbx_end,force=True)
+				pysam.tabix_index(models_out[m] + '.gz',seq_col=0,start_col=tbx[0],end_col=tbx[1],force=True)
 			except:
 				print Process.Error('failed to generate index for file ' + models_out[m] + '.gz').out
 				return 1
@@ -16,8 +16,9 @@
 import pandas as pd
 import numpy as np
 import Parse
-from Bio import bgzf
+import Tabix
 import Process
+import Db
 import subprocess
 import multiprocessing as mp
 import sys
@@ -31,8 +32,9 @@ import pysam
 logging.basicConfig(format='%(asctime)s - %(processName)s - %(name)s - %(message)s',level=logging.DEBUG)
 logger = logging.getLogger("RunSnvgroup")
 
-def process_regions(regions_df, cfg, cpu, log):
-	regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
+def process_regions(regions_df, cfg, cpu, log, queue = None):
+	if queue is None:
+		regions_df = regions_df[regions_df['cpu'] == cpu].reset_index(drop=True)
 
 	if log:
 		try:
@@ -48,7 +50,8 @@ def process_regions(regions_df, cfg, cpu, log):
 	print 'sourcing bash script ' + cfg['source']
 	with open(cfg['source'],'r') as s:
 		base_cmd = s.read()
-	for k in xrange(len(regions_df.index)):
+	# regions are taken in order from the cpu assignment or pulled from a queue shared by all cpus
+	for k in (iter(queue.get, None) if queue is not None else xrange(len(regions_df.index))):
 		print ''
 		print 'loading region ' + str(k+1) + '/' + str(len(regions_df.index)) + ' (' + regions_df['region'][k] + ') ...'
 		cmd = base_cmd.replace('UGA_FILE',cfg['file']).replace('UGA_OUT',cfg['out'] + '.cpu' + str(cpu) + '.chr' + regions_df['region'][k].replace(':','bp')).replace('UGA_REGION_BP',regions_df['region'][k].replace(':','bp')).replace('UGA_REGION',regions_df['region'][k]).replace('UGA_OUT',cfg['out'])
@@ -84,25 +87,33 @@ def RunTools(args):
 	if not cfg['debug']:
 		logging.disable(logging.CRITICAL)
 
-	regions_df = pd.read_table(cfg['region_file'], compression='gzip' if cfg['region_file'].split('.')[-1] == 'gz' else None)
-	regions_df = regions_df[regions_df['job'] == int(cfg['job'])].reset_index(drop=True)
+	regions_df = Db.regions(cfg['region_file'], cfg['job'])
 	return_values = {}
 	print ''
 	print "initializing out file"
 	try:
-		bgzfile = bgzf.BgzfWriter(cfg['out'] + '.gz', 'wb')
+		bgzfile = Tabix.Writer(cfg['out'] + '.gz', threads=cfg['bgzip_threads'], level=cfg['bgzip_level'], preset='vcf')
 	except:
 		print Process.Error("failed to initialize bgzip format out file " + cfg['out'] + '.gz').out
 		return 1
 
+	queue = None
 	if cfg['cpus'] > 1:
+		if cfg['dynamic']:
+			print "initializing shared region queue"
+			manager = mp.Manager()
+			queue = manager.Queue()
+			for k in xrange(len(regions_df.index)):
+				queue.put(k)
+			for i in xrange(cfg['cpus']):
+				queue.put(None)
 		pool = mp.Pool(cfg['cpus']-1)
 		for i in xrange(1,cfg['cpus']):
-			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,))
+			return_values[i] = pool.apply_async(process_regions, args=(regions_df,cfg,i,True,queue,))
 			print "submitting job on cpu " + str(i) + " of " + str(cfg['cpus'])
 		pool.close()
 		print "executing job for cpu " + str(cfg['cpus']) + " of " + str(cfg['cpus']) + " via main process"
-		main_return = process_regions(regions_df,cfg,cfg['cpus'],True)
+		main_return = process_regions(regions_df,cfg,cfg['cpus'],True,queue)
 		pool.join()
 
 		if 1 in [return_values[i].get() for i in return_values] or main_return == 1:
@@ -125,9 +136,11 @@ def RunTools(args):
 		logfile.close()
 		os.remove(cfg['out'] + '.cpu' + str(i) + '.log')
 
+	# with a shared queue any cpu may have processed any region, so region outputs are
+	# collected in the original region order from whichever cpu produced them
 	written = False
-	for i in xrange(1,cfg['cpus']+1):
-		cpu_regions_df = regions_df[regions_df['cpu'] == i].reset_index()
+	for i in (xrange(1,cfg['cpus']+1) if queue is None else ['*']):
+		cpu_regions_df = regions_df[regions_df['cpu'] == i].reset_index() if queue is None else regions_df
 		for j in xrange(0,len(cpu_regions_df.index)):
 			f_temp=glob.glob(cfg['out'] + '.cpu' + str(i) + '.chr' + cpu_regions_df['region'][j].replace(':','bp') + '*.gz')[0]
 			try:
@@ -136,23 +149,20 @@ def RunTools(args):
 				print Process.Error("failed to load vcf file " + f_temp)
 				return 1
 			if not written:
-				for row in h.header:
-					bgzfile.write(str(row) + '\n')
+				bgzfile.write(''.join([str(row) + '\n' for row in h.header]))
 				written = True
 			h_iter = h.fetch(region=str(cpu_regions_df['chr'][j]))
-			for row in h_iter:
-				bgzfile.write(str(row) + '\n')
+			bgzfile.write_vcf(h_iter)
 			for f in glob.glob(cfg['out'] + '.cpu' + str(i) + '.chr' + cpu_regions_df['region'][j].replace(':','bp') + '.*'):
 				os.remove(f)
 
-	bgzfile.close()
-
-	print "indexing out file"
-	try:
-		pysam.tabix_index(cfg['out'] + '.gz',preset="vcf",force=True)
-	except:
-		print Process.Error('failed to generate index').out
-		return 1
+	if not bgzfile.close():
+		print "indexing out file"
+		try:
+			pysam.tabix_index(cfg['out'] + '.gz',preset="vcf",force=True)
+		except:
+			print Process.Error('failed to generate index').out
+			return 1
 
 	print "process complete"
 	return 0
@@ -0,0 +1,128 @@
+## Copyright (c) 2015 Ryan Koesterer GNU General Public License v3
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+# relative cost per variant per sample for each model type, with an additional
+# quadratic term in the number of variants per group for kernel based group tests
+MODEL_WEIGHTS = {'score': 1.0, 'lm': 10.0, 'glm': 20.0, 'gee': 50.0, 'skat': 2.0, 'skato': 4.0, 'burden': 1.0, 'neff': 1.0}
+MODEL_WEIGHTS_GROUP = {'skat': 0.02, 'skato': 0.1}
+
+# fixed cost of loading a region, in variants
+REGION_OVERHEAD = 50
+
+def count_samples(pheno):
+	try:
+		with open(pheno) as f:
+			return max(sum(1 for line in f) - 1, 1)
+	except (IOError, TypeError):
+		return 1
+
+def cost(jobs_df, cfg):
+	# estimated relative cost of each region in jobs_df from variant count (column n), sample count and model type
+	#   regions without a variant count are assigned the average variant density of the remaining regions
+	#   (or a density of 1 if none are known) times their length
+	n = np.array(jobs_df['n'], dtype=np.float64) if 'n' in jobs_df.columns else np.repeat(np.nan, jobs_df.shape[0])
+	length = np.array(jobs_df['end'] - jobs_df['start'] + 1, dtype=np.float64)
+	known = ~np.isnan(n)
+	density = n[known].sum() / length[known].sum() if known.any() and length[known].sum() > 0 else 1.0
+	n[~known] = length[~known] * density
+	n = n + REGION_OVERHEAD
+	out = np.zeros(jobs_df.shape[0])
+	if 'models' in cfg:
+		samples = {}
+		for m in cfg['models']:
+			fxn = cfg['models'][m]['fxn']
+			if not cfg['models'][m]['pheno'] in samples:
+				samples[cfg['models'][m]['pheno']] = count_samples(cfg['models'][m]['pheno'])
+			out = out + samples[cfg['models'][m]['pheno']] * (MODEL_WEIGHTS.get(fxn, 1.0) * n + MODEL_WEIGHTS_GROUP.get(fxn, 0.0) * n ** 2)
+	elif 'files' in cfg:
+		out = n * max(len(cfg['files']), 1)
+	else:
+		out = n
+	return out
+
+def clusters(jobs_df, costs, cap):
+	# label runs of overlapping regions in jobs_df (ordered by chr and start), so that overlapping snvgroups
+	# can be assigned to the same job and cpu, starting a new cluster when a region does not overlap the
+	# current cluster or when the cluster cost would exceed cap
+	#   returns the 0-based cluster for each region
+	costs = np.asarray(costs, dtype=np.float64)
+	chrs = np.asarray(jobs_df['chr'])
+	starts = np.asarray(jobs_df['start'])
+	ends = np.asarray(jobs_df['end'])
+	out = np.zeros(len(costs), dtype=np.int64)
+	c = 0
+	end = None
+	total = 0.0
+	for i in xrange(len(costs)):
+		if i > 0 and (chrs[i] != chrs[i-1] or starts[i] > end or total + costs[i] > cap):
+			c += 1
+			end = None
+			total = 0.0
+		end = ends[i] if end is None else max(end, ends[i])
+		total += costs[i]
+		out[i] = c
+	return out
+
+def pack(costs, k, clusters = None):
+	# split an ordered list of items into min(k, len(costs)) contiguous blocks minimizing the largest block cost
+	#   blocks stay contiguous so that results from consecutive jobs and cpus remain in genomic order
+	#   items sharing a cluster (see clusters) are always placed in the same block
+	#   returns the 0-based block for each item
+	if clusters is not None:
+		labels, inverse = np.unique(np.asarray(clusters), return_inverse=True)
+		return pack(np.bincount(inverse, weights=np.asarray(costs, dtype=np.float64)), k)[inverse]
+	costs = np.asarray(costs, dtype=np.float64)
+	k = min(k, len(costs))
+	if k <= 1:
+		return np.zeros(len(costs), dtype=np.int64)
+	cum = np.cumsum(costs)
+	def cut(cap):
+		breaks = []
+		last = 0.0
+		i = 0
+		while i < len(costs):
+			j = int(np.searchsorted(cum, last + cap, side='right'))
+			if j <= i:
+				j = i + 1
+			breaks.append(j)
+			last = cum[j-1]
+			i = j
+		return breaks
+	lo = max(costs.max(), cum[-1] / k)
+	hi = cum[-1]
+	for it in xrange(50):
+		mid = (lo + hi) / 2.0
+		if len(cut(mid)) <= k:
+			hi = mid
+		else:
+			lo = mid
+		if hi - lo <= 1e-6 * hi:
+			break
+	breaks = cut(hi)
+	# split the most expensive blocks until exactly k blocks exist
+	while len(breaks) < k:
+		starts = [0] + breaks[:-1]
+		sizes = [cum[e-1] - (cum[s-1] if s > 0 else 0.0) if e - s > 1 else -1.0 for s, e in zip(starts, breaks)]
+		b = int(np.argmax(sizes))
+		s, e = starts[b], breaks[b]
+		half = (cum[s-1] if s > 0 else 0.0) + sizes[b] / 2.0
+		m = min(max(int(np.searchsorted(cum, half, side='left')) + 1, s + 1), e - 1)
+		breaks.insert(b, m)
+	out = np.zeros(len(costs), dtype=np.int64)
+	for b in breaks[:-1]:
+		out[b:] += 1
+	return out
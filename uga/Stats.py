@@ -0,0 +1,225 @@
+## Copyright (c) 2015 Ryan Koesterer GNU General Public License v3
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import scipy.stats
+
+# singular values of a design below RANK_TOL times the largest are treated as zero (aliased terms, as in R)
+RANK_TOL = 1e-10
+
+def design(pheno, covars = None):
+	# design matrix for an intercept and the right hand side terms of a model formula (ie. age+factor(sex))
+	#   factor(x) terms are coded as indicators for all but the first (sorted) level of x
+	cols = [np.ones(pheno.shape[0])]
+	if covars is not None:
+		for term in covars.split('+'):
+			if term.startswith('factor('):
+				x = pheno[term.replace('factor(','').replace(')','')]
+				cols.extend([(x == l).astype('float64') for l in np.unique(x)[1:]])
+			else:
+				cols.append(np.asarray(pheno[term], dtype='float64'))
+	return np.column_stack(cols)
+
+def basis(X):
+	# orthonormal basis for the column space of X, dropping aliased columns
+	u, s, vt = np.linalg.svd(X, full_matrices=False)
+	return u[:, s > s[0] * RANK_TOL]
+
+def impute(G):
+	# mean imputation of missing genotypes (nan) for each variant (column), returning the number missing
+	miss = np.isnan(G)
+	nmiss = miss.sum(axis=0)
+	if nmiss.any():
+		G = np.where(miss, np.nanmean(np.where(miss.all(axis=0), 0.0, G), axis=0), G)
+	return G, nmiss
+
+def logistic(y, X, tol = 1e-8, maxiter = 25):
+	# logistic regression of y on X by iteratively reweighted least squares, returning the coefficients
+	b = np.zeros(X.shape[1])
+	eta = np.zeros(X.shape[0])
+	for it in xrange(maxiter):
+		mu = 1.0 / (1.0 + np.exp(-eta))
+		w = np.maximum(mu * (1.0 - mu), 1e-10)
+		sw = np.sqrt(w)
+		b_new = np.linalg.lstsq(sw[:,None] * X, sw * (eta + (y - mu) / w), rcond=-1)[0]
+		eta = X.dot(b_new)
+		if np.max(np.abs(b_new - b)) <= tol * (np.max(np.abs(b)) + tol):
+			return b_new
+		b = b_new
+	return b
+
+class Null(object):
+	# null model (without genotypes) for phenotype y and design X, fit once per model and sample set
+	#   holds the residuals, the working weights and an orthonormal basis of the weighted design, so that
+	#   any block of genotypes can be adjusted for the covariates with a single projection
+	def __init__(self, y, X, family = 'gaussian'):
+		self.y = np.asarray(y, dtype='float64')
+		self.X = X
+		self.family = family
+		self.n = X.shape[0]
+		if family == 'binomial':
+			mu = 1.0 / (1.0 + np.exp(-X.dot(logistic(self.y, X))))
+			self.w = mu * (1.0 - mu)
+		else:
+			mu = X.dot(np.linalg.lstsq(X, self.y, rcond=-1)[0])
+			self.w = np.ones(self.n)
+		self.mu = mu
+		self.res = self.y - mu
+		self.sw = np.sqrt(self.w)
+		self.Q = basis(self.sw[:,None] * X)
+		self.rank = self.Q.shape[1]
+		self.s2 = (self.res ** 2).sum() / (self.n - self.rank) if family != 'binomial' else 1.0
+
+	def adjust(self, G):
+		# weighted genotypes with the covariate effects projected out (BLAS matrix products over the whole block)
+		WG = self.sw[:,None] * G
+		return WG - self.Q.dot(self.Q.T.dot(WG))
+
+def score(null, G):
+	# score test for each variant (column) in genotype block G against a fitted null model
+	#   returns effect (one step estimate U/V), stderr, p and the number of missing genotypes for each variant
+	#   as in seqMeta singlesnpMeta, with missing genotypes mean imputed
+	G, nmiss = impute(G)
+	U = G.T.dot(null.res) / null.s2
+	A = null.adjust(G)
+	V = np.einsum('ij,ij->j', A, A) / null.s2
+	with np.errstate(divide='ignore', invalid='ignore'):
+		effect = U / V
+		stderr = 1.0 / np.sqrt(V)
+		p = scipy.stats.chi2.sf(U ** 2 / V, 1)
+	return effect, stderr, p, nmiss
+
+def errors(*x):
+	# error code 1 for any variant with an infinite or missing value or a zero p-value (last array given)
+	err = np.zeros(len(x[0]))
+	for a in x:
+		err[~np.isfinite(a)] = 1
+	err[x[-1] == 0] = 1
+	return err
+
+def lm(null, G):
+	# linear regression of y on each variant (column) in genotype block G and the covariates of a gaussian null model
+	#   variants without missing genotypes are fit together by projection onto the residual space of the
+	#   covariates, while for variants with missing genotypes the covariate cross products are corrected
+	#   for the dropped samples (as in lm with na.omit), giving exact per variant fits
+	#   returns effect, stderr, t, p and a flag for variants aliased with the covariates
+	m = G.shape[1]
+	gg = np.zeros(m)
+	gy = np.zeros(m)
+	yy = np.repeat((null.res ** 2).sum(), m)
+	df = np.repeat(float(null.n - null.rank - 1), m)
+	miss = np.isnan(G)
+	complete = ~miss.any(axis=0)
+	if complete.any():
+		A = null.adjust(G[:,complete])
+		gg[complete] = np.einsum('ij,ij->j', A, A)
+		gy[complete] = A.T.dot(null.res)
+	if not complete.all():
+		X = null.X
+		y = null.y
+		XtX = X.T.dot(X)
+		Xty = X.T.dot(y)
+		yty = y.dot(y)
+		for j in np.where(~complete)[0]:
+			k = miss[:,j]
+			g = np.where(k, 0.0, G[:,j])
+			XtXj = XtX - X[k].T.dot(X[k])
+			Xtyj = Xty - X[k].T.dot(y[k])
+			Xtg = X.T.dot(g)
+			P = np.linalg.pinv(XtXj, rcond=RANK_TOL)
+			gg[j] = g.dot(g) - Xtg.dot(P).dot(Xtg)
+			gy[j] = g.dot(y) - Xtg.dot(P).dot(Xtyj)
+			yy[j] = yty - y[k].dot(y[k]) - Xtyj.dot(P).dot(Xtyj)
+			df[j] = null.n - k.sum() - np.linalg.matrix_rank(XtXj) - 1
+	aliased = gg <= RANK_TOL * np.maximum(np.nansum(np.where(miss, 0.0, G) ** 2, axis=0), RANK_TOL)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		effect = gy / gg
+		s2 = (yy - effect * gy) / df
+		stderr = np.sqrt(s2 / gg)
+		t = effect / stderr
+		p = 2 * scipy.stats.t.sf(np.abs(t), df)
+	return effect, stderr, t, p, aliased
+
+class Clusters(object):
+	# cluster structure for gee models (ie. samples grouped by family id), built once per model load
+	#   rows are ordered by cluster (stable, as when sorting the model data by cluster id in R), with the start
+	#   of each cluster in that order for cluster sums (np.add.reduceat)
+	def __init__(self, ids):
+		self.order = np.argsort(np.asarray(ids), kind='mergesort')
+		sorted_ids = np.asarray(ids)[self.order]
+		self.starts = np.concatenate(([0], np.where(sorted_ids[1:] != sorted_ids[:-1])[0] + 1))
+		self.n = len(self.starts)
+
+	def sums(self, x):
+		return np.add.reduceat(x, self.starts, axis=0)
+
+def gee(clusters, y, X, G, family = 'gaussian', corstr = 'exchangeable', tol = 1e-8, maxiter = 25):
+	# gee fit of y on each variant (column) in genotype block G and the covariates X (rows in cluster order) with
+	# an independence or exchangeable working correlation, dropping samples with missing genotypes for each variant
+	#   the exchangeable correlation matrix of each cluster is inverted in closed form, so that every step is a
+	#   set of cluster sums over all samples, with moment estimates of scale and correlation
+	#   returns effect, robust (sandwich) stderr, wald statistic, p and an error flag for each variant
+	m = G.shape[1]
+	effect = np.full(m, np.nan)
+	stderr = np.full(m, np.nan)
+	failed = np.zeros(m, dtype=bool)
+	for j in xrange(m):
+		keep = ~np.isnan(G[:,j])
+		w = keep.astype('float64')
+		Z = np.column_stack((np.where(keep, G[:,j], 0.0), X)) * w[:,None]
+		q = Z.shape[1]
+		nc = clusters.sums(w)
+		N = w.sum()
+		npairs = (nc * (nc - 1) / 2.0).sum()
+		try:
+			if family == 'binomial':
+				b = logistic(y[keep], Z[keep])
+			else:
+				b = np.linalg.lstsq(Z[keep], y[keep], rcond=-1)[0]
+			for it in xrange(maxiter):
+				eta = Z.dot(b)
+				if family == 'binomial':
+					mu = 1.0 / (1.0 + np.exp(-eta))
+					sa = np.sqrt(np.maximum(mu * (1.0 - mu), 1e-10)) * w
+				else:
+					mu = eta
+					sa = w
+				r = np.where(keep, (y - mu) / np.where(keep, sa, 1.0), 0.0)
+				phi = (r ** 2).sum() / (N - q)
+				rs = clusters.sums(r)
+				alpha = 0.0
+				if corstr == 'exchangeable' and npairs > q:
+					alpha = ((rs ** 2 - clusters.sums(r ** 2)) / 2.0).sum() / ((npairs - q) * phi)
+					alpha = min(max(alpha, -1.0 / (nc.max() - 1) + 1e-6 if nc.max() > 1 else 0.0), 1.0 - 1e-6)
+				c = alpha / (1.0 + (nc - 1) * alpha)
+				Zt = Z * sa[:,None]
+				S = clusters.sums(Zt)
+				H = (Zt.T.dot(Zt) - (S * c[:,None]).T.dot(S)) / (1.0 - alpha)
+				u = (clusters.sums(Zt * r[:,None]) - S * (c * rs)[:,None]) / (1.0 - alpha)
+				delta = np.linalg.solve(H, u.sum(axis=0))
+				b = b + delta
+				if np.max(np.abs(delta)) <= tol * (np.max(np.abs(b)) + tol):
+					break
+			B = np.linalg.inv(H)
+			cov = B.dot(u.T.dot(u)).dot(B)
+		except (np.linalg.LinAlgError, ValueError):
+			failed[j] = True
+			continue
+		effect[j] = b[0]
+		stderr[j] = np.sqrt(cov[0,0])
+	with np.errstate(divide='ignore', invalid='ignore'):
+		wald = (effect / stderr) ** 2
+		p = scipy.stats.chi2.sf(wald, 1)
+	return effect, stderr, wald, p, failed
@@ -0,0 +1,469 @@
+## Copyright (c) 2015 Ryan Koesterer GNU General Public License v3
+##
+##    This program is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    This program is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import struct
+import os
+import bisect
+import numpy as np
+import Bgzf
+import Process
+
+# tabix (.tbi) indexes use a fixed binning scheme of 16kb leaf bins and 6 levels,
+# csi indexes store min_shift and depth in the index header
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+
+# tabix configuration (format, seq_col, start_col, end_col) for presets, columns 0-based
+PRESETS = {'vcf': (2, 0, 1, 1)}
+
+# text is passed to the writer in batches of about this many bytes when written row by row (see Writer.write_vcf)
+BATCH_BYTES = 4 * 1024 * 1024
+
+def bin_first(level):
+	return ((1 << (3 * level)) - 1) / 7
+
+def pseudo_bin(depth):
+	return bin_first(depth + 1) + 1
+
+def virtual_span(beg, end, ratio):
+	# approximate uncompressed byte span between two virtual offsets
+	return max(((end >> 16) - (beg >> 16)) * ratio + (end & 0xffff) - (beg & 0xffff), 0.0)
+
+def block_ratio(filename, coffset):
+	# ratio of uncompressed to compressed size for the bgzf block at coffset
+	try:
+		with open(filename, 'rb') as f:
+			f.seek(coffset)
+			head = f.read(18)
+			if len(head) < 18 or head[:4] != '\x1f\x8b\x08\x04' or head[12:14] != 'BC':
+				return 1.0
+			bsize = struct.unpack('<H', head[16:18])[0] + 1
+			f.seek(coffset + bsize - 4)
+			isize = struct.unpack('<I', f.read(4))[0]
+	except (IOError, OSError, struct.error):
+		return 1.0
+	return float(isize) / bsize if bsize > 0 and isize > 0 else 1.0
+
+class Index(object):
+	def __init__(self, filename):
+		self.filename = filename
+		self.contigs = []
+		self.bins = {}
+		self.linear = {}
+		self.mapped = {}
+		if os.path.exists(filename + '.csi'):
+			self.index_file = filename + '.csi'
+		elif os.path.exists(filename + '.tbi'):
+			self.index_file = filename + '.tbi'
+		else:
+			raise Process.Error("no tabix index found for file " + os.path.basename(filename))
+		try:
+			with gzip.open(self.index_file, 'rb') as f:
+				data = f.read()
+		except (IOError, OSError):
+			raise Process.Error("unable to read tabix index " + os.path.basename(self.index_file))
+		try:
+			if data[:4] == 'TBI\x01':
+				self.load_tbi(data)
+			elif data[:4] == 'CSI\x01':
+				self.load_csi(data)
+			else:
+				raise Process.Error("unrecognized tabix index format " + os.path.basename(self.index_file))
+		except struct.error:
+			raise Process.Error("truncated tabix index " + os.path.basename(self.index_file))
+		self.ratio = None
+
+	def load_names(self, data, i):
+		l_nm = struct.unpack_from('<i', data, i)[0]
+		i += 4
+		self.contigs = [x for x in data[i:i + l_nm].split('\x00') if x != '']
+		return i + l_nm
+
+	def load_tbi(self, data):
+		self.min_shift = TBI_MIN_SHIFT
+		self.depth = TBI_DEPTH
+		n_ref = struct.unpack_from('<i', data, 4)[0]
+		i = self.load_names(data, 32)
+		pseudo = pseudo_bin(self.depth)
+		for r in xrange(n_ref):
+			chr = self.contigs[r]
+			self.bins[chr] = {}
+			self.mapped[chr] = None
+			n_bin = struct.unpack_from('<i', data, i)[0]
+			i += 4
+			for b in xrange(n_bin):
+				bin, n_chunk = struct.unpack_from('<Ii', data, i)
+				i += 8
+				chunks = struct.unpack_from('<' + str(2 * n_chunk) + 'Q', data, i)
+				i += 16 * n_chunk
+				if bin == pseudo:
+					self.mapped[chr] = chunks[2] if n_chunk > 1 else None
+				else:
+					self.bins[chr][bin] = zip(chunks[0::2], chunks[1::2])
+			n_intv = struct.unpack_from('<i', data, i)[0]
+			i += 4
+			self.linear[chr] = struct.unpack_from('<' + str(n_intv) + 'Q', data, i)
+			i += 8 * n_intv
+
+	def load_csi(self, data):
+		self.min_shift, self.depth, l_aux = struct.unpack_from('<iii', data, 4)
+		i = 16
+		if l_aux >= 28:
+			self.load_names(data, i + 24)
+		i += l_aux
+		n_ref = struct.unpack_from('<i', data, i)[0]
+		i += 4
+		if len(self.contigs) != n_ref:
+			self.contigs = [str(r) for r in xrange(n_ref)]
+		pseudo = pseudo_bin(self.depth)
+		for r in xrange(n_ref):
+			chr = self.contigs[r]
+			self.bins[chr] = {}
+			self.mapped[chr] = None
+			self.linear[chr] = ()
+			n_bin = struct.unpack_from('<i', data, i)[0]
+			i += 4
+			for b in xrange(n_bin):
+				bin, loffset, n_chunk = struct.unpack_from('<IQi', data, i)
+				i += 16
+				chunks = struct.unpack_from('<' + str(2 * n_chunk) + 'Q', data, i)
+				i += 16 * n_chunk
+				if bin == pseudo:
+					self.mapped[chr] = chunks[2] if n_chunk > 1 else None
+				else:
+					self.bins[chr][bin] = zip(chunks[0::2], chunks[1::2])
+
+	def bin_range(self, bin):
+		# 1-based inclusive genomic range covered by a bin
+		level = 0
+		while level < self.depth and bin >= bin_first(level + 1):
+			level += 1
+		size = 1 << (self.min_shift + 3 * (self.depth - level))
+		beg = (bin - bin_first(level)) * size
+		return beg + 1, beg + size, level == self.depth
+
+	def get_ratio(self):
+		if self.ratio is None:
+			first = [c[0] for chr in self.bins for b in self.bins[chr] for c in self.bins[chr][b]]
+			self.ratio = block_ratio(self.filename, min(first) >> 16) if len(first) > 0 else 1.0
+		return self.ratio
+
+	def get_bins(self, chr):
+		# list of (start, end, leaf, weight) for every bin holding records, sorted by start
+		ratio = self.get_ratio()
+		out = []
+		for bin in self.bins[chr]:
+			start, end, leaf = self.bin_range(bin)
+			weight = sum([virtual_span(c[0], c[1], ratio) for c in self.bins[chr][bin]])
+			out.append((start, end, leaf, weight))
+		return sorted(out)
+
+	def windows(self, chr, starts, size, end = None):
+		# classify windows [s, min(s + size - 1, end)] for s in starts
+		#   returns a list of (start, end, found, n) for each window overlapping indexed data
+		#   found: True if a leaf bin lies entirely inside the window (the window certainly holds a record),
+		#          False if only partially overlapping or higher level bins were found (the window may hold a record)
+		#   n: estimated record count for the window from the index mapped record count (None if not available)
+		if not chr in self.bins:
+			return []
+		bins = self.get_bins(chr)
+		if len(bins) == 0:
+			return []
+		total = sum([b[3] for b in bins])
+		# windows past the end of the last bin hold no data, and bins at each level are disjoint and sorted,
+		# so the bins overlapping a window are found by bisecting the bin starts at each level
+		last = max([b[1] for b in bins])
+		levels = {}
+		for b in bins:
+			levels.setdefault(b[1] - b[0] + 1, []).append(b)
+		levels = [(l, [b[0] for b in levels[l]], levels[l]) for l in sorted(levels)]
+		out = []
+		for s in starts:
+			if s > last:
+				continue
+			e = min(s + size - 1, end) if end is not None else s + size - 1
+			found = None
+			weight = 0.0
+			for l, lstarts, lbins in levels:
+				for b in lbins[bisect.bisect_left(lstarts, s - l + 1):bisect.bisect_right(lstarts, e)]:
+					found = found or (b[2] and b[0] >= s and b[1] <= e)
+					weight += b[3] * (min(b[1], e) - max(b[0], s) + 1) / float(b[1] - b[0] + 1)
+			if found is not None:
+				n = int(round(self.mapped[chr] * weight / total)) if self.mapped[chr] is not None and total > 0 else None
+				out.append((s, e, found, n))
+		return out
+
+	def partition(self, chr, snvs, start = 1, end = None):
+		# cut [start, end] into contiguous regions holding about snvs records each at leaf bin resolution
+		#   returns a list of (start, end, n) with n the estimated record count for the region,
+		#   or None if the index holds no mapped record count for chr
+		if not chr in self.bins:
+			return []
+		if self.mapped[chr] is None:
+			return None
+		bins = self.get_bins(chr)
+		total = sum([b[3] for b in bins])
+		if len(bins) == 0 or total == 0:
+			return []
+		if end is None:
+			end = max([b[1] for b in bins])
+		scale = self.mapped[chr] / total
+		out = []
+		s = start
+		n = 0.0
+		for b in bins:
+			if not b[2] or b[1] < start or b[0] > end:
+				continue
+			w = b[3] * scale * (min(b[1], end) - max(b[0], start) + 1) / float(b[1] - b[0] + 1)
+			if n > 0 and n + w > snvs and snvs - n < n + w - snvs:
+				out.append((s, b[0] - 1, int(round(n))))
+				s = b[0]
+				n = 0.0
+			n += w
+			if n >= snvs and b[1] < end:
+				out.append((s, b[1], int(round(n))))
+				s = b[1] + 1
+				n = 0.0
+		if len(out) > 0 and n < snvs / 2.0:
+			out[-1] = (out[-1][0], end, out[-1][2] + int(round(n)))
+		else:
+			out.append((s, end, int(round(n))))
+		return out
+
+def reg2bin(beg, end):
+	# smallest tbi bin holding each 0-based half open interval [beg, end)
+	beg = np.asarray(beg, dtype=np.int64)
+	end = np.asarray(end, dtype=np.int64) - 1
+	out = np.zeros(len(beg), dtype=np.int64)
+	done = np.zeros(len(beg), dtype=bool)
+	for level in xrange(TBI_DEPTH, 0, -1):
+		shift = TBI_MIN_SHIFT + 3 * (TBI_DEPTH - level)
+		sel = ~done & ((beg >> shift) == (end >> shift))
+		out[sel] = bin_first(level) + (beg[sel] >> shift)
+		done |= sel
+	return out
+
+def line_offsets(text):
+	# uncompressed start and end offsets of each line in text, relative to the start of text
+	ends = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == 10).astype(np.int64) + 1
+	starts = np.concatenate([np.zeros(1, dtype=np.int64), ends[:-1]])
+	return starts, ends
+
+class Indexer(object):
+	# builds a tabix (.tbi) index from records added in file order, as an alternative to pysam.tabix_index
+	# for files written by uga, which avoids reading the file back after it has been written
+	#   records are given as chr, 1-based begin and end position and the virtual offsets of the start and
+	#   end of each line, and must be sorted by position within contiguous chromosomes
+	def __init__(self, preset = None, seq_col = 0, start_col = 1, end_col = 1, meta = '#', skip = 0):
+		if preset is not None:
+			self.format, self.seq_col, self.start_col, self.end_col = PRESETS[preset]
+		else:
+			self.format, self.seq_col, self.start_col, self.end_col = 0, seq_col, start_col, end_col
+		self.meta = meta
+		self.skip = skip
+		self.contigs = []
+		self.bins = {}
+		self.linear = {}
+		self.ranges = {}
+		self.last = None
+		self.run = None
+
+	def parse(self, text):
+		# chr, begin and end position and line offsets for each record in text, skipping meta lines
+		starts, ends = line_offsets(text)
+		chrs = []
+		begs = []
+		ends_pos = []
+		keep = []
+		cols = max(self.seq_col, self.start_col, self.end_col, 3 if self.format == 2 else 0) + 1
+		for i in xrange(len(starts)):
+			s = int(starts[i])
+			if i < self.skip or text.startswith(self.meta, s):
+				continue
+			# only the leading columns needed are copied out of text
+			e = s - 1
+			for c in xrange(cols):
+				e = text.find('\t', e + 1, int(ends[i]) - 1)
+				if e < 0:
+					e = int(ends[i]) - 1
+					break
+			fields = text[s:e].split('\t')
+			chrs.append(fields[self.seq_col])
+			begs.append(int(fields[self.start_col]))
+			if self.format == 2:
+				ends_pos.append(int(fields[self.start_col]) + len(fields[3]) - 1)
+			else:
+				ends_pos.append(int(fields[self.end_col]))
+			keep.append(i)
+		self.skip = max(self.skip - len(starts), 0)
+		return np.array(chrs, dtype=object), np.array(begs, dtype=np.int64), np.array(ends_pos, dtype=np.int64), starts[keep], ends[keep]
+
+	def add(self, chrs, begs, ends, vbegs, vends):
+		if len(begs) == 0:
+			return
+		chrs = np.asarray(chrs).astype(str)
+		beg0 = np.asarray(begs, dtype=np.int64) - 1
+		end0 = np.maximum(np.asarray(ends, dtype=np.int64), beg0 + 1)
+		vbegs = np.asarray(vbegs, dtype=np.int64)
+		vends = np.asarray(vends, dtype=np.int64)
+		bins = reg2bin(beg0, end0)
+		cuts = np.flatnonzero(chrs[1:] != chrs[:-1]) + 1
+		for s, e in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [len(begs)]])):
+			chr = chrs[s]
+			if self.last is not None and chr == self.last[0]:
+				if beg0[s] < self.last[1]:
+					raise Process.Error("records out of order, unable to index " + chr + ":" + str(beg0[s] + 1))
+			elif chr in self.ranges:
+				raise Process.Error("records out of order, chromosome " + chr + " is not contiguous")
+			if np.any(np.diff(beg0[s:e]) < 0):
+				raise Process.Error("records out of order, unable to index chromosome " + chr)
+			if not chr in self.ranges:
+				self.contigs.append(chr)
+				self.bins[chr] = {}
+				self.linear[chr] = {}
+				self.ranges[chr] = [int(vbegs[s]), int(vends[e-1]), 0]
+			self.ranges[chr][1] = int(vends[e-1])
+			self.ranges[chr][2] += int(e - s)
+			self.last = (chr, beg0[e-1])
+			# records are split into runs sharing a bin, each giving a single chunk
+			b = bins[s:e]
+			runs = np.flatnonzero(b[1:] != b[:-1]) + 1
+			rstarts = [0] + runs.tolist()
+			rends = runs.tolist() + [int(e - s)]
+			for rs, rend, rb in zip(rstarts, rends, b[rstarts].tolist()):
+				if self.run is not None and self.run[0] == chr and self.run[1] == rb:
+					self.run[3] = int(vends[s + rend - 1])
+				else:
+					self.close_run()
+					self.run = [chr, rb, int(vbegs[s + rs]), int(vends[s + rend - 1])]
+			# linear index holds the smallest offset of any record overlapping each 16kb window
+			w0 = beg0[s:e] >> TBI_MIN_SHIFT
+			w1 = (end0[s:e] - 1) >> TBI_MIN_SHIFT
+			linear = self.linear[chr]
+			w, first = np.unique(w0, return_index=True)
+			for x, v in zip(w.tolist(), vbegs[s + first].tolist()):
+				if not x in linear:
+					linear[x] = v
+			for j in np.flatnonzero(w1 > w0).tolist():
+				v = int(vbegs[s + j])
+				for x in xrange(int(w0[j]) + 1, int(w1[j]) + 1):
+					if not x in linear or linear[x] > v:
+						linear[x] = v
+
+	def close_run(self):
+		if self.run is None:
+			return
+		chr, b, vbeg, vend = self.run
+		chunks = self.bins[chr].setdefault(b, [])
+		# chunks starting in the block where the previous chunk ends are merged, as in htslib
+		if len(chunks) > 0 and chunks[-1][1] >> 16 >= vbeg >> 16:
+			chunks[-1][1] = max(chunks[-1][1], vend)
+		else:
+			chunks.append([vbeg, vend])
+		self.run = None
+
+	def save(self, filename, level = 6):
+		self.close_run()
+		names = ''.join([chr + '\x00' for chr in self.contigs])
+		out = ['TBI\x01', struct.pack('<8i', len(self.contigs), self.format, self.seq_col + 1, self.start_col + 1, self.end_col + 1 if self.format != 2 else 0, ord(self.meta), self.skip, len(names)), names]
+		pseudo = pseudo_bin(TBI_DEPTH)
+		for chr in self.contigs:
+			bins = self.bins[chr]
+			out.append(struct.pack('<i', len(bins) + 1))
+			for b in sorted(bins):
+				out.append(struct.pack('<Ii', b, len(bins[b])))
+				out.append(struct.pack('<' + str(2 * len(bins[b])) + 'Q', *[x for c in bins[b] for x in c]))
+			out.append(struct.pack('<Ii4Q', pseudo, 2, self.ranges[chr][0], self.ranges[chr][1], self.ranges[chr][2], 0))
+			linear = self.linear[chr]
+			n = max(linear.keys()) + 1 if len(linear) > 0 else 0
+			intv = []
+			last = self.ranges[chr][0]
+			for x in xrange(n):
+				last = linear.get(x, last)
+				intv.append(last)
+			out.append(struct.pack('<i', n))
+			out.append(struct.pack('<' + str(n) + 'Q', *intv))
+		out.append(struct.pack('<Q', 0))
+		w = Bgzf.BgzfWriter(filename, 'wb', level=level)
+		w.write(''.join(out))
+		w.close()
+
+class Writer(object):
+	# bgzip writer building a tabix index for the text written, see Indexer
+	#   records are indexed as soon as the blocks holding them have been written, and indexing
+	#   stops quietly if records are found out of order, in which case close returns False
+	def __init__(self, filename, threads = 1, level = 6, preset = None, seq_col = 0, start_col = 1, end_col = 1):
+		self.filename = filename
+		self.bgzfile = Bgzf.BgzfWriter(filename, 'wb', threads=threads, level=level)
+		self.indexer = Indexer(preset=preset, seq_col=seq_col, start_col=start_col, end_col=end_col)
+		self.level = level
+		self.pending = []
+
+	def write(self, text, records = None):
+		# records: chr, begin and end position for every line of text if known, otherwise text is parsed
+		if len(text) == 0:
+			return
+		u = self.bgzfile.offset()
+		if self.indexer is not None:
+			if records is not None:
+				starts, ends = line_offsets(text)
+				self.pending.append((np.asarray(records[0]), np.asarray(records[1]), np.asarray(records[2]), starts + u, ends + u))
+			else:
+				chrs, begs, ends_pos, starts, ends = self.indexer.parse(text)
+				if len(begs) > 0:
+					self.pending.append((chrs, begs, ends_pos, starts + u, ends + u))
+		self.bgzfile.write(text)
+		self.sync()
+
+	def write_vcf(self, rows):
+		# writes pysam asVCF rows in batches of about BATCH_BYTES, indexed from the row fields (pos is 0-based)
+		lines = []
+		chrs = []
+		begs = []
+		ends = []
+		size = 0
+		for row in rows:
+			line = str(row) + '\n'
+			lines.append(line)
+			chrs.append(row.contig)
+			begs.append(row.pos + 1)
+			ends.append(row.pos + len(row.ref))
+			size += len(line)
+			if size >= BATCH_BYTES:
+				self.write(''.join(lines), (chrs, begs, ends))
+				lines, chrs, begs, ends, size = [], [], [], [], 0
+		if len(lines) > 0:
+			self.write(''.join(lines), (chrs, begs, ends))
+
+	def sync(self):
+		while self.indexer is not None and len(self.pending) > 0 and self.pending[0][4][-1] <= self.bgzfile.written():
+			chrs, begs, ends, ustarts, uends = self.pending.pop(0)
+			try:
+				self.indexer.add(chrs, begs, ends, self.bgzfile.virtual_offsets(ustarts), self.bgzfile.virtual_offsets(uends))
+			except Process.Error:
+				self.indexer = None
+				self.pending = []
+
+	def close(self):
+		self.bgzfile.flush()
+		self.sync()
+		self.bgzfile.close()
+		if os.path.exists(self.filename + '.tbi'):
+			os.remove(self.filename + '.tbi')
+		if self.indexer is None:
+			return False
+		self.indexer.save(self.filename + '.tbi', self.level)
+		return True
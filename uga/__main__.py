@@ -29,8 +29,9 @@ import shutil
 import Parse
 import Process
 import Map
+import Schedule
 import Fxns
-import pickle
+import Db
 from Bio import bgzf
 
 def main(args=None):
@@ -39,13 +40,15 @@ def main(args=None):
 	resubmit = False
 	if args.which in ['snv','snvgroup','meta','merge','resubmit','tools']:
 		if args.which == 'resubmit':
-			with open(args.dir + '/' + os.path.basename(args.dir) + '.args.pkl', 'rb') as p:
-				qsub = args.qsub if args.qsub else None
-				args,cfg = pickle.load(p)
-				if qsub:
-					cfg['qsub'] = qsub
-			with open(cfg['out'] + '/' + os.path.basename(cfg['out']) + '.rerun', 'r') as f:
-				rerun = [int(line.rstrip()) for line in f]
+			qsub = args.qsub if args.qsub else None
+			args,cfg = Db.get_args(args.dir + '/' + os.path.basename(args.dir) + '.db')
+			if qsub:
+				cfg['qsub'] = qsub
+			jobs_status = Db.jobs(cfg['out'] + '/' + os.path.basename(cfg['out']) + '.db')
+			rerun = [int(x) for x in jobs_status['job'][jobs_status['status'] == 'failed']]
+			if len(rerun) == 0:
+				print Process.print_error('no failed jobs found in job database, run compile module to verify results before resubmitting')
+				return
 			cfg['replace'] = True
 			resubmit = True
 		else:
@@ -74,7 +77,7 @@ def main(args=None):
 			run_type = run_type + 100
 			
 		if resubmit:
-			jobs_df = pd.read_table(cfg['out'] + '/' + cfg['out'] + '.jobs')
+			jobs_df = Db.regions(cfg['out'] + '/' + cfg['out'] + '.db')
 		else:
 			if args.which in ['snv','tools']:
 				#	generate regions dataframe with M rows, either from --snv-map or by splitting data file or --snv-region according to --mb
@@ -91,6 +94,7 @@ def main(args=None):
 					jobs_df['chr_idx'] = [int(x.split(':')[0].replace('X','23').replace('Y','24')) for x in jobs_df['region']]
 					jobs_df['start'] = [int(x.split(':')[1].split('-')[0]) for x in jobs_df['region']]
 					jobs_df['end'] = [int(x.split(':')[1].split('-')[1]) for x in jobs_df['region']]
+					jobs_df['n'] = np.nan
 					jobs_df['job'] = 1
 					jobs_df['cpu'] = 1
 				else:
@@ -99,18 +103,19 @@ def main(args=None):
 					if args.which == 'snv':
 						for m in cfg['models']:
 							if cfg['models'][m]['file'] not in data_files:
-								snv_map.extend(Map.map(file=cfg['models'][m]['file'], mb = cfg['mb'], region = cfg['region']))
+								snv_map.append(Map.map(file=cfg['models'][m]['file'], mb = cfg['mb'], region = cfg['region'], snvs = cfg['snvs'], cpus = cfg['cpus']))
 								data_files.append(cfg['models'][m]['file'])
 					else:
-						snv_map.extend(Map.map(file=cfg['file'], mb = cfg['mb'], region = cfg['region']))
-					snv_map = list(set(snv_map))
-					jobs_df = pd.DataFrame({'region': snv_map, 'chr': [x.split(':')[0] for x in snv_map], 'chr_idx': [int(x.split(':')[0].replace('X','23').replace('Y','24')) for x in snv_map], 'start': [int(x.split(':')[1].split('-')[0]) for x in snv_map], 'end': [int(x.split(':')[1].split('-')[1]) for x in snv_map]})
+						snv_map.append(Map.map(file=cfg['file'], mb = cfg['mb'], region = cfg['region'], snvs = cfg['snvs'], cpus = cfg['cpus']))
+					snv_map = Map.merge(snv_map) if cfg['snvs'] else [x for y in snv_map for x in y]
+					snv_map = pd.DataFrame(snv_map, columns=['region','n']).groupby('region')['n'].max()
+					jobs_df = pd.DataFrame({'region': snv_map.index.values, 'n': snv_map.values, 'chr': [x.split(':')[0] for x in snv_map.index], 'chr_idx': [int(x.split(':')[0].replace('X','23').replace('Y','24')) for x in snv_map.index], 'start': [int(x.split(':')[1].split('-')[0]) for x in snv_map.index], 'end': [int(x.split(':')[1].split('-')[1]) for x in snv_map.index]})
 					jobs_df['job'] = 1
 					jobs_df['cpu'] = 1
 					del data_files
 					del snv_map
 				jobs_df.sort_values(by=['chr_idx','start'],inplace=True)
-				jobs_df = jobs_df[['chr','start','end','region','job','cpu']]
+				jobs_df = jobs_df[['chr','start','end','region','n','job','cpu']]
 				jobs_df.reset_index(drop=True,inplace=True)
 
 			if args.which in ['meta','merge']:
@@ -126,6 +131,7 @@ def main(args=None):
 					jobs_df['chr'] = [int(x.split(':')[0]) for x in jobs_df['region']]
 					jobs_df['start'] = [int(x.split(':')[1].split('-')[0]) for x in jobs_df['region']]
 					jobs_df['end'] = [int(x.split(':')[1].split('-')[1]) for x in jobs_df['region']]
+					jobs_df['n'] = np.nan
 					jobs_df['job'] = 1
 					jobs_df['cpu'] = 1
 				else:
@@ -133,15 +139,16 @@ def main(args=None):
 					data_files = []
 					for f in cfg['files']:
 						if f not in data_files:
-							snv_map.extend(Map.map(file=cfg['files'][f], mb = cfg['mb'], region = cfg['region']))
+							snv_map.append(Map.map(file=cfg['files'][f], mb = cfg['mb'], region = cfg['region'], snvs = cfg['snvs'], cpus = cfg['cpus']))
 							data_files.append(cfg['files'][f])
-					snv_map = list(set(snv_map))
-					jobs_df = pd.DataFrame({'region': snv_map, 'chr': [int(x.split(':')[0]) for x in snv_map], 'start': [int(x.split(':')[1].split('-')[0]) for x in snv_map], 'end': [int(x.split(':')[1].split('-')[1]) for x in snv_map]})
+					snv_map = Map.merge(snv_map) if cfg['snvs'] else [x for y in snv_map for x in y]
+					snv_map = pd.DataFrame(snv_map, columns=['region','n']).groupby('region')['n'].max()
+					jobs_df = pd.DataFrame({'region': snv_map.index.values, 'n': snv_map.values, 'chr': [int(x.split(':')[0]) for x in snv_map.index], 'start': [int(x.split(':')[1].split('-')[0]) for x in snv_map.index], 'end': [int(x.split(':')[1].split('-')[1]) for x in snv_map.index]})
 					jobs_df['job'] = 1
 					jobs_df['cpu'] = 1
 					del data_files
 					del snv_map
-				jobs_df = jobs_df[['chr','start','end','region','job','cpu']]
+				jobs_df = jobs_df[['chr','start','end','region','n','job','cpu']]
 				jobs_df.sort_values(by=['chr','start'],inplace=True)
 				jobs_df.reset_index(drop=True,inplace=True)
 
@@ -159,9 +166,10 @@ def main(args=None):
 					jobs_df['chr_idx'] = 1
 					jobs_df['start'] = [int(x.split(':')[1].split('-')[0]) for x in jobs_df['region']]
 					jobs_df['end'] = [int(x.split(':')[1].split('-')[1]) for x in jobs_df['region']]
+					jobs_df['n'] = np.nan
 					jobs_df['job'] = 1
 					jobs_df['cpu'] = 1
-					jobs_df = jobs_df[['chr','start','end','region','group_id','job','cpu']]
+					jobs_df = jobs_df[['chr','start','end','region','group_id','n','job','cpu']]
 					jobs_df.sort_values(by=['chr','start'],inplace=True)
 					jobs_df.reset_index(drop=True,inplace=True)
 				elif cfg['region']:
@@ -171,63 +179,57 @@ def main(args=None):
 						if cfg['models'][m]['file'] not in data_files:
 							snv_map.extend(Map.map(file=cfg['models'][m]['file'], mb = 1000, region = cfg['region']))
 							data_files.append(cfg['models'][m]['file'])
-					snv_map = list(set(snv_map))
-					jobs_df = pd.DataFrame({'region': snv_map, 'chr': [int(x.split(':')[0]) for x in snv_map], 'start': [int(x.split(':')[1].split('-')[0]) for x in snv_map], 'end': [int(x.split(':')[1].split('-')[1]) for x in snv_map]})
+					snv_map = pd.DataFrame(snv_map, columns=['region','n']).groupby('region')['n'].max()
+					jobs_df = pd.DataFrame({'region': snv_map.index.values, 'n': snv_map.values, 'chr': [int(x.split(':')[0]) for x in snv_map.index], 'start': [int(x.split(':')[1].split('-')[0]) for x in snv_map.index], 'end': [int(x.split(':')[1].split('-')[1]) for x in snv_map.index]})
 					jobs_df['group_id'] = cfg['region']
 					jobs_df['job'] = 1
 					jobs_df['cpu'] = 1
 					del data_files
 					del snv_map
-					jobs_df = jobs_df[['chr','start','end','region','group_id','job','cpu']]
+					jobs_df = jobs_df[['chr','start','end','region','group_id','n','job','cpu']]
 					jobs_df.sort_values(by=['chr','start'],inplace=True)
 					jobs_df.reset_index(drop=True,inplace=True)
 				else:
 					if cfg['snvgroup_map']:
-						snvgroup_map = pd.read_table(cfg['snvgroup_map'],header=None,names=['chr','pos','marker','group_id'], compression='gzip' if cfg['snvgroup_map'].split('.')[-1] == 'gz' else None)
-						jobs_df = snvgroup_map[['chr','pos','group_id']]
-						jobs_df=jobs_df.groupby(['chr','group_id'])
-						jobs_df = jobs_df.agg({'pos': [np.min,np.max]})
-						jobs_df.columns = ['start','end']
-						jobs_df['chr'] = jobs_df.index.get_level_values('chr')
-						jobs_df['group_id'] = jobs_df.index.get_level_values('group_id')
+						jobs_df = Map.snvgroup_intervals(cfg['snvgroup_map'])
 						jobs_df['region'] = jobs_df.chr.map(str) + ':' + jobs_df.start.map(str) + '-' + jobs_df.end.map(str)
 						jobs_df['job'] = 1
 						jobs_df['cpu'] = 1
-						jobs_df = jobs_df[['chr','start','end','region','group_id','job','cpu']]
+						jobs_df = jobs_df[['chr','start','end','region','group_id','n','job','cpu']]
 						jobs_df.drop_duplicates(inplace=True)
 						jobs_df.sort_values(by=['chr','start'],inplace=True)
 						jobs_df.reset_index(drop=True,inplace=True)
 
+			#	regions are packed into contiguous blocks of jobs and cpus balanced by estimated cost (see Schedule.cost)
+			if run_type in [1,11,100,101]:
+				jobs_df['cost'] = Schedule.cost(jobs_df, cfg)
+			#	overlapping snvgroups are kept together on the same job and cpu so that their genotypes are read only once
+			#	(see Geno.Variants.load_snvgroup), with clusters limited to the average cost per cpu
+			clusters = None
+			if args.which == 'snvgroup' and run_type in [1,100,101]:
+				blocks = cfg['cpus'] if run_type == 1 else cfg['split_n'] if run_type == 100 else cfg['split_n'] * cfg['cpus']
+				clusters = Schedule.clusters(jobs_df, jobs_df['cost'], jobs_df['cost'].sum() / blocks)
 			if run_type == 1:
-				n = int(np.ceil(jobs_df.shape[0] / float(cfg['cpus'])))
-				n_remain = int(jobs_df.shape[0] - (n-1) * cfg['cpus'])
-				jobs_df['cpu'] = np.append(np.repeat(range(cfg['cpus'])[:n_remain],n),np.repeat(range(cfg['cpus'])[n_remain:],n-1)).astype(np.int64) + 1
+				jobs_df['cpu'] = Schedule.pack(jobs_df['cost'], cfg['cpus'], clusters) + 1
 			elif run_type == 10:
 				jobs_df['job'] = jobs_df.index.values + 1
 			elif run_type == 100:
-				n = int(np.ceil(jobs_df.shape[0] / float(cfg['split_n'])))
-				n_remain = int(jobs_df.shape[0] - (n-1) * cfg['split_n'])
-				jobs_df['job'] = np.append(np.repeat(range(cfg['split_n'])[:n_remain],n),np.repeat(range(cfg['split_n'])[n_remain:],n-1)).astype(np.int64) + 1
+				jobs_df['job'] = Schedule.pack(jobs_df['cost'], cfg['split_n'], clusters) + 1
 			elif run_type == 11 and args.which != 'snvgroup':
 				cfg['split_n'] = int(np.ceil(jobs_df.shape[0] / float(cfg['cpus'])))
-				n = int(np.ceil(jobs_df.shape[0] / float(cfg['split_n'])))
-				n_remain = int(jobs_df.shape[0] - (n-1) * cfg['split_n'])
-				jobs_df['job'] = np.append(np.repeat(range(cfg['split_n'])[:n_remain],n),np.repeat(range(cfg['split_n'])[n_remain:],n-1)).astype(np.int64) + 1
+				jobs_df['job'] = Schedule.pack(jobs_df['cost'], cfg['split_n']) + 1
 				for i in range(1,int(max(jobs_df['job'])) + 1):
-					n = int(np.ceil(jobs_df[jobs_df['job'] == i].shape[0] / float(cfg['cpus'])))
-					n_remain = int(jobs_df[jobs_df['job'] == i].shape[0] - (n-1) * cfg['cpus'])
-					jobs_df.loc[jobs_df['job'] == i,'cpu'] = np.append(np.repeat(range(cfg['cpus'])[:n_remain],n),np.repeat(range(cfg['cpus'])[n_remain:],n-1)).astype(np.int64) + 1
+					jobs_df.loc[jobs_df['job'] == i,'cpu'] = Schedule.pack(jobs_df['cost'][jobs_df['job'] == i], cfg['cpus']) + 1
 				cfg['split'] = None
 			elif run_type == 101:
-				n = int(np.ceil(jobs_df.shape[0] / float(cfg['split_n'])))
-				n_remain = int(jobs_df.shape[0] - (n-1) * cfg['split_n'])
-				jobs_df['job'] = np.append(np.repeat(range(cfg['split_n'])[:n_remain],n),np.repeat(range(cfg['split_n'])[n_remain:],n-1)).astype(np.int64) + 1
+				jobs_df['job'] = Schedule.pack(jobs_df['cost'], cfg['split_n'], clusters) + 1
 				for i in range(1,int(max(jobs_df['job'])) + 1):
-					n = int(np.ceil(jobs_df[jobs_df['job'] == i].shape[0] / float(cfg['cpus'])))
-					n_remain = int(jobs_df[jobs_df['job'] == i].shape[0] - (n-1) * cfg['cpus'])
-					jobs_df.loc[jobs_df['job'] == i,'cpu'] = np.append(np.repeat(range(cfg['cpus'])[:n_remain],n),np.repeat(range(cfg['cpus'])[n_remain:],n-1)).astype(np.int64) + 1
-			if int(max(jobs_df['job'])) + 1 > 100000:
-				print Process.print_error('number of jobs exceeds 100,000, consider using --split-n to reduce the total number of jobs')
+					jobs_df.loc[jobs_df['job'] == i,'cpu'] = Schedule.pack(jobs_df['cost'][jobs_df['job'] == i], cfg['cpus'], clusters[(jobs_df['job'] == i).values] if clusters is not None else None) + 1
+			#	--pack P runs P consecutive jobs one after another in each array task
+			if cfg['pack'] and run_type in [10,11,100,101]:
+				jobs_df['task'] = (jobs_df['job'] - 1) // cfg['pack'] + 1
+			if int(max(jobs_df['task' if 'task' in jobs_df.columns else 'job'])) + 1 > 100000:
+				print Process.print_error('number of array tasks exceeds 100,000, consider using --split-n or --pack to reduce the total number of tasks')
 				return
 			
 
@@ -235,12 +237,18 @@ def main(args=None):
 		print 'detected run type ' + str(run_type) + ' ...'
 		if len(rerun) == 0:
 			if int(max(jobs_df['job'])) > 1 and cfg['qsub'] is not None:
-				if 'mb' in cfg:
+				if 'snvs' in cfg and cfg['snvs'] and not cfg['region_file']:
+					print '   ' + str(jobs_df.shape[0]) + ' regions of ~' + str(cfg['snvs']) + ' variants detected'
+				elif 'mb' in cfg:
 					print '   ' + str(jobs_df.shape[0]) + ' regions of size ' + str(cfg['mb']) + 'mb detected'
 				else:
 					print '   ' + str(jobs_df.shape[0]) + ' regions detected'
-				print '   an array containing ' + str(int(max(jobs_df['job']))) + ' tasks will be submitted'
-				print '   <= ' + str(max(np.bincount(jobs_df['job']))) + ' regions per task'
+				if 'task' in jobs_df.columns:
+					print '   an array containing ' + str(int(max(jobs_df['task']))) + ' tasks of <= ' + str(cfg['pack']) + ' jobs each will be submitted'
+					print '   <= ' + str(max(np.bincount(jobs_df['job']))) + ' regions per job'
+				else:
+					print '   an array containing ' + str(int(max(jobs_df['job']))) + ' tasks will be submitted'
+					print '   <= ' + str(max(np.bincount(jobs_df['job']))) + ' regions per task'
 				print '   <= '  + str(int(max(jobs_df['cpu']))) + ' cpus per task'
 				print '   qsub options: ' + cfg['qsub']
 				print '   output directory: ' + cfg['out']
@@ -267,46 +275,44 @@ def main(args=None):
 			except OSError:
 				pass
 
-			with open(cfg['out'] + '/' + os.path.basename(cfg['out']) + '.args.pkl', 'wb') as p:
-				pickle.dump([args, cfg], p)
-
+			files = []
 			if run_type in [10,11,100,101] and jobs_df.shape[0] > 1:
-				print "initializing job array database ..."
+				print "initializing job array directories ..."
 				try:
 					os.mkdir(cfg['out'] + '/temp')
 				except OSError:
 					pass
+				jdirs = Fxns.job_dirs(cfg['out'], jobs_df)
 				for j in range(1, int(max(jobs_df['job'])) + 1):
 					try:
-						os.mkdir(cfg['out'] + '/jobs' + str(100 * ((j-1) / 100) + 1) + '-' + str(100 * ((j-1) / 100) + 100))
+						os.mkdir(os.path.dirname(jdirs[j]))
 					except OSError:
 						pass
 					try:
-						os.mkdir(cfg['out'] + '/jobs' + str(100 * ((j-1) / 100) + 1) + '-' + str(100 * ((j-1) / 100) + 100) + '/job' + str(j))
+						os.mkdir(jdirs[j])
 					except OSError:
 						pass
-				with open(cfg['out'] + '/' + cfg['out'] + '.files', 'w') as jlist:
-					for j in range(1, int(max(jobs_df['job'])) + 1):
-						if args.which in ['snv','snvgroup','tools','merge']:
-							if 'model_order' in cfg:
-								for m in cfg['model_order']:
-									if m != '___no_tag___':
-										jlist.write(str(j) + '\t' + cfg['out'] + '.' + m + '.gz' + '\t' + cfg['out'] + '/jobs' + str(100 * ((j-1) / 100) + 1) + '-' + str(100 * ((j-1) / 100) + 100) + '/job' + str(j) + '/' + cfg['out'] + '.job' + str(j) + '.' + m + '.gz\n')
-									else:
-										jlist.write(str(j) + '\t' + cfg['out'] + '.gz' + '\t' + cfg['out'] + '/jobs' + str(100 * ((j-1) / 100) + 1) + '-' + str(100 * ((j-1) / 100) + 100) + '/job' + str(j) + '/' + cfg['out'] + '.job' + str(j) + '.gz\n')
-							else:								
-								jlist.write(str(j) + '\t' + cfg['out'] + '.gz' + '\t' + cfg['out'] + '/jobs' + str(100 * ((j-1) / 100) + 1) + '-' + str(100 * ((j-1) / 100) + 100) + '/job' + str(j) + '/' + cfg['out'] + '.job' + str(j) + '.gz\n')
-						if 'meta_order' in cfg:
-							if len(cfg['meta_order']) > 0:
-								for m in cfg['meta_order']:
-									jlist.write(str(j) + '\t' + cfg['out'] + '.' + m + '.gz' + '\t' + cfg['out'] + '/jobs' + str(100 * ((j-1) / 100) + 1) + '-' + str(100 * ((j-1) / 100) + 100) + '/job' + str(j) + '/' + cfg['out'] + '.job' + str(j) + '.' + m + '.gz\n')
-			jobs_df.to_csv(cfg['out'] + '/' + cfg['out'] + '.jobs',header=True,index=False,sep="\t")
-			with open(cfg['out'] + '/' + cfg['out'] + '.jobs.run','w') as f:
-				f.write("\n".join([str(x) for x in jobs_df['job'].unique()]))
+				for j in range(1, int(max(jobs_df['job'])) + 1):
+					if args.which in ['snv','snvgroup','tools','merge']:
+						if 'model_order' in cfg:
+							for m in cfg['model_order']:
+								if m != '___no_tag___':
+									files.append((j, cfg['out'] + '.' + m + '.gz', jdirs[j] + '/' + cfg['out'] + '.job' + str(j) + '.' + m + '.gz'))
+								else:
+									files.append((j, cfg['out'] + '.gz', jdirs[j] + '/' + cfg['out'] + '.job' + str(j) + '.gz'))
+						else:								
+							files.append((j, cfg['out'] + '.gz', jdirs[j] + '/' + cfg['out'] + '.job' + str(j) + '.gz'))
+					if 'meta_order' in cfg:
+						if len(cfg['meta_order']) > 0:
+							for m in cfg['meta_order']:
+								files.append((j, cfg['out'] + '.' + m + '.gz', jdirs[j] + '/' + cfg['out'] + '.job' + str(j) + '.' + m + '.gz'))
+			print "initializing job database ..."
+			Db.create(cfg['out'] + '/' + cfg['out'] + '.db', args, cfg, jobs_df, files)
+			Db.set_run(cfg['out'] + '/' + cfg['out'] + '.db', Fxns.job_list(jobs_df))
 		else:
 			if len(rerun) > 0 and cfg['qsub'] is not None:
 				print 'detected resubmit ...'
-				print '   an array containing ' + str(len(rerun)) + ' tasks will be submitted'
+				print '   an array containing ' + str(len(Fxns.job_list(jobs_df, rerun))) + ' tasks will be submitted'
 				print '   <= ' + str(max(np.bincount(jobs_df['job']))) + ' regions per job'
 				print '   <= '  + str(int(max(jobs_df['cpu']))) + ' cpus per job'
 				print '   qsub options: ' + cfg['qsub']
@@ -318,9 +324,8 @@ def main(args=None):
 				if input_var.lower() == 'n':
 					print 'canceled by user'
 					return
-			with open(cfg['out'] + '/' + cfg['out'] + '.jobs.run','w') as f:
-				f.write("\n".join([str(x) for x in jobs_df['job'][jobs_df['job'].isin(rerun)]]))
-			os.remove(cfg['out'] + '/' + os.path.basename(cfg['out']) + '.rerun')
+			Db.set_run(cfg['out'] + '/' + cfg['out'] + '.db', Fxns.job_list(jobs_df, rerun))
+			Db.set_status(cfg['out'] + '/' + cfg['out'] + '.db', rerun, 'pending')
 
 	if args.which == 'settings':
 		if 'ordered_args' in args:
@@ -337,9 +342,12 @@ def main(args=None):
 		if cfg['qsub']:
 			print "submitting jobs\n"
 		out = cfg['out']
-		joblist = range(1, int(max(jobs_df['job'])) + 1) if len(rerun) == 0 else rerun
+		joblist = Fxns.job_list(jobs_df, rerun if len(rerun) > 0 else None)
 		if int(max(jobs_df['job'])) > 1:
-			cfg['out'] = out + '/jobsUGA_JOB_RANGE/jobUGA_JOB_ID/' + os.path.basename(out) + '.jobUGA_JOB_ID'
+			if 'task' in jobs_df.columns:
+				cfg['out'] = out + '/tasksUGA_TASK_RANGE/taskUGA_TASK_ID/' + os.path.basename(out) + '.jobUGA_JOB_ID'
+			else:
+				cfg['out'] = out + '/jobsUGA_JOB_RANGE/jobUGA_JOB_ID/' + os.path.basename(out) + '.jobUGA_JOB_ID'
 			cfg['job'] = 'UGA_JOB_ID'
 			if cfg['qsub']:
 				cfg['qsub'] = cfg['qsub'] + ' -t 1-' + str(len(joblist))
@@ -348,22 +356,22 @@ def main(args=None):
 			cfg['job'] = 1
 			if cfg['qsub']:
 				cfg['qsub'] = cfg['qsub'] + ' -t 1'
-		args.ordered_args = [('out',cfg['out']),('region_file',out + '/' + out + '.jobs'),('job',cfg['job']),('cpus',int(max(jobs_df['cpu'])))] + [x for x in args.ordered_args if x[0] not in ['out','region_file','cpus']]
+		args.ordered_args = [('out',cfg['out']),('region_file',out + '/' + out + '.db'),('job',cfg['job']),('cpus',int(max(jobs_df['cpu'])))] + [x for x in args.ordered_args if x[0] not in ['out','region_file','cpus']]
 		cmd = 'Run' + args.which.capitalize() + '(' + str(args.ordered_args) + ')'
 		if cfg['qsub']:
-			Process.qsub(['qsub'] + cfg['qsub'].split() + ['-N',out,'-o',out + '/temp',qsub_wrapper],'\"' + cmd + '\"',out + '/' + out + '.jobs.run',cfg['out'] + '.log')
+			Process.qsub(['qsub'] + cfg['qsub'].split() + ['-N',out,'-o',out + '/temp',qsub_wrapper],'\"' + cmd + '\"',out + '/' + out + '.db',cfg['out'] + '.log')
 		else:
-			Process.interactive(qsub_wrapper, cmd, cfg['out'] + '.' + args.which + '.log')
+			Process.interactive(qsub_wrapper, cmd, cfg['out'] + '.' + args.which + '.log', out + '/' + out + '.db')
 
 	elif args.which == 'compile':
-		files = pd.read_table(args.dir + '/' + os.path.basename(args.dir) + '.files', names=['job','out','file'])
-		complete, rerun = Fxns.verify_results(args.dir,files)
+		db = args.dir + '/' + os.path.basename(args.dir) + '.db'
+		files = Db.files(db)
+		complete, rerun = Fxns.verify_results(args.dir, db)
 		if len(rerun) > 0:
 			print Process.print_error('detected ' + str(len(rerun)) + ' failed jobs\n       use resubmit module to rerun failed jobs')
-			with open(args.dir + '/' + os.path.basename(args.dir) + '.rerun', 'w') as f:
-				f.write("\n".join([str(x) for x in rerun]))
+			Db.set_status(db, rerun, 'failed')
 		else:
-			complete = Fxns.compile_results(args.dir,files)
+			complete = Fxns.compile_results(args.dir,files,Db.jobs(db),cfg['bgzip_threads'],cfg['bgzip_level'])
 			if complete:
 				input_var = None
 				while input_var not in ['y','n','Y','N']:
@@ -372,7 +380,7 @@ def main(args=None):
 					print 'canceled by user'
 				else:
 					print 'deleting subdirectories'
-					for d in glob.glob(args.dir + '/jobs*-*'):
+					for d in glob.glob(args.dir + '/jobs*-*') + glob.glob(args.dir + '/tasks*-*'):
 						try:
 							shutil.rmtree(d)
 						except OSError:
@@ -382,11 +390,8 @@ def main(args=None):
 						shutil.rmtree(args.dir + '/temp')
 					except OSError:
 						print Process.print_error('unable to delete temporary directory ' + args.dir + '/temp')
-					print "deleting last job run list"
-					try:
-						os.remove(args.dir + '/' + os.path.basename(args.dir) + '.jobs.run')
-					except OSError:
-						print Process.print_error('unable to delete job run list ' + args.dir + '/' + os.path.basename(args.dir) + '.jobs.run')
+					print "clearing last job run list"
+					Db.set_run(db, [])
 			else:
 				print Process.print_error('file compilation incomplete')
 